@@ -13,6 +13,8 @@ man_descriptions = {
     "tem-env": "Run or modify local environments",
     "tem-git": "Manage environments versioned under git",
     "tem-hook": "Various manipulations with tem hooks",
+    "tem-watch": "Keep caches valid by watching for changes",
+    "tem-cache": "Inspect and trim the on-disk cache",
     "tem-tutorial": "Tutorial for new users of tem",
 }
 
@@ -5,7 +5,19 @@ import os
 
 from tem._meta import __prefix__, __version__
 
-from .env import Environment
-from .fs import TemDir
-
 default_repo = os.path.expanduser("~/.local/share/tem/repo")
+
+
+def __getattr__(name):
+    # Environment and TemDir are imported when they are first used, so that
+    # commands which don't need them (like shell completion) start quickly
+    # pylint: disable=import-outside-toplevel
+    if name == "Environment":
+        from .env import Environment
+
+        return Environment
+    if name == "TemDir":
+        from .fs import TemDir
+
+        return TemDir
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
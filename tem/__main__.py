@@ -24,12 +24,14 @@ import sys
 from importlib import import_module
 
 import tem
-from tem import config, plugin, util
-from tem.cli import common as cli
+from tem import completion, config, util
 
 
 def init_user():
     """Initialize a user config file in a location with the highest priority"""
+    # pylint: disable-next=import-outside-toplevel
+    from tem.cli import common as cli
+
     existing_cfg = next(
         (path for path in config.USER_PATHS if os.path.exists(path)), None
     )
@@ -78,6 +80,14 @@ def minimum_parser_setup(subparsers, parsers, subcommand, *args, **kwargs):
 
 def main():
     """Main program entry point"""
+    # Completion runs on every key press, so it skips the parsers and the
+    # modules they need entirely
+    if completion.requested(sys.argv[1:]):
+        sys.exit(completion.main())
+    # pylint: disable=import-outside-toplevel
+    from tem import plugin
+    from tem.cli import common as cli
+
     # The dummy parser will be used to find out which subcommand was run
     parser, dummy_parser = [
         argparse.ArgumentParser(
@@ -144,6 +154,10 @@ def main():
                          help="manipulate tem variants")
     minimum_parser_setup(subparsers, parsers, "run",
                          help="run programs in a tem-aware way")
+    minimum_parser_setup(subparsers, parsers, "watch",
+                         help="keep caches valid by watching for changes")
+    minimum_parser_setup(subparsers, parsers, "cache",
+                         help="inspect and trim the on-disk cache")
     minimum_parser_setup(subparsers, parsers, "dot")
     # fmt: on
     for plug in plugin.load_all():
@@ -0,0 +1,347 @@
+"""
+Archive-backed repositories.
+
+A zip or tar archive can be used as a read-only repository, for example a
+versioned bundle of templates downloaded as a release artifact. Like a
+packed repository (see :mod:`tem.pack`), an archive can be put in
+`REPO_PATH` as it is, and the templates inside it are referred to by joining
+the path of the archive and the path of the template.
+
+Finding a template requires a list of all members of the archive. Building
+it means reading the central directory of a zip archive, and reading the
+whole of a tar archive, since tar has no index. So the list is built only
+when it's first needed, and then kept as a member index in the user's cache
+directory, until the archive changes. The index also holds the location of
+each member inside an uncompressed tar archive, so that members can be read
+without scanning the archive again.
+
+Templates are extracted by streaming only the members that are requested.
+Members of compressed tar archives can only be reached by decompressing
+everything before them, so all requested members are extracted in a single
+pass that stops once the last of them is found.
+
+Supported formats are zip and tar, uncompressed or compressed with any of
+the compressions that :mod:`tarfile` supports. Tar archives compressed with
+zstd are read by :mod:`tarfile` since Python 3.14. With older versions, they
+are decompressed with the `zstandard` module if it's installed, or with the
+`zstd` program. If neither is available, loading one raises a
+:class:`ValueError`. Symbolic links, hard links and other special members
+are skipped.
+"""
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import time
+import zipfile
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from tem import cache
+from tem.pack import Entry, Tree
+from tem.util.fs import AnyPath
+
+__all__ = [
+    "Archive",
+    "SUFFIXES",
+    "UNSUPPORTED_SUFFIXES",
+    "index_path",
+    "load",
+]
+
+_ZSTD_SUFFIXES = (".tar.zst", ".tzst")
+
+
+def _zstd_decompressor() -> Optional[str]:
+    """
+    Return what decompresses zstd archives: ``"tarfile"``, ``"zstandard"``
+    or ``"zstd"``, or ``None`` if nothing does.
+    """
+    # pylint: disable=import-outside-toplevel,unused-import
+    try:
+        # tarfile can read zstd archives only where this module exists
+        import compression.zstd
+
+        return "tarfile"
+    except ImportError:
+        pass
+    try:
+        import zstandard
+
+        return "zstandard"
+    except ImportError:
+        pass
+    return "zstd" if shutil.which("zstd") else None
+
+
+_ZSTD_DECOMPRESSOR = _zstd_decompressor()
+_HAS_ZSTD = _ZSTD_DECOMPRESSOR is not None
+
+#: File name suffixes of archives that can be used as repositories
+SUFFIXES = (
+    ".zip",
+    ".tar",
+    ".tar.gz",
+    ".tgz",
+    ".tar.bz2",
+    ".tbz2",
+    ".tar.xz",
+    ".txz",
+) + (_ZSTD_SUFFIXES if _HAS_ZSTD else ())
+#: File name suffixes of archives that can't be read, since no decompressor
+#: is available for them
+UNSUPPORTED_SUFFIXES = () if _HAS_ZSTD else _ZSTD_SUFFIXES
+
+#: Version of the member index format
+_INDEX_VERSION = 1
+_CHUNK_SIZE = 1 << 20
+
+
+class Archive(Tree):
+    """
+    Read-only view of the zip or tar archive at ``path``. The member index is
+    loaded when it's first needed.
+    """
+
+    def __init__(self, path: AnyPath):
+        self.path = os.path.abspath(path)
+        #: Identifies the contents of the archive
+        self.key: List[int] = _stat_key(os.stat(self.path))
+        self._names: Optional[List[bytes]] = None
+        self._entries: List[Entry] = []
+
+    def __len__(self):
+        self._load_index()
+        return len(self._names)
+
+    def _name(self, i: int) -> bytes:
+        return self._names[i]
+
+    def _entry(self, i: int) -> Entry:
+        return self._entries[i]
+
+    def open_files(
+        self, entries: List[Entry]
+    ) -> Iterator[Tuple[Entry, IO]]:
+        if not entries:
+            return
+        if self.path.endswith(".zip"):
+            with zipfile.ZipFile(self.path) as archive:
+                infos = archive.infolist()
+                for entry in entries:
+                    with archive.open(infos[entry.offset]) as f:
+                        yield entry, f
+        elif self.path.endswith(".tar"):
+            # Uncompressed members can be read directly from their offsets
+            with open(self.path, "rb") as f:
+                for entry in sorted(entries, key=lambda e: e.offset):
+                    f.seek(entry.offset)
+                    yield entry, io.BufferedReader(_Slice(f, entry.size))
+        else:
+            # Here the offset is the position of the member in the archive
+            wanted = {entry.offset: entry for entry in entries}
+            with _open_tar_stream(self.path) as archive:
+                for i, member in enumerate(archive):
+                    entry = wanted.pop(i, None)
+                    if entry is not None:
+                        yield entry, archive.extractfile(member)
+                    if not wanted:
+                        break
+
+    def _load_index(self):
+        if self._names is not None:
+            return
+        index = cache.default().get("archives", self.path, {})
+        if index.get("version") == _INDEX_VERSION:
+            records = index["entries"]
+        else:
+            # Taken before the archive is read, so that the index is not
+            # trusted if the archive changes in the meantime
+            deps = cache.dependencies([self.path])
+            records = self._build_index()
+            cache.default().set(
+                "archives",
+                self.path,
+                {"version": _INDEX_VERSION, "entries": records},
+                deps,
+            )
+        self._entries = [
+            Entry(
+                name,
+                mode,
+                offset,
+                size,
+                mtime_ns,
+                bytes.fromhex(digest) if digest else None,
+            )
+            for name, mode, offset, size, mtime_ns, digest in records
+        ]
+        self._names = [entry.path.encode() for entry in self._entries]
+
+    def _build_index(self) -> List[list]:
+        """Read the members of the archive, as records for the index."""
+        records: Dict[str, list] = {}
+        try:
+            if self.path.endswith(".zip"):
+                members = _zip_members(self.path)
+            else:
+                members = _tar_members(self.path)
+            for record in members:
+                records[record[0]] = record  # Later members win
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+            raise ValueError(f"'{self.path}' is not a valid archive: {e}")
+        # Archives don't need to contain entries for directories
+        mtime_ns = self.key[2]
+        for name in list(records):
+            parent = os.path.dirname(name)
+            while parent and parent not in records:
+                records[parent] = [
+                    parent,
+                    stat.S_IFDIR | 0o755,
+                    0,
+                    0,
+                    mtime_ns,
+                    None,
+                ]
+                parent = os.path.dirname(parent)
+        return [records[name] for name in sorted(records, key=str.encode)]
+
+
+#: Archives that have been loaded
+_cache: Dict[str, Archive] = {}
+
+
+def load(path: AnyPath) -> Archive:
+    """
+    Return the :class:`Archive` at ``path``. The archive is loaded only once
+    per process, unless the file is replaced in the meantime.
+    """
+    path = os.path.abspath(path)
+    if path.endswith(UNSUPPORTED_SUFFIXES):
+        raise ValueError(
+            f"'{path}' can't be read: zstd archives require Python 3.14, "
+            "the zstandard module or the zstd program"
+        )
+    archive = _cache.get(path)
+    if archive is None or archive.key != _stat_key(os.stat(path)):
+        archive = _cache[path] = Archive(path)
+    return archive
+
+
+def index_path(path: AnyPath) -> str:
+    """Return the path of the member index of the archive at ``path``."""
+    return cache.default().path("archives", os.path.abspath(path))
+
+
+class _Slice(io.RawIOBase):
+    """The next ``size`` bytes of the file object ``f``."""
+
+    def __init__(self, f: IO, size: int):
+        super().__init__()
+        self._f = f
+        self._left = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._f.readinto(memoryview(buffer)[: self._left])
+        self._left -= n
+        return n
+
+
+def _stat_key(st: os.stat_result) -> List[int]:
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def _member_path(name: str) -> Optional[str]:
+    """
+    Normalize the member ``name``. Return ``None`` if it points outside the
+    archive.
+    """
+    path = os.path.normpath(name.replace("\\", "/")).strip("/")
+    if os.path.isabs(name) or path in ("", ".") or path.startswith(".."):
+        return None
+    return path
+
+
+def _zip_members(path: str) -> Iterator[list]:
+    with zipfile.ZipFile(path) as archive:
+        for i, info in enumerate(archive.infolist()):
+            name = _member_path(info.filename)
+            if name is None:
+                continue
+            mode = info.external_attr >> 16
+            if info.is_dir():
+                mode = stat.S_IFDIR | (stat.S_IMODE(mode) or 0o755)
+            elif not mode or stat.S_ISREG(mode):
+                mode = stat.S_IFREG | (stat.S_IMODE(mode) or 0o644)
+            else:
+                continue
+            mtime_ns = int(time.mktime(info.date_time + (0, 0, -1))) * 10**9
+            # The offset is the position of the member in the central
+            # directory. The digest is computed only when it's needed.
+            yield [name, mode, i, info.file_size, mtime_ns, None]
+
+
+@contextlib.contextmanager
+def _open_tar_stream(path: str) -> Iterator[tarfile.TarFile]:
+    """Open the compressed tar archive at ``path`` for reading as a stream."""
+    if not path.endswith(_ZSTD_SUFFIXES) or _ZSTD_DECOMPRESSOR == "tarfile":
+        with tarfile.open(path, mode="r|*") as archive:
+            yield archive
+    elif _ZSTD_DECOMPRESSOR == "zstandard":
+        # pylint: disable-next=import-outside-toplevel
+        import zstandard
+
+        with open(path, "rb") as f:
+            stream = zstandard.ZstdDecompressor().stream_reader(f)
+            with stream, tarfile.open(fileobj=stream, mode="r|") as archive:
+                yield archive
+    else:
+        with subprocess.Popen(
+            ["zstd", "--decompress", "--stdout", "--quiet", "--", path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ) as process:
+            try:
+                with tarfile.open(
+                    fileobj=process.stdout, mode="r|"
+                ) as archive:
+                    yield archive
+            finally:
+                # The archive may not have been read to the end
+                process.kill()
+
+
+def _tar_members(path: str) -> Iterator[list]:
+    compressed = not path.endswith(".tar")
+    # Compressed archives are read as a stream, so that each member is
+    # decompressed only once
+    with (
+        _open_tar_stream(path) if compressed else tarfile.open(path, "r:")
+    ) as archive:
+        for i, member in enumerate(archive):
+            name = _member_path(member.name)
+            if name is None or not (member.isreg() or member.isdir()):
+                continue
+            file_type = stat.S_IFDIR if member.isdir() else stat.S_IFREG
+            digest = None
+            if member.isreg():
+                # The whole archive is read anyway
+                sha256 = hashlib.sha256()
+                f = archive.extractfile(member)
+                while chunk := f.read(_CHUNK_SIZE):
+                    sha256.update(chunk)
+                digest = sha256.hexdigest()
+            yield [
+                name,
+                file_type | member.mode,
+                i if compressed else member.offset_data,
+                member.size,
+                int(member.mtime) * 10**9,
+                digest,
+            ]
@@ -0,0 +1,373 @@
+"""
+On-disk cache shared by everything that tem caches between runs.
+
+The cache lives in `$XDG_CACHE_HOME/tem`. Entries are grouped in namespaces,
+one directory per namespace, and identified by a string key within their
+namespace. Each entry is a JSON file holding a value, which can be anything
+that can be stored as JSON, along with the dependencies of the value: a list
+of files, each recorded with its modification time and size. An entry
+whose dependencies have changed since it was stored is treated as missing.
+Caches that validate their values in their own way, like the indexes of
+:mod:`tem.search`, simply store no dependencies.
+
+Entries are written atomically, so a reader never sees a partial entry, and
+an entry that can't be written is silently skipped: the cache is only ever a
+shortcut. The total size of the cache is capped by the `cache.max_size`
+option. When the cap is exceeded, the least recently used entries are
+evicted. The modification time of an entry is its last use, so evicting
+doesn't need any bookkeeping besides the entries themselves. The cap is
+enforced every few minutes, rather than on every write, since that requires
+listing all entries.
+
+Hits and misses are counted for each namespace and added to the statistics
+in the cache directory when the process exits. See `tem cache` for the
+command line interface.
+
+Examples
+--------
+>>> c = cache.default()
+>>> c.set("vars", "/home/user/project", ["a", "b"], deps=["vars.py"])
+>>> c.get("vars", "/home/user/project")
+['a', 'b']
+"""
+import atexit
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from tem import errors, util
+from tem.config import cfg
+from tem.util.fs import AnyPath
+
+__all__ = ["Cache", "default", "dependencies", "parse_size"]
+
+#: Seconds between automatic checks of the size cap
+_PRUNE_INTERVAL = 600
+#: Seconds after which the use of an entry is recorded again
+_TOUCH_INTERVAL = 60
+#: Temporary files older than this many seconds are left over from crashes
+_STALE_TMP_AGE = 3600
+#: Multipliers of the size suffixes accepted by :func:`parse_size`
+_SIZE_SUFFIXES = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+_SIZE_REGEX = re.compile(r"(\d+(?:\.\d*)?)?\s*([KMG]?)B?")
+#: Names of entry files, and of the temporary files they are written to
+_ENTRY_REGEX = re.compile(r"[0-9a-f]{64}\.json(\.\d+\.tmp)?")
+
+
+class Cache:
+    """
+    Cache in ``directory``, which defaults to tem's cache directory. If
+    ``max_size`` is given, the total size of the entries is kept below it.
+    """
+
+    def __init__(self, directory: AnyPath = None, max_size: int = 0):
+        self.directory = os.fspath(directory or util.cache_path())
+        self.max_size = max_size
+        #: Hits and misses of each namespace, since the last flush
+        self._counts: Dict[str, list] = {}
+        self._written = 0
+        self._flush_registered = False
+
+    def path(self, namespace: str, key: str) -> str:
+        """Return the path of the file that holds an entry."""
+        name = hashlib.sha256(os.fsencode(key)).hexdigest()
+        return os.path.join(self.directory, namespace, f"{name}.json")
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """
+        Return the value of an entry, or ``default`` if there is no entry or
+        its dependencies have changed.
+        """
+        path = self.path(namespace, key)
+        entry = None
+        with contextlib.suppress(OSError, ValueError):
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+                mtime = os.fstat(f.fileno()).st_mtime
+        if (
+            not isinstance(entry, dict)
+            or entry.get("key") != key
+            or not _deps_match(entry.get("deps", ()))
+        ):
+            self._count(namespace, hit=False)
+            return default
+        self._count(namespace, hit=True)
+        if time.time() - mtime > _TOUCH_INTERVAL:
+            with contextlib.suppress(OSError):
+                os.utime(path)  # Record the use, for eviction
+        return entry.get("value")
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        deps: Iterable[AnyPath] = (),
+    ):
+        """
+        Store ``value`` as an entry, which stays valid until one of the
+        files ``deps`` changes. Files that don't exist must not exist for the
+        entry to stay valid.
+
+        The dependencies are recorded when the entry is stored. To avoid
+        storing a value that is already out of date, use
+        :func:`dependencies` before computing it, and pass the result as
+        ``deps``.
+        """
+        deps = dependencies(deps)
+        entry = {"key": key, "deps": deps, "value": value}
+        path = self.path(namespace, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+                self._written += f.tell()
+            os.replace(tmp_path, path)
+        except OSError:
+            return  # The entry will be computed again next time
+        if self.max_size and (
+            self._written > self.max_size // 10 or self._prune_is_due()
+        ):
+            self.prune()
+
+    def delete(self, namespace: str, key: str):
+        """Remove an entry, if it exists."""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(namespace, key))
+
+    def namespaces(self) -> Iterator[str]:
+        """Iterate over the namespaces that have entries."""
+        with contextlib.suppress(FileNotFoundError):
+            for entry in os.scandir(self.directory):
+                if entry.is_dir(follow_symlinks=False) and any(
+                    self._entries(entry.name)
+                ):
+                    yield entry.name
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Return statistics about each namespace: the number of
+        ``entries``, their total ``size``, and the number of ``hits`` and
+        ``misses`` since the cache was last cleared.
+        """
+        self.flush()
+        counts = self._read_counts()
+        result = {}
+        for namespace in sorted(set(self.namespaces()) | set(counts)):
+            sizes = [st.st_size for _, st in self._entries(namespace)]
+            hits, misses = counts.get(namespace, (0, 0))
+            result[namespace] = {
+                "entries": len(sizes),
+                "size": sum(sizes),
+                "hits": hits,
+                "misses": misses,
+            }
+        return result
+
+    def prune(self, max_size: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Evict the least recently used entries until the cache takes up at
+        most ``max_size`` bytes, which defaults to :attr:`max_size`. Also
+        remove temporary files left over from crashes. Return the number of
+        removed files and the number of bytes they took up.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        entries = []
+        removed = freed = 0
+        now = time.time()
+        for namespace in self._namespace_dirs():
+            for path, st in self._entries(namespace, tmp=True):
+                if not path.endswith(".tmp"):
+                    entries.append((st.st_mtime, path, st.st_size))
+                elif now - st.st_mtime > _STALE_TMP_AGE:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                        removed += 1
+                        freed += st.st_size
+        total = sum(size for _, _, size in entries)
+        if max_size:
+            for _, path, size in sorted(entries):
+                if total <= max_size:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                    removed += 1
+                    freed += size
+                total -= size
+        self._written = 0
+        with contextlib.suppress(OSError):
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._stamp_path(), "w", encoding="utf-8"):
+                pass
+        return removed, freed
+
+    def clear(self, namespace: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Remove all entries of ``namespace``, or of all namespaces, along
+        with their statistics. Return the number of removed entries and the
+        number of bytes they took up.
+        """
+        removed = freed = 0
+        namespaces = (
+            [namespace] if namespace is not None else self._namespace_dirs()
+        )
+        for name in namespaces:
+            for path, st in self._entries(name, tmp=True):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                    removed += 1
+                    freed += st.st_size
+        self.flush()
+        with self._lock():
+            counts = self._read_counts()
+            for name in list(counts):
+                if namespace is None or name == namespace:
+                    del counts[name]
+            self._write_counts(counts)
+        return removed, freed
+
+    def flush(self):
+        """Add the hits and misses of this process to the statistics."""
+        if not self._counts:
+            return
+        with contextlib.suppress(OSError), self._lock():
+            counts = self._read_counts()
+            for namespace, (hits, misses) in self._counts.items():
+                total = counts.setdefault(namespace, [0, 0])
+                total[0] += hits
+                total[1] += misses
+            self._write_counts(counts)
+        self._counts = {}
+
+    def _count(self, namespace: str, hit: bool):
+        if not self._flush_registered:
+            atexit.register(self.flush)
+            self._flush_registered = True
+        self._counts.setdefault(namespace, [0, 0])[0 if hit else 1] += 1
+
+    def _namespace_dirs(self) -> Iterator[str]:
+        with contextlib.suppress(FileNotFoundError):
+            for entry in os.scandir(self.directory):
+                if entry.is_dir(follow_symlinks=False):
+                    yield entry.name
+
+    def _entries(
+        self, namespace: str, tmp=False
+    ) -> Iterator[Tuple[str, os.stat_result]]:
+        """Yield the path and stat of each entry of ``namespace``."""
+        with contextlib.suppress(FileNotFoundError, NotADirectoryError):
+            for entry in os.scandir(os.path.join(self.directory, namespace)):
+                # Other files, like the state of the watcher, are not entries
+                match = _ENTRY_REGEX.fullmatch(entry.name)
+                if match and (tmp or not match.group(1)):
+                    with contextlib.suppress(FileNotFoundError):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+
+    def _prune_is_due(self) -> bool:
+        try:
+            last = os.stat(self._stamp_path()).st_mtime
+        except OSError:
+            return True
+        return time.time() - last > _PRUNE_INTERVAL
+
+    def _stamp_path(self) -> str:
+        return os.path.join(self.directory, "pruned")
+
+    def _read_counts(self) -> Dict[str, list]:
+        with contextlib.suppress(OSError, ValueError):
+            path = os.path.join(self.directory, "stats.json")
+            with open(path, encoding="utf-8") as f:
+                counts = json.load(f)
+            if isinstance(counts, dict):
+                return counts
+        return {}
+
+    def _write_counts(self, counts: Dict[str, list]):
+        path = os.path.join(self.directory, "stats.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with contextlib.suppress(OSError):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(counts, f)
+            os.replace(tmp_path, path)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "lock")
+        with open(path, "w", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def dependencies(paths: Iterable[AnyPath]) -> list:
+    """
+    Record the current state of the files ``paths``, as the dependencies of
+    an entry (see :meth:`Cache.set`). Dependencies that were already
+    recorded are kept as they are.
+    """
+    deps = []
+    for path in paths:
+        if isinstance(path, list):
+            deps.append(path)  # Already recorded
+            continue
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+            deps.append([path, st.st_mtime_ns, st.st_size])
+        except OSError:
+            deps.append([path, None, None])
+    return deps
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a size in bytes, optionally followed by one of the suffixes `K`,
+    `M` or `G`. An empty string means 0.
+    """
+    match = _SIZE_REGEX.fullmatch(size.strip().upper())
+    if match is None:
+        raise ValueError(f"invalid size '{size}'")
+    number, suffix = match.groups()
+    return int(float(number or 0) * _SIZE_SUFFIXES[suffix])
+
+
+#: The cache returned by :func:`default`, by directory
+_default: Dict[str, Cache] = {}
+
+
+def default() -> Cache:
+    """
+    Return the cache in tem's cache directory, limited by the
+    `cache.max_size` option.
+    """
+    directory = util.cache_path()
+    if directory not in _default:
+        try:
+            max_size = parse_size(cfg["cache.max_size"])
+        except ValueError as e:
+            raise errors.TemError(f"cache.max_size: {e}") from e
+        _default[directory] = Cache(directory, max_size)
+    return _default[directory]
+
+
+def _deps_match(deps: list) -> bool:
+    """Test if the files ``deps`` are the same as when they were recorded."""
+    for path, mtime_ns, size in deps:
+        try:
+            st = os.stat(path)
+        except OSError:
+            if mtime_ns is not None:
+                return False
+            continue
+        if st.st_mtime_ns != mtime_ns or st.st_size != size:
+            return False
+    return True
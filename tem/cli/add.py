@@ -1,7 +1,7 @@
 """tem add subcommand"""
 import os
 
-from tem import util
+from tem import ignore, store as store_module, util
 from tem.cli import common as cli
 
 
@@ -59,9 +59,19 @@ def cmd(args):
     """Execute this subcommand."""
 
     edit_files = []  # Files that will be edited if --edit[or] was provided
+    exclude = ignore.config_patterns("add.exclude")
+    # With a store, each file is written once for all repositories
+    store = store_module.from_config()
     # Copy or move the files
     for file in args.files:
         basename = os.path.basename(file)
+        # Patterns are matched relative to the directory containing the file
+        matcher = ignore.Matcher(
+            exclude, base=os.path.dirname(util.abspath(file))
+        )
+        if matcher.match(basename):
+            cli.print_cli_warn(f"'{file}' is excluded by add.exclude")
+            continue
         dests = [
             args.directory + "/" + basename if args.directory else None,
             args.output,
@@ -79,10 +89,16 @@ def cmd(args):
                     + repo
                     + "' did not exist. It was created for you."
                 )
-            if not args.move:  # copy
-                dest_file = util.copy(file, repo + "/" + dest)
-            else:  # move
+            if args.move:
                 dest_file = util.move(file, repo + "/" + dest)
+            elif store is not None:
+                dest_file = store.add(
+                    file, repo + "/" + dest, ignore=matcher.filter
+                )
+            else:  # copy
+                dest_file = util.copy(
+                    file, repo + "/" + dest, ignore=matcher.filter
+                )
 
             if args.edit or args.editor:
                 edit_files.append(dest_file)
@@ -0,0 +1,78 @@
+"""tem cache subcommand"""
+from tem import cache, errors
+from tem.cli import common as cli
+
+
+def setup_parser(parser):
+    """Set up argument parser for this subcommand."""
+    cli.add_general_options(parser)
+
+    parser.add_argument(
+        "action",
+        choices=("stats", "prune", "clear"),
+        nargs="?",
+        default="stats",
+        help="show statistics (default), evict entries beyond the size limit"
+        ", or remove entries",
+    )
+    parser.add_argument(
+        "namespaces",
+        metavar="NAMESPACE",
+        nargs="*",
+        help="with stats or clear, only operate on NAMESPACE",
+    )
+    parser.add_argument(
+        "--max-size",
+        metavar="SIZE",
+        help="with prune, evict entries until the cache takes up at most "
+        "SIZE (e.g. 100M) [default: cache.max_size]",
+    )
+
+
+@cli.subcommand
+def cmd(args):
+    """Execute this subcommand."""
+    c = cache.default()
+    if args.action == "stats":
+        _print_stats(c, args.namespaces)
+    elif args.action == "prune":
+        max_size = None
+        if args.max_size is not None:
+            try:
+                max_size = cache.parse_size(args.max_size)
+            except ValueError as e:
+                raise errors.TemError(f"--max-size: {e}") from e
+        removed, freed = c.prune(max_size)
+        cli.print_cli_info(f"removed {removed} entries, freed {freed} bytes")
+    else:
+        removed = freed = 0
+        for namespace in args.namespaces or [None]:
+            result = c.clear(namespace)
+            removed += result[0]
+            freed += result[1]
+        cli.print_cli_info(f"removed {removed} entries, freed {freed} bytes")
+
+
+def _print_stats(c: cache.Cache, namespaces):
+    stats = c.stats()
+    if namespaces:
+        stats = {name: stats.get(name, {}) for name in namespaces}
+    rows = [("NAMESPACE", "ENTRIES", "SIZE", "HITS", "MISSES")]
+    totals = [0, 0, 0, 0]
+    for name, values in stats.items():
+        row = [
+            values.get(field, 0)
+            for field in ("entries", "size", "hits", "misses")
+        ]
+        totals = [total + value for total, value in zip(totals, row)]
+        rows.append((name, *row))
+    rows.append(("total", *totals))
+    widths = [max(len(str(row[i])) for row in rows) for i in range(5)]
+    for name, *values in rows:
+        print(
+            f"{name:<{widths[0]}}",
+            *(f"{v:>{width}}" for v, width in zip(values, widths[1:])),
+            sep="  ",
+        )
+    limit = f"{c.max_size} bytes" if c.max_size else "none"
+    print(f"\nsize limit: {limit}")
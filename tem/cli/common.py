@@ -13,8 +13,9 @@ import tempfile
 from typing import List
 
 import tem
-from tem import config, ext, util, errors, repo
+from tem import config, ext, util, errors, jobs, repo
 from tem.context import Runtime
+from tem.fs import TemDir
 from tem.cli.context import as_warnings
 
 from ..repo import RepoSpec
@@ -79,7 +80,12 @@ def subcommand(cmd):
                 args_.repo = args_.repo.repos()
                 for repo in args_.repo:
                     abspath = repo.abspath()
-                    if not os.path.isdir(abspath) and (
+                    exists = (
+                        os.path.isfile(abspath)
+                        if repo.is_packed()
+                        else os.path.isdir(abspath)
+                    )
+                    if not exists and (
                         os.path.realpath(abspath)
                         != os.path.realpath(tem.default_repo)
                     ):
@@ -270,22 +276,62 @@ def run_hooks(trigger, src_dir, dest_dir=".", environment=None):
 
     src_dir = util.abspath(src_dir)
 
-    # Setup environment variables that the hooks can use
+    # Setup environment variables that the hooks can use. The environment of
+    # this process is left alone, so that hooks can be run from many threads.
+    env = dict(os.environ)
     if environment is not None:
         if "TEM_TEMPLATEDIR" not in environment:
             environment["TEM_TEMPLATEDIR"] = src_dir
         environment["PATH"] = src_dir + "/.tem/path:" + os.environ["PATH"]
-        for var, value in environment.items():
-            os.environ[var] = value
+        env.update(environment)
 
     os.makedirs(dest_dir, exist_ok=True)
 
-    with util.chdir(dest_dir):
-        # Execute matching hooks
-        for file in glob.glob(src_dir + f"/.tem/hooks/*.{trigger}"):
-            subprocess.run(
-                [file] + sys.argv, cwd=os.path.dirname(file), check=False
+    hooks = glob.glob(src_dir + f"/.tem/hooks/*.{trigger}")
+    if not hooks:
+        return
+
+    # POST hooks can be deferred to a background worker, so that the user
+    # doesn't have to wait for them
+    if trigger.endswith(".post") and config.cfg.getboolean(
+        "hooks", "async", fallback=False
+    ):
+        queue = hook_queue(dest_dir)
+        if queue is not None:
+            # Jobs are stored on disk, so they carry only the variables that
+            # tem sets for hooks. The rest comes from the worker.
+            hook_env = {
+                name: value
+                for name, value in env.items()
+                if name.startswith("TEM_") or name == "PATH"
+            }
+            for file in hooks:
+                queue.submit(
+                    [file] + sys.argv, cwd=os.path.dirname(file), env=hook_env
+                )
+            queue.spawn_worker(
+                max_jobs=config.cfg.getint("hooks", "jobs", fallback=None)
             )
+            return
+
+    # Execute matching hooks
+    for file in hooks:
+        subprocess.run(
+            [file] + sys.argv, cwd=os.path.dirname(file), env=env, check=False
+        )
+
+
+def hook_queue(directory=".") -> "jobs.JobQueue":
+    """
+    Return the queue of background hooks that belongs to the temdir at
+    ``directory``, or ``None`` if ``directory`` is not a temdir.
+    """
+    try:
+        temdir = TemDir(directory)
+    except errors.NotATemDirError:
+        return None
+    # pylint: disable-next=protected-access
+    return jobs.JobQueue(temdir._internal / "hooks")
 
 
 def expand_alias(index, args_):
@@ -359,10 +405,14 @@ def print_exception_message(exception: Exception):
     as a CLI message. Works just as well if ``exception`` is a ``TemError``.
     """
     print_func = print_cli_warn if as_warnings([exception]) else print_cli_err
+    print_func(exception_message(exception))
+
+
+def exception_message(exception: Exception) -> str:
+    """Return the message of ``exception``, stripped of unnecessary text."""
     if isinstance(exception, tem.errors.TemError):
-        print_func(exception.cli())
-    else:
-        print_func(re.sub(r"^\[Errno [0-9]*\] ", "", str(exception)))
+        return exception.cli()
+    return re.sub(r"^\[Errno [0-9]*\] ", "", str(exception))
 
 
 def copy(*args_, ignore_nonexistent=False, **kwargs):
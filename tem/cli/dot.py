@@ -5,7 +5,7 @@ import subprocess
 import sys
 from typing import List, Iterable
 
-from tem import ext, util, env, errors
+from tem import ext, util, env, errors, ignore
 from tem.errors import TemError
 from tem.util import fs as fs_util
 
@@ -79,7 +79,12 @@ def setup_common_parser(parser):
         help="recurse up the directory tree",
     )
     modifier_opts.add_argument(
-        "-I", "--ignore", metavar="FILE", default=[], help="ignore FILE"
+        "-I",
+        "--ignore",
+        metavar="PATTERN",
+        action="append",
+        default=[],
+        help="ignore files that match PATTERN (can be used multiple times)",
     )
 
     cli.add_general_options(parser)
@@ -273,6 +278,24 @@ def delete_files(dotdir: str, file_names: List[str]):
         sys.exit(1)
 
 
+def _unignored_files(rootdir: str, subdir: str, patterns: List[str]):
+    """
+    Return the names of files inside the dotdir that are not ignored by the
+    `.tem/ignore` file of ``rootdir`` or by ``patterns``.
+    """
+    matcher = ignore.load(rootdir)
+    excluded = ignore.Matcher(patterns, base=rootdir + "/.tem/" + subdir)
+    with os.scandir(excluded.base) as entries:
+        return [
+            entry.name
+            for entry in entries
+            if not matcher.is_ignored(
+                f".tem/{subdir}/{entry.name}", is_dir=entry.is_dir()
+            )
+            and not excluded.match(entry.name, is_dir=entry.is_dir())
+        ]
+
+
 def cmd_common(args, subdir=None):
     """
     If this is called from a `dot` derivative subcommand, subdir and root
@@ -317,9 +340,7 @@ def cmd_common(args, subdir=None):
         file_names = args.files
         # If no files are passed as arguments, use all files from the dotdir
         if not file_names:
-            file_names = [
-                file for file in os.listdir(dotdir) if file not in args.ignore
-            ]
+            file_names = _unignored_files(rootdir, subdir, args.ignore)
         dest_files += [dotdir + "/" + f for f in file_names]
         if not file_names:
             if args.verbose:
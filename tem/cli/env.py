@@ -1,14 +1,83 @@
 """tem env subcommand"""
+import json
+import sys
+
+from tem import shell, var
+from tem.env import Environment, EnvironmentBatch, activation
+from tem.errors import TemError
+
 from . import common as cli
 from . import dot
 
 
 def setup_parser(parser):
     """Set up argument parser for this subcommand."""
-    dot.setup_common_parser(parser)
+    _, modifier_opts = dot.setup_common_parser(parser)
+
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="compile the environment into an activation script and print "
+        "the path to the script",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="read directories from standard input, one per line, and print "
+        "the environment of each as a line of JSON",
+    )
+    modifier_opts.add_argument(
+        "--shell",
+        choices=[str(sh) for sh in shell.Shell if sh],
+        help="shell to compile the activation script for",
+    )
 
 
 @cli.subcommand
 def cmd(args):
     """Execute this subcommand."""
+    if args.compile:
+        compile_activation_script(args)
+        return
+    if args.batch:
+        print_batch()
+        return
     dot.cmd_common(args, "env")
+
+
+def compile_activation_script(args):
+    """Compile the activation script for the environment and print its path."""
+    sh = shell.Shell(args.shell) if args.shell else shell.shell()
+    if not sh:
+        raise TemError("no shell plugin is active, use the --shell option")
+    environment = Environment(args.root)
+    print(activation.compile_script(environment, sh, force=args.force))
+
+
+def print_batch():
+    """
+    Print the environment of each directory read from stdin as a line of
+    JSON, in the order the directories were read.
+    """
+    batch = EnvironmentBatch()
+    loader = var.BatchLoader()
+    for line in sys.stdin:
+        directory = line.rstrip("\n")
+        if not directory:
+            continue
+        record = {"directory": directory}
+        try:
+            environment = batch.environment(directory)
+            variables = loader.load(environment)
+            record["envdirs"] = [str(envdir) for envdir in environment.envdirs]
+            record["variables"] = {
+                name: variables[name].value for name in variables
+            }
+        except TemError as e:
+            record["error"] = e.cli()
+            cli.exit_code = 1
+        except Exception as e:  # pylint: disable=broad-except
+            # A broken vars.py must not stop the other directories
+            record["error"] = f"{type(e).__name__}: {e}"
+            cli.exit_code = 1
+        print(json.dumps(record, default=str), flush=True)
@@ -1,5 +1,9 @@
 """Find various tem-related stuff"""
-from tem import find, repo, util
+import argparse
+import re
+
+from tem import errors, find, repo, util
+from tem.config import cfg
 from tem.cli import common as cli
 
 
@@ -21,13 +25,69 @@ def setup_parser(parser):
         action="store_true",
         help="find the root tem directory",
     )
-    # TODO implement
     parser.add_argument(
         "--from",
         "-f",
+        dest="from_dir",
         metavar="DIR",
         help="search from DIR instead of PWD",
     )
+    parser.add_argument(
+        "--under",
+        "-u",
+        metavar="DIR",
+        help="find tem directories under DIR",
+    )
+    parser.add_argument(
+        "--max-depth",
+        metavar="N",
+        type=int,
+        help="with --under, descend at most N directory levels",
+    )
+    parser.add_argument(
+        "--fuzzy",
+        "-z",
+        action="store_true",
+        help="find templates whose paths approximately match ARGS",
+    )
+    parser.add_argument(
+        "--limit",
+        "-n",
+        metavar="N",
+        type=int,
+        default=20,
+        help="with --fuzzy, print at most N templates [default: 20]",
+    )
+    parser.add_argument(
+        "--grep",
+        "-g",
+        metavar="PATTERN",
+        help="print the lines of templates that match the regex PATTERN",
+    )
+    parser.add_argument(
+        "--ignore-case",
+        "-i",
+        action="store_true",
+        help="with --grep, match PATTERN regardless of case",
+    )
+    parser.add_argument(
+        "--index",
+        action=argparse.BooleanOptionalAction,
+        help="with --grep, use a content index [default: find.grep_index]",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        metavar="N",
+        type=int,
+        help="with --grep, search N files at the same time",
+    )
+    parser.add_argument(
+        "--null",
+        "-0",
+        action="store_true",
+        help="separate output lines with a NUL character instead of newline",
+    )
 
     parser.add_argument(
         "-v",
@@ -51,11 +111,13 @@ def cmd(args):
 
     result_paths = []
 
+    if args.under:  # --under option
+        result_paths += _print_under(args)
     # No options given, print all temdirs in the current hierarchy
-    if not args.root and not args.args:
+    elif not (args.root or args.args or args.fuzzy or args.grep):
         if args.verbose:
             cli.print_err("Tem directories:")
-        result_paths += list(find.parent_temdirs())
+        result_paths += list(find.parent_temdirs(args.from_dir))
 
     if args.base:  # --base option
         _print_base(args)
@@ -63,7 +125,11 @@ def cmd(args):
         _print_root(args)
 
     # TODO rework this part
-    if args.args:  # templates specified as positional arguments
+    if args.grep is not None:  # --grep option
+        result_paths += _print_grep(args)
+    elif args.fuzzy:  # --fuzzy option
+        result_paths += _print_fuzzy(args)
+    elif args.args:  # templates specified as positional arguments
         for template in args.args:
             result_paths += repo.find_template(template)
 
@@ -79,7 +145,7 @@ def _print_base(args):
         print(
             next(
                 d
-                for d in find.parent_temdirs()
+                for d in find.parent_temdirs(args.from_dir)
                 if util.basename(d) in args.args or not args.args
             )
         )
@@ -94,9 +160,62 @@ def _print_root(args):
         print(
             [
                 d
-                for d in find.parent_temdirs()
+                for d in find.parent_temdirs(args.from_dir)
                 if util.basename(d) in args.args or not args.args
             ][-1]
         )
     except IndexError:
         cli.exit_code = 1
+
+
+def _print_fuzzy(args):
+    end = "\0" if args.null else "\n"
+    result_paths = repo.search_templates(
+        " ".join(args.args), repos=args.repo, limit=args.limit
+    )
+    for path in result_paths:
+        print(path, end=end)
+    if not result_paths:
+        cli.exit_code = 1
+    return result_paths
+
+
+def _print_grep(args):
+    # pylint: disable-next=import-outside-toplevel
+    from tem import grep
+
+    if args.index is None:
+        args.index = cfg["find.grep_index"].strip().lower() == "true"
+    end = "\0" if args.null else "\n"
+    try:
+        matches = grep.grep(
+            args.grep,
+            args.repo,
+            ignore_case=args.ignore_case,
+            jobs=args.jobs,
+            use_index=args.index,
+        )
+        result_paths = {}
+        # Matches are printed as soon as they are found
+        for match in matches:
+            print(match, end=end, flush=True)
+            result_paths[match.abspath] = None
+    except re.error as e:
+        raise errors.TemError(f"invalid pattern '{args.grep}': {e}") from e
+    if not result_paths:
+        cli.exit_code = 1
+    return list(result_paths)
+
+
+def _print_under(args):
+    if args.verbose:
+        cli.print_err(f"Tem directories under '{args.under}':")
+    end = "\0" if args.null else "\n"
+    result_paths = []
+    # Paths are printed as soon as they are found
+    for temdir in find.temdirs_under(args.under, max_depth=args.max_depth):
+        print(temdir, end=end, flush=True)
+        result_paths.append(temdir)
+    if not result_paths:
+        cli.exit_code = 1
+    return result_paths
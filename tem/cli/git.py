@@ -1,11 +1,14 @@
 """tem git subcommand"""
+import json
+import os
+import pathlib
 import re
-import subprocess as sp
-import sys
+from typing import List, Optional
 
-from tem import config
+from tem import config, git
 from tem.cli import common as cli
-from tem.errors import TemError
+from tem.errors import NotATemDirError, TemError
+from tem.fs import TemDir
 
 
 def setup_parser(parser):
@@ -29,46 +32,28 @@ def setup_parser(parser):
     parser.add_argument(
         "-b", "--branch", help="git branch that contains tem files"
     )
-
-
-def _run_that_must_succeed(*args, **kwargs):
-    """
-    Helper function that does the same as `subprocess.run`, but exits if the
-    subprocess returns an error code.
-    """
-    p = sp.run(*args, check=False, **kwargs)
-    if p.returncode != 0:
-        sys.exit(1)
-    return p
-
-
-def get_current_branch():
-    """Call git to get the checked out branch."""
-    p = _run_that_must_succeed(
-        ["git", "branch", "--show-current"], stdout=sp.PIPE, encoding="utf-8"
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="restore all files, disregarding the previous checkout",
     )
-    return p.stdout[:-1]  # Remove newline at end
 
 
-def get_tem_branch():
+def get_tem_branch(repository: git.Repository):
     """
-    Get the tem branch from the current git repository.
-    Git is called to obtain a list of branches.
+    Get the tem branch from the current git repository. If there are multiple
+    candidates, the user is prompted for a choice.
     """
-
-    # Obtain branches from git and filter them
-    p = _run_that_must_succeed(
-        ["git", "branch"], stdout=sp.PIPE, encoding="utf-8"
-    )
-    branches = p.stdout[:-1].split("\n")
+    current_branch = repository.current_branch()
     branches = [
-        b[2:] for b in branches if re.match("^  tem($|[^a-zA-Z].*)", b)
+        b
+        for b in repository.branches()
+        if b != current_branch and re.match("^tem($|[^a-zA-Z].*)", b)
     ]
 
     # Handle special cases
-    if p.returncode != 0:
-        sys.exit(p.returncode)
-    elif not branches:  # No available branches
+    if not branches:  # No available branches
         raise TemError("current branch is the only branch")
     elif len(branches) == 1:  # Single available branch
         return branches[0]
@@ -91,54 +76,124 @@ def get_tem_branch():
     return branches[choice - 1]
 
 
-def ls_branch(branch):
-    """Get a list of versioned files in the checked out git branch."""
-    p = _run_that_must_succeed(
-        ["git", "ls-tree", "-r", "--name-only", branch],
-        stdout=sp.PIPE,
-        encoding="utf-8",
-    )
-    ls = p.stdout[:-1]  # Remove newline at end
-    return ls.split("\n")
-
-
 @cli.subcommand
 def cmd(args):
     """Execute this subcommand."""
     if not args.list:
         args.checkout = True
-    # Obtain current branch
-    cur_branch = get_current_branch()
-    # First we try to take `tem_branch` from arguments or from config
-    tem_branch = (
-        args.branch if args.branch else config.cfg["git.default_branch"]
-    )
-    # Then we check that it is a valid branch (must not be the active branch)
-    p = _run_that_must_succeed(
-        ["git", "branch"], encoding="utf-8", stdout=sp.PIPE
+
+    with git.Repository() as repository:
+        # Obtain current branch
+        cur_branch = repository.current_branch()
+        # First we try to take `tem_branch` from arguments or from config
+        tem_branch = (
+            args.branch if args.branch else config.cfg["git.default_branch"]
+        )
+        # Then we check that it is a valid branch (must not be the active
+        # branch)
+        valid_branches = [
+            b for b in repository.branches() if b != cur_branch
+        ]
+
+        # Note: tem_branch == '' is treated as tem_branch == None
+        if tem_branch and tem_branch not in valid_branches:
+            raise TemError(f"branch '{tem_branch}' not valid")
+        # As a fallback, we try to find branches whose names start with 'tem'.
+        # Actually, the regex pattern is slightly more complicated than that.
+        if not tem_branch:
+            tem_branch = get_tem_branch(repository)
+
+        if args.list:
+            state = {} if args.force else load_state(repository)
+            extra_files = _new_state(repository, tem_branch, state)["files"]
+            if extra_files:
+                print(*sorted(extra_files), sep="\n")
+            return
+        checkout(repository, tem_branch, force=args.force)
+
+
+def checkout(
+    repository: git.Repository, tem_branch: str, force: bool = False
+) -> List[str]:
+    """
+    Place the files that are in ``tem_branch`` but not in the current branch
+    into the working tree of ``repository``. Files that were restored by the
+    previous checkout, and that haven't changed or been removed since, are
+    left alone unless ``force`` is given. Return the paths of the files that
+    were restored.
+    """
+    state = {} if force else load_state(repository)
+    new_state = _new_state(repository, tem_branch, state)
+    extra_files = new_state["files"]
+    restored = state.get("files", {})
+    changed_files = sorted(
+        path
+        for path, oid in extra_files.items()
+        if restored.get(path) != oid
+        or not os.path.lexists(os.path.join(repository.worktree, path))
     )
-    valid_branches = [
-        b[2:] for b in p.stdout[:-1].split("\n") if b[0:1] != "* "
-    ]
+    repository.restore(tem_branch, changed_files)
+    if new_state != state:
+        save_state(repository, new_state)
+    return changed_files
+
 
-    # Note: tem_branch == '' is treated as tem_branch == None
-    if tem_branch and tem_branch not in valid_branches:
-        print(f"tem: error: branch '{tem_branch}' not valid")
-    # As a fallback, we try to find branches whose names start with 'tem'.
-    # Actually, the regex pattern is slightly more complicated than that.
-    if not tem_branch:
-        tem_branch = get_tem_branch()
-
-    # Obtain lists of versioned files in current and tem branch
-    ls_cur = ls_branch(cur_branch)
-    ls_tem = ls_branch(tem_branch)
-
-    # Files that are in tem branch but are not in current branch get placed
-    # into the working tree
-    extra_files = list(set(ls_tem) - set(ls_cur))
-    if args.list:
-        print(*sorted(extra_files), sep="\n")
+def _new_state(
+    repository: git.Repository, tem_branch: str, state: dict
+) -> dict:
+    """
+    Return the state of a checkout of ``tem_branch``. Its ``files`` are the
+    files that are in ``tem_branch`` but not in the current branch, along
+    with their object ids. If neither branch has changed since the checkout
+    that recorded ``state``, the recorded files are reused without reading
+    any trees.
+    """
+    new_state = {
+        "tem_branch": tem_branch,
+        "cur_tree": repository.tree(repository.current_branch() or "HEAD"),
+        "tem_tree": repository.tree(tem_branch),
+    }
+    if all(state.get(key) == value for key, value in new_state.items()):
+        new_state["files"] = state["files"]
     else:
-        p = _run_that_must_succeed(
-            ["git", "restore", "-s", tem_branch] + extra_files
+        # Subtrees that are shared by both branches are never read
+        new_state["files"] = dict(
+            repository.diff_trees(new_state["tem_tree"], new_state["cur_tree"])
         )
+    return new_state
+
+
+def _state_file(repository: git.Repository) -> Optional[pathlib.Path]:
+    """
+    Path to the file that records the last checkout in ``repository``, or
+    ``None`` if the top level of the working tree is not a temdir.
+    """
+    try:
+        temdir = TemDir(repository.worktree)
+    except NotATemDirError:
+        return None
+    # pylint: disable-next=protected-access
+    return pathlib.Path(temdir._internal, "git.json")
+
+
+def load_state(repository: git.Repository) -> dict:
+    """Load the state recorded by the last checkout in ``repository``."""
+    path = _state_file(repository)
+    if path is None:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(repository: git.Repository, state: dict):
+    """Record the ``state`` of the last checkout in ``repository``."""
+    path = _state_file(repository)
+    if path is None:
+        return
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
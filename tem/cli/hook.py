@@ -2,7 +2,7 @@
 import os
 import sys
 
-from .. import ext
+from .. import errors, ext, jobs
 from . import common as cli
 
 
@@ -23,6 +23,18 @@ def setup_parser(parser):
     action_opts.add_argument(
         "-l", "--list", action="store_true", help="list hooks"
     )
+    action_opts.add_argument(
+        "-s",
+        "--status",
+        action="store_true",
+        help="show the status of hooks running in the background",
+    )
+    action_opts.add_argument(
+        "-w",
+        "--wait",
+        action="store_true",
+        help="wait for hooks running in the background to finish",
+    )
     cli.add_edit_options(parser)
     parser.add_argument(
         "-f",
@@ -43,6 +55,9 @@ def cmd(args):
     # TODO this part is unusable
     # Create a cli interface for env and hooks, and potentially other files
     # in the .tem/* subdirectories
+    if args.status or args.wait:
+        background_hooks(args)
+        return
     if not (args.new or args.add or args.edit or args.editor or args.list):
         args.exec = True
     if args.new:
@@ -58,3 +73,21 @@ def cmd(args):
             ls_args += args.hooks
         p = ext.run(ls_args, encoding="utf-8")
         sys.exit(p.returncode)
+
+
+def background_hooks(args):
+    """Implement the `--status` and `--wait` options."""
+    queue = cli.hook_queue()
+    if queue is None:
+        raise errors.NotATemDirError(os.getcwd())
+    if args.wait:
+        queue.wait()
+    for job in queue.jobs():
+        status = job.state
+        if job.state == jobs.DONE:
+            status += f" ({job.returncode})"
+            if job.returncode != 0:
+                cli.exit_code = 1
+        print(
+            f"{status:<10}", os.path.basename(job.args[0]), queue.log(job)
+        )
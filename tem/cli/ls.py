@@ -2,7 +2,7 @@
 import os
 import subprocess as sp
 
-from tem import ext, util
+from tem import ext, ignore, pack, util
 from tem import repo as repo_module
 from tem.cli import common as cli
 
@@ -105,6 +105,46 @@ def fill_in_gaps(incomplete_paths):
     return [p for p in paths if os.path.exists(p)]
 
 
+def _unignored_files(matcher, files, opt_args):
+    """
+    Remove the files ignored by ``matcher`` from ``files``. If ``files`` is
+    empty, the contents of the current directory that are not ignored are
+    listed explicitly, but only if some of them are ignored.
+    """
+    if files:
+        return [f for f in files if not matcher.is_ignored(f)], opt_args
+    names = sorted(entry.name for entry in os.scandir())
+    unignored = [name for name in names if not matcher.match(name)]
+    if len(unignored) == len(names):
+        return files, opt_args
+    # ls hides dotfiles by default, unless told otherwise
+    show_hidden = any(
+        opt in ("--all", "--almost-all")
+        or (opt[:2] != "--" and ("a" in opt or "A" in opt))
+        for opt in opt_args
+    )
+    unignored = [f for f in unignored if show_hidden or f[0] != "."]
+    # Directories must be listed as entries, not by their contents
+    return unignored, opt_args + ["-d"]
+
+
+def _ls_packed(repo: Repo, ls_args, args):
+    """
+    List the contents of the packed ``repo``. The ls command can't be used,
+    so entries are listed one per line, and ls options are ignored.
+    """
+    file_args, _ = separate_files_and_options(ls_args)
+    names = pack.load_tree(repo.abspath()).listdir("")
+    if file_args:
+        names = [n for n in names if any(n.startswith(f) for f in file_args)]
+    if not names:
+        return  # Nothing to show in this repo
+    if not args.short:
+        print_repo_header(repo)
+    for name in sorted(names):
+        print(os.path.join(repo.abspath(), name) if args.path else name)
+
+
 def print_repo_header(repo: Repo):
     """Print repo header as 'name @ path'."""
     name = repo.name()
@@ -126,13 +166,22 @@ def cmd(args):
     # TODO Make it so that ls is always displayed per-file, so that other file
     # info can be appended or prepended on each line
     for i, repo in enumerate(args.repo):
+        if repo.is_packed():
+            _ls_packed(repo, ls_args, args)
+            if args.number and i >= args.number - 1:  # --number option
+                break
+            continue
         os.chdir(repo.abspath())
         file_args, opt_args = separate_files_and_options(ls_args)
         # Any missing file extensions are filled in here
-        # TODO Check for excluded files
         files = fill_in_gaps(file_args)
         if not any(os.scandir()) or (file_args and not files):
             continue  # Nothing to show in this repo
+        matcher = ignore.load(repo.abspath())
+        if matcher:
+            files, opt_args = _unignored_files(matcher, files, opt_args)
+            if not files:
+                continue
         if args.path:
             files = [os.path.abspath(f) for f in files]
         cmd_args = ["ls"] + opt_args + files
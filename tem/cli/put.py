@@ -1,8 +1,10 @@
 """tem put subcommand"""
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from tem import util, repo, errors
+from tem import util, repo, errors, ignore, pack
+from tem import put as put_module
 from tem.cli import common as cli
 
 
@@ -18,12 +20,39 @@ def setup_parser(parser):
         "-d",
         "--directory",
         metavar="DIR",
-        help="directory where the file(s) should be placed",
+        action="append",
+        help="directory where the file(s) should be placed (can be used "
+        "multiple times)",
+    )
+    out.add_argument(
+        "--destinations-from",
+        metavar="FILE",
+        help="read a NUL-separated list of destination directories from FILE "
+        "('-' for stdin)",
     )
     cli.add_edit_options(parser)
     parser.add_argument(
         "-s", "--symlink", action="store_true", help="create symlinks instead"
     )
+    parser.add_argument(
+        "-u",
+        "--update",
+        action="store_true",
+        help="copy only files that differ from the destination",
+    )
+    parser.add_argument(
+        "--checksum",
+        action="store_true",
+        help="with --update, compare files by content instead of by size "
+        "and modification time",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        help="put templates to at most N destinations at the same time",
+    )
     parser.add_argument(
         "templates",
         metavar="TEMPLATES",
@@ -34,19 +63,17 @@ def setup_parser(parser):
 
 def destinations_from_args(args, template):
     """Return a list of destinations by reading `args`."""
-    # TODO currently only works with one destination
     # Determine destination file based on arguments
     if not args.output and not args.directory and not os.isatty(1):
         return [sys.stdout]
-    dest_candidates = [
-        args.output,  # --output
-        args.directory + "/" + os.path.basename(template)  # --directory
-        if args.directory
-        else None,
-        os.path.basename(template),  # neither, use local path
-    ]
-    dest = next(x for x in dest_candidates if x)
-    return [dest]
+    if args.output:  # --output
+        return [args.output]
+    if args.directory:  # --directory
+        return [
+            directory + "/" + os.path.basename(template)
+            for directory in args.directory
+        ]
+    return [os.path.basename(template)]  # neither, use local path
 
 
 def pre_hooks(dest):
@@ -60,41 +87,135 @@ def pre_hooks(dest):
 def cmd(args):
     """Execute this subcommand."""
 
+    if args.destinations_from:
+        args.directory = _read_destinations(args.destinations_from)
     if args.output:
         _verify_output_option(args)
     if args.directory:
         _verify_directory_option(args)
+    if args.checksum:
+        args.update = True
+    if args.update and args.symlink:
+        raise errors.TemError("options --update and --symlink are exclusive")
 
-    edit_files = []  # Files that will be edited if --edit[or] was provided
+    # Templates are looked up only once, for all destinations
+    sources = []
     for template in args.templates:
-        exists = False  # Indicates that file exists in at least one repo
-        for src in repo.find_template(template, repos=args.repo):
-            exists = True
-            destinations = destinations_from_args(args, template)
-            if args.edit or args.editor:
-                edit_files.append(destinations)
-
-            for dest in destinations:
-                # If template is a directory, run pre hooks
-                if os.path.isdir(src):
-                    pre_hooks(dest)
-                if dest == "-":
-                    util.cat(src)
-                else:
-                    util.copy(src, dest, symlink=args.symlink)
-                # If template is a directory, run post hooks
-                if os.path.isdir(src):
-                    cli.run_hooks("put.post", src)
-
-        if not exists:
+        found = list(_find_template(template, args.repo))
+        if not found:
             raise errors.TemplateNotFoundError(template)
-    if edit_files:
+        sources += [(template, src, matcher) for src, matcher in found]
+
+    # Each destination is handled by a single worker, so that templates that
+    # go to the same destination don't interfere with each other
+    puts_by_destination = {}
+    for template, src, matcher in sources:
+        for i, dest in enumerate(destinations_from_args(args, template)):
+            puts_by_destination.setdefault(i, []).append((src, dest, matcher))
+
+    edit_files = []  # Files that will be edited if --edit[or] was provided
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(_put, args, puts)
+            for puts in puts_by_destination.values()
+        ]
+        # Results are reported as soon as each destination is done
+        for future in as_completed(futures):
+            for dest, report, exception in future.result():
+                if exception is not None:
+                    message = cli.exception_message(exception)
+                    cli.print_cli_err(f"{dest}: {message}")
+                    cli.exit_code = 1
+                    continue
+                if report is not None:
+                    cli.print_cli_info(f"{dest}: {report}")
+                if dest is not sys.stdout:
+                    edit_files.append(dest)
+    if edit_files and (args.edit or args.editor):
         cli.edit_files(edit_files, override_editor=args.editor)
 
 
+def _put(args, puts):
+    """
+    Put each template from ``puts`` to its destination. Return a report for
+    each destination.
+    """
+    results = []
+    for src, dest, matcher in puts:
+        report = None
+        try:
+            if dest == "-" or dest is sys.stdout:
+                # No hooks are run, since there is no destination directory
+                _stream(src, matcher)
+                results.append((dest, None, None))
+                continue
+            located = pack.locate(src)
+            is_dir = (
+                located[0].isdir(located[1])
+                if located is not None
+                else os.path.isdir(src)
+            )
+            # If template is a directory, run pre hooks
+            if is_dir:
+                pre_hooks(dest)
+            if args.update:
+                report = put_module.update(
+                    src,
+                    dest,
+                    checksum=args.checksum,
+                    ignore=matcher.filter,
+                )
+            elif located is not None:
+                if args.symlink:
+                    raise errors.TemError(
+                        f"cannot symlink to '{src}' inside a packed repository"
+                    )
+                packed, path = located
+                packed.extract(path, dest, ignore=matcher.filter)
+            else:
+                util.copy(
+                    src, dest, symlink=args.symlink, ignore=matcher.filter
+                )
+            # If template is a directory, run post hooks
+            if is_dir:
+                cli.run_hooks(
+                    "put.post",
+                    # The hooks of a packed template can only be run from
+                    # the copy that was just made
+                    src if located is None else dest,
+                    dest,
+                    environment={
+                        "TEM_TEMPLATE": src,
+                        "TEM_DEST": util.abspath(dest),
+                    },
+                )
+        except Exception as exception:  # pylint: disable=broad-except
+            results.append((dest, None, exception))
+        else:
+            results.append((dest, report, None))
+    return results
+
+
 # HELPER FUNCTIONS
 
 
+def _find_template(template, repos):
+    """
+    Find ``template`` in ``repos``, skipping ignored paths. Yield pairs of the
+    template path and the matcher for files that are ignored inside it.
+    """
+    exclude = ignore.config_patterns("put.exclude")
+    for rep in repos:
+        matcher = ignore.load(rep.abspath(), exclude)
+        for src in repo.find_template(template, repos=[rep]):
+            is_dir = None
+            if rep.is_packed():
+                packed, path = pack.locate(src)
+                is_dir = packed.isdir(path)
+            if not matcher.is_ignored(src, is_dir=is_dir):
+                yield src, matcher
+
+
 def _err_output_multiple_templates():
     cli.print_cli_err(
         """option -o/--output is allowed with multiple templates
@@ -103,6 +224,19 @@ def _err_output_multiple_templates():
     sys.exit(1)
 
 
+def _stream(src, matcher):
+    """Write template ``src`` to stdout."""
+    try:
+        put_module.stream(src, ignore=matcher.filter)
+    except BrokenPipeError:
+        # The reader has quit early, like `head` does. Further writes to
+        # stdout, including the flush at exit, would fail again.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        cli.exit_code = 1
+
+
 def _verify_output_option(args):
     """The `--output` option doesn't make sense for multiple files.
 
@@ -117,6 +251,27 @@ def _verify_output_option(args):
 
 
 def _verify_directory_option(args):
-    """Verify that the path exists and is not a directory."""
-    if os.path.exists(args.directory) and not os.path.isdir(args.directory):
-        raise errors.FileNotDirError(args.directory)
+    """Verify that the paths exist and are not directories."""
+    for directory in args.directory:
+        if os.path.exists(directory) and not os.path.isdir(directory):
+            raise errors.FileNotDirError(directory)
+
+
+def _read_destinations(path):
+    """
+    Read NUL-separated destinations from the file at ``path``, or from stdin
+    if ``path`` is '-'. If there are no NUL characters, destinations are
+    separated by newlines.
+    """
+    if path == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    separator = b"\0" if b"\0" in data else b"\n"
+    return [
+        os.fsdecode(destination)
+        for destination in data.split(separator)
+        if destination
+    ]
+
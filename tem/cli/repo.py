@@ -2,7 +2,8 @@
 import os
 import sys
 
-from tem import config, util, errors, repo as repo_module
+from tem import config, util, errors, ignore, pack, store
+from tem import repo as repo_module
 from tem.cli import common as cli
 from tem.cli import config as config_cli
 
@@ -23,6 +24,18 @@ def setup_parser(parser):
         "-p", "--path", action="store_true", help="print the repository path"
     )
 
+    parser.add_argument(
+        "-P",
+        "--pack",
+        action="store_true",
+        help="pack REPOSITORIES into single files, or refresh their packs",
+    )
+    parser.add_argument(
+        "--gc",
+        action="store_true",
+        help="remove objects that no repository uses from the store",
+    )
+
     add_rem = parser.add_mutually_exclusive_group()
     add_rem.add_argument(
         "-a",
@@ -117,9 +130,47 @@ def remove_from_path(remove_repos):
     )
 
 
+def pack_repos(repo_ids):
+    """Build or refresh the packs of the repositories in ``repo_ids``."""
+    if not repo_ids:
+        raise errors.TemError("option --pack requires REPOSITORIES")
+    for repo_id in repo_ids:
+        directory = Repo.from_id(repo_id).abspath()
+        if not os.path.isdir(directory):
+            raise errors.RepoDoesNotExistError(directory)
+        matcher = ignore.load(directory)
+        internal = os.path.join(directory, ".tem")
+
+        def ignored(root, names, matcher=matcher, internal=internal):
+            result = matcher.filter(root, names)
+            if root == internal and ".internal" in names:
+                result.append(".internal")
+            return result
+
+        path, rewritten = pack.build(directory, ignore=ignored)
+        print(path)
+        if not rewritten:
+            cli.print_cli_info(f"{path}: up to date")
+
+
+def collect_garbage():
+    """Remove the unused objects from the configured store."""
+    object_store = store.from_config()
+    if object_store is None:
+        raise errors.TemError("no store is configured (see store.path)")
+    removed, freed = object_store.gc()
+    cli.print_cli_info(f"removed {removed} objects, freed {freed} bytes")
+
+
 @cli.subcommand
 def cmd(args):
     """Execute this subcommand."""
+    if args.gc:
+        collect_garbage()
+        return
+    if args.pack:
+        pack_repos(args.repositories)
+        return
     if args.add or args.remove:
         user_cfg_path = config.user_default_path()
         if user_cfg_path:
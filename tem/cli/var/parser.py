@@ -4,7 +4,7 @@ import sys
 from argparse import ArgumentParser
 from typing import Iterable, List
 
-from tem import env, var, context
+from tem import var, context
 from tem.cli import common as cli
 from tem.errors import TemError, TemVariableValueError
 from tem.fs import TemDir
@@ -15,6 +15,7 @@ from .util import (
     print_default_and_old_value,
     print_name_value,
     print_all_values,
+    print_doc,
 )
 
 #: Variable container to which most operations in this module are applied.
@@ -265,15 +266,26 @@ def edit_defaults():
         print_all_values(var.load(defaults=True), verbosity=args.verbosity)
 
 
+def list_variables():
+    """Print the names of all defined variables."""
+    args = cli.args()
+    for name, variable in var.load(defaults=True, lazy=True).__dict__.items():
+        print(name)
+        if args.verbosity:
+            print_doc(variable)
+
+
 @cli.subcommand
 def cmd(args):
     """Execute this subcommand."""
-    with env.Environment():
+    with context.env:
 
         defaults = args.defaults and not args.reset
         global var_container
         if not args.reset:
-            var_container = var.load(defaults=defaults, override_env=False)
+            var_container = var.load(
+                defaults=defaults, override_env=False, lazy=True
+            )
 
         # Handle conflicting/ineffectual option combinations
         if args.query and (args.edit or args.editor):
@@ -294,7 +306,9 @@ def cmd(args):
             edit_defaults()
             return
 
-        if args.query:
+        if args.list:
+            list_variables()
+        elif args.query:
             process_query_expressions()
         elif args.reset:
             reset_to_defaults()
@@ -0,0 +1,89 @@
+"""tem watch subcommand"""
+import os
+import sys
+import time
+
+from tem import errors, watch
+from tem.config import cfg
+from tem.cli import common as cli
+
+
+def setup_parser(parser):
+    """Set up argument parser for this subcommand."""
+    cli.add_general_options(parser)
+
+    action_opts = parser.add_mutually_exclusive_group()
+    action_opts.add_argument(
+        "-s",
+        "--status",
+        action="store_true",
+        help="show the watcher and the directories it watches",
+    )
+    action_opts.add_argument(
+        "-k", "--stop", action="store_true", help="stop the watcher"
+    )
+    action_opts.add_argument(
+        "-f",
+        "--foreground",
+        action="store_true",
+        help="watch in the foreground instead of starting a watcher",
+    )
+    parser.add_argument(
+        "dirs",
+        metavar="DIR",
+        nargs="*",
+        help="temdirs to watch in addition to the repositories",
+    )
+
+
+@cli.subcommand
+def cmd(args):
+    """Execute this subcommand."""
+    if args.status:
+        _print_status()
+        return
+    if args.stop:
+        if not watch.stop():
+            cli.print_err("no watcher is running")
+            cli.exit_code = 1
+        return
+
+    if not sys.platform.startswith("linux"):
+        raise errors.TemError("watching requires Linux")
+    roots = [repo.abspath() for repo in args.repo]
+    roots += cfg["watch.dirs"].split()
+    roots += args.dirs
+    roots = list(
+        dict.fromkeys(
+            os.path.abspath(os.path.expanduser(root))
+            for root in roots
+            if os.path.exists(os.path.expanduser(root))
+        )
+    )
+    if args.foreground:
+        if watch.is_alive():
+            raise errors.TemError("a watcher is already running")
+        watch.Watcher(roots).run()
+        return
+    # A running watcher is replaced, so that it watches the current roots
+    watch.stop()
+    watch.spawn(roots)
+    deadline = time.monotonic() + 5
+    while not watch.is_alive():
+        if time.monotonic() >= deadline:
+            raise errors.TemError("the watcher failed to start")
+        time.sleep(0.01)
+
+
+def _print_status():
+    state = watch.state()
+    if state is None:
+        cli.print_err("no watcher is running")
+        cli.exit_code = 1
+        return
+    print(f"watcher running with pid {state['pid']}")
+    for root, generation in state["roots"].items():
+        if generation is None:
+            print(f"  {root} (not watched)")
+        else:
+            print(f"  {root}")
@@ -0,0 +1,371 @@
+"""
+Shell completion.
+
+Shells complete the arguments of tem by running::
+
+    tem __complete WORD...
+
+where the words are those of the command line after `tem`, up to the
+cursor. The last word is the one being completed, and it's empty if the
+cursor is after a space. The candidates are printed one per line, each
+optionally followed by a tab and a description. If tem has nothing to offer
+for the word, it exits with status 1, and the shell falls back to completing
+file names.
+
+Completion runs on every press of the tab key, so it skips the argument
+parsers and everything else that tem normally sets up, and answers from
+candidate lists that are kept in the cache (see :mod:`tem.cache`):
+
+- templates of each repository come from the index of :mod:`tem.search`,
+  which is refreshed incrementally
+- names of repositories are cached until the `.tem/repo` file of one of the
+  repositories changes
+- names of variables, and the values allowed by `var_type` lists, are cached
+  for each `vars.py` file until it changes
+
+Scripts that hook this into fish, bash and zsh are generated by running this
+module::
+
+    python -m tem.completion fish > ~/.config/fish/completions/tem.fish
+"""
+import bisect
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tem import cache, config, repo
+
+__all__ = [
+    "SUBCOMMANDS",
+    "complete",
+    "main",
+    "repo_names",
+    "requested",
+    "script",
+    "templates",
+    "variables",
+]
+
+#: Subcommands and their descriptions, as listed by `tem --help`
+SUBCOMMANDS = {
+    "add": "add templates to a repository",
+    "rm": "remove templates from a repository",
+    "put": "put templates into a desired directory",
+    "ls": "list templates",
+    "repo": "perform actions on tem repositories",
+    "config": "get and set configuration options",
+    "init": "generate a .tem/ directory",
+    "env": "run or modify local environments",
+    "path": "run or modify the local path",
+    "git": "use environments versioned under git",
+    "hook": "run or modify command hooks",
+    "find": "find anything tem-related",
+    "var": "manipulate tem variants",
+    "run": "run programs in a tem-aware way",
+    "watch": "keep caches valid by watching for changes",
+    "cache": "inspect and trim the on-disk cache",
+}
+#: Options that take a value, and the kind of candidates for the value
+_OPTION_VALUES = {
+    "-R": "repos",
+    "--repo": "repos",
+    "-R!": "repos",
+    "-c": None,
+    "--config": None,
+    "-E": None,
+    "--editor": None,
+    "-g": None,
+    "--grep": None,
+    "-j": None,
+    "--jobs": None,
+    "--max-size": None,
+}
+#: Subcommands whose positional arguments are templates
+_TEMPLATE_SUBCOMMANDS = {"put", "ls", "find", "rm"}
+#: Actions of `tem cache`
+_CACHE_ACTIONS = {
+    "stats": "show statistics",
+    "prune": "evict entries beyond the size limit",
+    "clear": "remove entries",
+}
+
+Candidates = List[Tuple[str, str]]
+
+
+def complete(words: List[str]) -> Optional[Candidates]:
+    """
+    Return the candidates for completing the last of ``words``, as pairs of
+    a candidate and its description. Return ``None`` if tem doesn't know
+    what the word should be.
+    """
+    words = words or [""]
+    current = words[-1]
+    subcommand = None
+    repo_args = []
+    config_args = []
+    i = 0
+    while i < len(words) - 1:
+        word = words[i]
+        if word in _OPTION_VALUES:
+            i += 1
+            if word in ("-c", "--config"):
+                config_args.append(words[i])
+            elif word in ("-R", "--repo"):
+                repo_args.append(words[i])
+        elif not word.startswith("-") and subcommand is None:
+            subcommand = word
+        i += 1
+    previous = words[-2] if len(words) > 1 else None
+
+    if previous in _OPTION_VALUES:
+        if _OPTION_VALUES[previous] != "repos":
+            return None
+        _load_config(config_args)
+        return _matching(repo_names(), current)
+    if current.startswith("-"):
+        return None
+    if subcommand is None:
+        return _matching(SUBCOMMANDS.items(), current)
+    _load_config(config_args)
+    repos = _repos(repo_args)
+    if subcommand in _TEMPLATE_SUBCOMMANDS:
+        return templates(repos, current)
+    if subcommand == "repo":
+        return _matching(repo_names(), current)
+    if subcommand == "var":
+        return _variable_candidates(current)
+    if subcommand == "cache":
+        return _matching(_CACHE_ACTIONS.items(), current)
+    return None
+
+
+def repo_names(repos: Iterable[repo.Repo] = None) -> Dict[str, str]:
+    """
+    Return the names of ``repos``, which default to the repositories in
+    `REPO_PATH`, along with their paths.
+    """
+    paths = [repo.Repo(r).abspath() for r in (repos or repo.lookup_path)]
+    key = "repos\n" + "\n".join(paths)
+    names = cache.default().get("completion", key)
+    if names is None:
+        deps = cache.dependencies(f"{path}/.tem/repo" for path in paths)
+        names = {}
+        for path in paths:
+            names.setdefault(repo.Repo(path).name(), path)
+        cache.default().set("completion", key, names, deps)
+    return names
+
+
+def templates(repos: Iterable[repo.Repo], prefix: str) -> Candidates:
+    """
+    Return the templates in ``repos`` that start with ``prefix``, completed
+    up to the next `/`. Directories end with `/`, and the description of
+    each template is the name of its repository.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from tem import search
+
+    base = prefix[: prefix.rfind("/") + 1]
+    candidates: Dict[str, str] = {}
+    for r in repos:
+        try:
+            paths = search.load(r).paths
+        except (OSError, ValueError):
+            continue
+        name = r.name()
+        i = bisect.bisect_left(paths, prefix)
+        while i < len(paths) and paths[i].startswith(prefix):
+            component, slash, _ = paths[i][len(base) :].partition("/")
+            candidates.setdefault(base + component + slash, name)
+            i += 1
+    # Directories are listed along with their contents
+    return [
+        (path, name)
+        for path, name in candidates.items()
+        if path + "/" not in candidates
+    ]
+
+
+def variables(directory: str = None) -> Dict[str, dict]:
+    """
+    Return the variables defined in the temdirs above ``directory``, which
+    defaults to the working directory. Each variable has a ``doc`` and a
+    list of allowed ``values``, which is empty if any value of the right
+    type is allowed.
+    """
+    result = {}
+    directory = os.path.abspath(directory or os.getcwd())
+    while True:
+        vars_path = os.path.join(directory, ".tem", "vars.py")
+        if os.path.isfile(vars_path):
+            for name, variable in _file_variables(vars_path).items():
+                result.setdefault(name, variable)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return result
+        directory = parent
+
+
+def script(shell: str) -> str:
+    """
+    Return the script that hooks completion into ``shell``: `fish`, `bash`
+    or `zsh`.
+    """
+    if shell not in _SCRIPTS:
+        raise ValueError(f"unsupported shell '{shell}'")
+    return _SCRIPTS[shell]
+
+
+def requested(argv: List[str]) -> bool:
+    """Test if the arguments ``argv`` of tem ask for completion."""
+    i = 0
+    # The development script puts a --config option in front
+    while i + 1 < len(argv) and argv[i] in ("-c", "--config"):
+        i += 2
+    return argv[i : i + 1] == ["__complete"]
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Print the candidates for the command line ``argv``, which contains the
+    arguments of tem. Return the exit status.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    start = argv.index("__complete")
+    config_args = []
+    for i in range(0, start, 2):
+        config_args += [argv[i], argv[i + 1]]
+    candidates = complete(config_args + argv[start + 1 :])
+    if not candidates:
+        return 1
+    for candidate, description in candidates:
+        print(f"{candidate}\t{description}" if description else candidate)
+    return 0
+
+
+def _load_config(config_args: List[str]):
+    paths = config.SYSTEM_PATHS + config.USER_PATHS + config_args
+    config.load([path for path in paths if path])
+
+
+def _repos(repo_args: List[str]) -> List[repo.Repo]:
+    if not repo_args:
+        return [repo.Repo(r) for r in repo.lookup_path]
+    repos = [repo.Repo.from_id(arg) for arg in repo_args]
+    return [r for r in repos if r.path is not None]
+
+
+def _matching(candidates, prefix: str) -> Candidates:
+    if isinstance(candidates, dict):
+        candidates = candidates.items()
+    return [(c, d) for c, d in candidates if c.startswith(prefix)]
+
+
+def _variable_candidates(current: str) -> Candidates:
+    defined = variables()
+    name, equals, _ = current.partition("=")
+    if not equals:
+        return [
+            (f"{name}=" if variable["values"] else name, variable["doc"])
+            for name, variable in defined.items()
+            if name.startswith(current)
+        ]
+    if name not in defined:
+        return None
+    return _matching(
+        ((f"{name}={value}", "") for value in defined[name]["values"]),
+        current,
+    )
+
+
+def _file_variables(vars_path: str) -> Dict[str, dict]:
+    """Return the variables defined in the `vars.py` file at ``vars_path``."""
+    variables_ = cache.default().get("completion", "vars\n" + vars_path)
+    if variables_ is None:
+        # pylint: disable-next=import-outside-toplevel
+        from tem import var
+
+        deps = cache.dependencies([vars_path])
+        variables_ = {}
+        # Completion must never execute `vars.py`, so only variables that
+        # are defined declaratively are offered
+        definitions = var.static_definitions(vars_path) or {}
+        for name, variable in definitions.items():
+            values = variable.var_type
+            if values is bool:
+                values = ["true", "false"]
+            variables_[name] = {
+                "doc": variable.doc.description or "",
+                "values": (
+                    [str(value) for value in values]
+                    if isinstance(values, list)
+                    else []
+                ),
+            }
+        cache.default().set(
+            "completion", "vars\n" + vars_path, variables_, deps
+        )
+    return variables_
+
+
+_FISH_SCRIPT = r"""# fish completion for tem (python -m tem.completion fish)
+function __tem_complete
+    set -l tokens (commandline -opc) (commandline -ct)
+    tem __complete $tokens[2..-1] 2>/dev/null
+    or __fish_complete_path (commandline -ct)
+end
+
+complete -c tem -f -a '(__tem_complete)'
+"""
+
+_BASH_SCRIPT = r"""# bash completion for tem (python -m tem.completion bash)
+_tem() {
+    local line=${COMP_LINE:0:COMP_POINT}
+    local cur=${COMP_WORDS[COMP_CWORD]}
+    local -a words
+    read -ra words <<< "$line"
+    [[ $line == *[[:space:]] ]] && words+=("")
+    local candidates
+    candidates=$(tem __complete "${words[@]:1}" 2>/dev/null) || return
+    local IFS=$'\n'
+    COMPREPLY=($(cut -f1 <<< "$candidates"))
+    # Bash completes only the part of the word after a '=' or ':'
+    local word=${words[${#words[@]}-1]}
+    COMPREPLY=("${COMPREPLY[@]#"${word%"$cur"}"}")
+    if [[ ${#COMPREPLY[@]} -eq 1 && ${COMPREPLY[0]} == */ ]]; then
+        compopt -o nospace
+    fi
+}
+
+complete -o default -F _tem tem
+"""
+
+_ZSH_SCRIPT = r"""#compdef tem
+# zsh completion for tem (python -m tem.completion zsh)
+_tem() {
+    local -a candidates names
+    local line output
+    output=$(tem __complete "${(@)words[2,CURRENT]}" 2>/dev/null)
+    if (( $? )); then
+        _files
+        return
+    fi
+    candidates=("${(@f)output}")
+    for line in "${candidates[@]}"; do
+        names+=("${line%%$'\t'*}")
+    done
+    # Directories are completed one level at a time
+    compadd -S '' -- ${(M)names:#*/}
+    compadd -- ${names:#*/}
+}
+
+_tem "$@"
+"""
+
+_SCRIPTS = {"fish": _FISH_SCRIPT, "bash": _BASH_SCRIPT, "zsh": _ZSH_SCRIPT}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in _SCRIPTS:
+        sys.exit(f"usage: python -m tem.completion {{{','.join(_SCRIPTS)}}}")
+    print(script(sys.argv[1]), end="")
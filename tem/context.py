@@ -22,6 +22,7 @@ Examples
 
 """
 import enum
+import os
 import sys
 import types
 from contextvars import ContextVar
@@ -50,6 +51,9 @@ class Runtime(enum.Enum):
 
 _runtime = ContextVar("_context", default=Runtime.PYTHON)
 _env = ContextVar("_context_env", default=None)
+# Environment used when none is active, along with the (cwd, pid) pair it
+# was created for
+_default_env = None
 
 runtime: Runtime
 env: Environment
@@ -64,7 +68,39 @@ class __ContextModule(types.ModuleType):
     @property
     def env(self):
         """Get the environment of the active context."""
-        return _env.get() or Environment()
+        global _default_env  # pylint: disable=global-statement
+
+        env_ = _env.get()
+        if env_ is not None:
+            return env_
+        # The hierarchy is walked only once per working directory and process,
+        # as long as none of the temdirs it found has been removed
+        key = (os.getcwd(), os.getpid())
+        if (
+            _default_env is None
+            or _default_env[0] != key
+            or not all(
+                os.path.isdir(envdir / ".tem")
+                for envdir in _default_env[1].envdirs
+            )
+        ):
+            _default_env = (key, Environment())
+        return _default_env[1]
+
+
+def invalidate():
+    """
+    Discard the memoized default environment, i.e. the environment that
+    :attr:`env` returns when no environment has been set explicitly.
+
+    The default environment is reconstructed automatically when the working
+    directory changes, or when one of its temdirs is removed. This function
+    must be called when a temdir is created elsewhere in the hierarchy.
+    :meth:`TemDir.init<tem.fs.TemDir.init>` calls it automatically.
+    """
+    global _default_env  # pylint: disable=global-statement
+
+    _default_env = None
 
 
 sys.modules[__name__].__class__ = __ContextModule
@@ -4,16 +4,18 @@ import os
 import pathlib
 import re
 import subprocess
+from contextlib import contextmanager
 from functools import cached_property
 from itertools import islice
-from typing import Iterator, List, Type, Union, overload
+from typing import Dict, Iterator, List, Optional, Type, Union, overload
 
 from tem import find
-from tem.fs import AnyPath, TemDir
+from tem.errors import NoTemDirInHierarchy
+from tem.fs import AnyPath, TemDir, iterate_hierarchy
 from tem.shell import commands as shell_commands
 from . import vars
 
-__all__ = ["Environment", "ExecPath", "ExecutableLookup"]
+__all__ = ["Environment", "EnvironmentBatch", "ExecPath", "ExecutableLookup"]
 
 
 class Environment:
@@ -36,6 +38,16 @@ class Environment:
             self._envdirs: List[TemDir] = [basedir]
 
         self._path = []
+        self._context_reset_tokens = []
+
+    @classmethod
+    def _from_envdirs(cls, envdirs: List[TemDir]) -> "Environment":
+        """Create an environment of ``envdirs`` without looking them up."""
+        environment = cls.__new__(cls)
+        environment._envdirs = envdirs
+        environment._path = []
+        environment._context_reset_tokens = []
+        return environment
 
     @property
     def envdirs(self) -> List[TemDir]:
@@ -80,15 +92,10 @@ class Environment:
         ``os.environ["PATH"]`` would have after exporting this environment.
         """
         new_paths = [
-            os.path.realpath(os.path.join(path, ".tem", "path"))
+            _realpath(os.path.join(path, ".tem", "path"))
             for path in self.envdirs
         ]
-        execpath = [
-            path
-            for path in ExecPath()
-            if os.path.realpath(path) not in new_paths
-        ]
-        return ExecPath(new_paths + execpath)
+        return ExecPath(new_paths + ExecPath().without(new_paths))
 
     @cached_property
     def is_exported(self) -> bool:
@@ -110,6 +117,8 @@ class Environment:
         vars.exported_environment.value = os.pathsep.join(
             map(str, self.envdirs)
         )
+        # Don't let a memoized environment report a stale value
+        self.__dict__.pop("is_exported", None)
 
     def execute(self):
         """
@@ -126,15 +135,86 @@ class Environment:
     def __enter__(self):
         from tem import context  # pylint: disable=import-outside-toplevel
 
-        # pylint: disable-next=attribute-defined-outside-init
-        self._context_reset_token = context._env.set(self)
+        # The same (e.g. memoized) environment can be entered multiple times
+        self._context_reset_tokens.append(context._env.set(self))
         if not self.is_exported:
             self.export()
 
     def __exit__(self, _1, _2, _3):
         from tem import context  # pylint: disable=import-outside-toplevel
 
-        context._env.reset(self._context_reset_token)
+        context._env.reset(self._context_reset_tokens.pop())
+
+
+class EnvironmentBatch:
+    """
+    Builder of the environments of many directories.
+
+    The environment of each directory is that of its nearest temdir, like
+    the environment of the working directory is. Directories of a batch
+    usually share most of their parent temdirs, so each directory in the
+    hierarchy is checked for a `.tem` subdirectory only once, and the parent
+    temdirs of each temdir are looked up only once. The cost of a batch grows
+    with the number of distinct directories and temdirs, not with the number
+    of directories times their depth.
+
+    Parameters
+    ----------
+    recursive
+        Determines if all parent temdirs should partake in the environments.
+    """
+
+    def __init__(self, recursive: bool = True):
+        self.recursive = recursive
+        #: Nearest temdir of each directory that was looked up
+        self._basedirs: Dict[str, Optional[TemDir]] = {}
+        #: Envdirs of each temdir that was looked up
+        self._envdirs: Dict[str, List[TemDir]] = {}
+
+    def environment(self, directory: AnyPath) -> Environment:
+        """
+        Return the environment of ``directory``. Environments share their
+        :attr:`Environment.envdirs` objects with other environments of the
+        batch, so they must not be modified.
+
+        Raises
+        ------
+        NoTemDirInHierarchy
+            If neither ``directory`` nor any of its parents is a temdir.
+        """
+        basedir = self._basedir(directory)
+        if basedir is None:
+            raise NoTemDirInHierarchy(os.path.abspath(directory))
+        # pylint: disable-next=protected-access
+        return Environment._from_envdirs(self._envdirs_of(basedir))
+
+    def _basedir(self, directory: AnyPath) -> Optional[TemDir]:
+        """Return the nearest temdir of ``directory``."""
+        visited = []
+        basedir = None
+        for path in map(str, iterate_hierarchy(directory)):
+            if path in self._basedirs:
+                basedir = self._basedirs[path]
+                break
+            visited.append(path)
+            if os.path.exists(os.path.join(path, ".tem")):
+                basedir = TemDir(path)
+                break
+        for path in visited:
+            self._basedirs[path] = basedir
+        return basedir
+
+    def _envdirs_of(self, temdir: TemDir) -> List[TemDir]:
+        envdirs = self._envdirs.get(str(temdir))
+        if envdirs is None:
+            envdirs = [temdir]
+            parent = os.path.dirname(temdir)
+            if self.recursive and parent != str(temdir):
+                parent_temdir = self._basedir(parent)
+                if parent_temdir is not None:
+                    envdirs += self._envdirs_of(parent_temdir)
+            self._envdirs[str(temdir)] = envdirs
+        return envdirs
 
 
 class ExecPath(list):
@@ -193,6 +273,7 @@ class ExecPath(list):
             )
 
         self.auto_export = auto_export
+        self._transaction = None
 
     @overload
     def __getitem__(self, item: str) -> "ExecutableLookup":
@@ -228,20 +309,65 @@ class ExecPath(list):
                 ]
             )
         elif item == self.NO_TEM_ENV:
+            exported_envdirs = (
+                vars.exported_environment.value.split(os.pathsep)
+                if vars.exported_environment.value
+                else []
+            )
             return ExecPath(
-                str(self).replace(vars.exported_environment.value + ":", "", 1)
+                self.without(
+                    [
+                        _realpath(os.path.join(envdir, ".tem", "path"))
+                        for envdir in exported_envdirs
+                    ]
+                )
             )
         else:
             raise TypeError("index has invalid type")
 
     def __setitem__(self, key: Union[int, slice], value: AnyPath):
         super().__setitem__(key, value)
-        if self.auto_export:
-            os.environ["PATH"] = str(self)
+        self._changed()
 
     def __delitem__(self, key: Union[int, slice]):
         super().__delitem__(key)
-        if self.auto_export:
+        self._changed()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager that defers automatic exports until the end of the
+        outermost transaction, so that multiple changes result in a single
+        export. If an exception is raised inside the transaction, all changes
+        made inside it are reverted.
+
+        Example
+        -------
+        >>> execpath = ExecPath()
+        >>> with execpath.transaction():
+        >>>     del execpath[0]
+        >>>     execpath[0] = "/bin"
+        # os.environ["PATH"] is updated only once, here
+        """
+        if self._transaction is not None:  # Nested transaction
+            yield self
+            return
+        self._transaction = {"snapshot": list(self), "changed": False}
+        try:
+            yield self
+        except BaseException:
+            super().__setitem__(slice(None), self._transaction["snapshot"])
+            raise
+        else:
+            if self._transaction["changed"] and self.auto_export:
+                os.environ["PATH"] = str(self)
+        finally:
+            self._transaction = None
+
+    def _changed(self):
+        if self._transaction is not None:
+            self._transaction["changed"] = True
+        elif self.auto_export:
             os.environ["PATH"] = str(self)
 
     # pylint: disable-next=useless-super-delegation
@@ -264,17 +390,58 @@ class ExecPath(list):
         """Remove duplicate paths."""
         return ExecPath(list(dict.fromkeys(self).keys()))
 
-    def export(self):
+    def without(self, tem_paths: List[str]) -> List[str]:
+        """
+        Return the entries that don't resolve to any of ``tem_paths``, which
+        must be resolved paths to `.tem/path` directories.
+
+        Only entries that end in `.tem/path` are resolved, and the results are
+        cached, so the cost doesn't grow with the number of other entries.
+        """
+        tem_paths = set(tem_paths)
+        return [
+            path
+            for path in self
+            if not (
+                path in tem_paths
+                or (path.endswith(_TEM_PATH) and _realpath(path) in tem_paths)
+            )
+        ]
+
+    def export(self, diff=True):
         """
         Export to ``os.environ["PATH"]``. If the current context is
         :data:`~tem.context.Runtime.SHELL`, the environment variable will be
         exported to the shell also.
+
+        Parameters
+        ----------
+        diff
+            Instead of exporting the whole value to the shell, only remove the
+            leading entries that changed and prepend the new ones. The
+            remaining entries are left untouched.
         """
         from tem import context  # pylint: disable=import-outside-toplevel
 
+        old_paths = os.environ.get("PATH", "").split(os.pathsep)
         value = str(self)
         os.environ["PATH"] = value
-        if context.runtime == context.Runtime.SHELL:
+        if context.runtime != context.Runtime.SHELL:
+            return
+
+        # Tem only ever changes the beginning of PATH, so the old and new
+        # values usually share a long suffix
+        common = 0
+        for old, new in zip(reversed(old_paths), reversed(self)):
+            if old != new:
+                break
+            common += 1
+        if diff and common:
+            shell_commands.update_path(
+                remove=old_paths[: len(old_paths) - common],
+                prepend=[str(path) for path in self[: len(self) - common]],
+            )
+        else:
             shell_commands.export("PATH", value)
 
     @staticmethod
@@ -282,6 +449,15 @@ class ExecPath(list):
         return [os.path.abspath(path) for path in paths]
 
 
+#: Suffix of PATH entries that point to `.tem/path` directories
+_TEM_PATH = os.sep + os.path.join(".tem", "path")
+
+
+@functools.lru_cache(maxsize=1024)
+def _realpath(path: str) -> str:
+    return os.path.realpath(path)
+
+
 class ExecutableLookup:
     """
     Lookup for an executable with a specified name.
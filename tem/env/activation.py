@@ -0,0 +1,298 @@
+"""
+Precompiled activation scripts for tem environments.
+
+An activation script does, in the native language of a shell, what
+:meth:`Environment.execute<tem.env.Environment.execute>` does through a
+python process:
+
+- the `.tem/path` directories of the environment are prepended to `PATH`
+- tem variables with a :attr:`~tem.var.Variable.to_env` attribute are
+  exported
+- the scripts from `.tem/env/@<shell>` of each envdir are sourced, from the
+  root to the base of the environment
+
+The script is stored under `.tem/.internal/activate/` in the base temdir of
+the environment, so that a shell plugin can find it without running tem.
+Before doing anything, the script verifies using only shell builtins that
+none of its inputs have changed since it was compiled. The inputs are files,
+and the environment variables that exported tem variables are read from
+(see :attr:`~tem.var.Variable.from_env`). If they have changed, the script
+returns a non-zero status and the shell plugin is expected to recompile it
+using `tem env --compile`.
+
+The shell plugins are not part of this repository, and nothing in it
+sources the scripts yet.
+
+Examples
+--------
+A shell plugin can enter the environment of ``$dir`` (fish syntax)::
+
+    source $dir/.tem/.internal/activate/activate.fish
+    or source (tem env --compile --root $dir)
+"""
+import glob
+import hashlib
+import os
+import pathlib
+import shlex
+from typing import Dict, List, Optional, Tuple
+
+from tem import var
+from tem.fs import TemDir
+from tem.shell import Shell
+
+from . import Environment, vars as env_vars
+
+__all__ = ["compile_script", "script_path"]
+
+#: Name of the line in the script header that holds the fingerprint
+_FINGERPRINT_PREFIX = "# tem fingerprint: "
+
+
+def script_path(temdir: TemDir, shell: Shell) -> pathlib.Path:
+    """Path to the activation script for ``shell`` in ``temdir``."""
+    # pylint: disable-next=protected-access
+    return pathlib.Path(temdir._internal, "activate", f"activate.{shell}")
+
+
+def compile_script(
+    environment: Environment, shell: Shell, force=False
+) -> pathlib.Path:
+    """
+    Compile the activation script of ``environment`` for ``shell``, and
+    return its path. If the script was already compiled from the same
+    inputs, it is not rewritten, unless ``force`` is ``True``.
+    """
+    # Creating the internal directory and loading variables can touch the
+    # inputs, so it must happen first
+    path = script_path(environment.basedir, shell)
+    os.makedirs(path.parent, exist_ok=True)
+    variables = var.load(environment)
+    activation = _activation(environment, shell, variables)
+    inputs, missing = _inputs(environment, shell)
+    env_inputs = _env_inputs(variables)
+    fingerprint = _fingerprint(inputs, missing, env_inputs, activation)
+
+    if not force:
+        try:
+            with open(path, encoding="utf-8") as f:
+                header = f.readline() + f.readline()
+            if f"{_FINGERPRINT_PREFIX}{fingerprint}\n" in header:
+                return path
+        except FileNotFoundError:
+            pass
+
+    guard = _guard(shell, inputs, missing, env_inputs)
+    if shell == Shell.FISH:
+        text = f"{guard}\n    return 1\nend\n{activation}"
+    else:
+        # `-nt` compares modification times with the script itself, the path
+        # of which can't be obtained portably. The script is never moved, so
+        # its path can be hardcoded.
+        text = (
+            f"__tem_script={_quote(shell, str(path))}\n"
+            f"if ! {{ {guard}; }}; then\n"
+            "    unset __tem_script\n"
+            "    return 1\n"
+            "fi\n"
+            "unset __tem_script\n"
+            f"{activation}"
+        )
+    text = (
+        "# Generated by 'tem env --compile'. Do not edit.\n"
+        f"{_FINGERPRINT_PREFIX}{fingerprint}\n"
+        f"{text}"
+    )
+
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _inputs(environment: Environment, shell: Shell) -> Tuple[List, List]:
+    """
+    Return the files that the activation script depends on, and the paths
+    that must not exist for the script to remain valid.
+    """
+    inputs = []
+    envdirs = {str(envdir) for envdir in environment.envdirs}
+    for envdir in environment.envdirs:
+        dot_tem = os.path.join(envdir, ".tem")
+        scripts_dir = os.path.join(dot_tem, "env", f"@{shell}")
+        inputs += [
+            dot_tem,
+            # Variable stores are created, and replaced, inside this directory
+            os.path.join(dot_tem, ".internal"),
+            os.path.join(dot_tem, "vars.py"),
+            scripts_dir,
+            *_env_scripts(scripts_dir),
+        ]
+    inputs = [path for path in inputs if os.path.exists(path)]
+
+    # A new temdir in the hierarchy would change the environment
+    missing = [
+        os.path.join(directory, ".tem")
+        for directory in _ancestors(environment.basedir)
+        if directory not in envdirs
+    ]
+    return inputs, missing
+
+
+def _env_inputs(variables) -> Dict[str, Optional[str]]:
+    """
+    Return the environment variables that the values of exported tem
+    variables may be taken from, with their current values, or ``None`` if
+    they are not set.
+    """
+    return {
+        variables[name].from_env: os.environ.get(variables[name].from_env)
+        for name in variables
+        if variables[name].to_env and variables[name].from_env
+    }
+
+
+def _ancestors(directory) -> List[str]:
+    directories = [os.path.abspath(directory)]
+    while directories[-1] != os.path.dirname(directories[-1]):
+        directories.append(os.path.dirname(directories[-1]))
+    return directories
+
+
+def _env_scripts(scripts_dir: str) -> List[str]:
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(glob.escape(scripts_dir), "*"))
+        if os.path.isfile(path)
+    )
+
+
+def _fingerprint(inputs, missing, env_inputs, activation) -> str:
+    """Hash everything that determines the contents of the script."""
+    digest = hashlib.sha256()
+    for path in inputs:
+        digest.update(f"{path}\0{os.stat(path).st_mtime_ns}\0".encode())
+    for path in missing:
+        digest.update(f"{path}\0".encode())
+    for name, value in env_inputs.items():
+        digest.update(f"{name}\0{value is None}\0{value or ''}\0".encode())
+    digest.update(activation.encode())
+    return digest.hexdigest()
+
+
+def _guard(shell: Shell, inputs, missing, env_inputs) -> str:
+    """
+    Shell condition that is true when all tem directories still exist, none
+    of the inputs are newer than the script, and the environment variables
+    in ``env_inputs`` still have the same values.
+    """
+    if shell == Shell.FISH:
+        conditions = ["set -l script_mtime (path mtime (status filename))"]
+        conditions += [
+            f"and test (path mtime {_quote(shell, path)}) -le $script_mtime"
+            for path in inputs
+        ]
+        conditions += [
+            f"and not test -e {_quote(shell, path)}" for path in missing
+        ]
+        for name, value in env_inputs.items():
+            if not name.isidentifier():
+                conditions.append("and false")
+            elif value is None:
+                conditions.append(f"and not set -q {name}")
+            else:
+                conditions.append(
+                    f"and set -q {name}; "
+                    f'and test "${name}" = {_quote(shell, value)}'
+                )
+        return "if not begin\n    " + "\n    ".join(conditions) + "\nend"
+
+    conditions = [
+        f'[ -e {path} ] && ! [ {path} -nt "$__tem_script" ]'
+        for path in (_quote(shell, path) for path in inputs)
+    ]
+    conditions += [f"! [ -e {_quote(shell, path)} ]" for path in missing]
+    for name, value in env_inputs.items():
+        if not name.isidentifier():
+            # The variable can't be read by the shell
+            conditions.append("false")
+        elif value is None:
+            conditions.append(f'[ -z "${{{name}+x}}" ]')
+        else:
+            conditions.append(
+                f'[ "${{{name}+x}}${{{name}-}}" = x{_quote(shell, value)} ]'
+            )
+    return " && ".join(conditions) or "true"
+
+
+def _activation(environment: Environment, shell: Shell, variables) -> str:
+    """The part of the script that activates the environment."""
+    lines = []
+    new_paths = [
+        os.path.realpath(os.path.join(envdir, ".tem", "path"))
+        for envdir in environment.envdirs
+    ]
+    exported_environment = os.pathsep.join(map(str, environment.envdirs))
+    exports = [(env_vars.exported_environment.name, exported_environment)]
+    exports += [
+        (variables[name].to_env, str(variables[name].value))
+        for name in variables
+        if variables[name].to_env
+    ]
+
+    if shell == Shell.FISH:
+        # Remove the new paths from PATH, then prepend them
+        new_paths = " ".join(_quote(shell, path) for path in new_paths)
+        lines.append(
+            "begin\n"
+            f"    set -l new_paths {new_paths}\n"
+            "    set -l path $PATH\n"
+            "    for p in $new_paths\n"
+            "        while set -l i (contains -i -- $p $path)\n"
+            "            set -e path[$i]\n"
+            "        end\n"
+            "    end\n"
+            "    set -gx PATH $new_paths $path\n"
+            "end"
+        )
+        lines += [
+            f"set -gx {name} {_quote(shell, value)}" for name, value in exports
+        ]
+        source = "source"
+    else:
+        # Remove the new paths from PATH, then prepend them
+        lines.append('__tem_path=":$PATH:"')
+        quoted_paths = " ".join(_quote(shell, f":{p}:") for p in new_paths)
+        lines.append(
+            f"for __tem_p in {quoted_paths}; do\n"
+            '    while [ "${__tem_path#*"$__tem_p"}" != "$__tem_path" ]; do\n'
+            '        __tem_path="${__tem_path%%"$__tem_p"*}:'
+            '${__tem_path#*"$__tem_p"}"\n'
+            "    done\n"
+            "done"
+        )
+        lines.append('__tem_path="${__tem_path#:}"')
+        lines.append('__tem_path="${__tem_path%:}"')
+        prefix = _quote(shell, os.pathsep.join(new_paths))
+        lines.append(f'export PATH={prefix}"${{__tem_path:+:$__tem_path}}"')
+        lines.append("unset __tem_path __tem_p")
+        lines += [
+            f"export {name}={_quote(shell, value)}" for name, value in exports
+        ]
+        source = "."
+
+    for envdir in reversed(environment.envdirs):
+        scripts_dir = os.path.join(envdir, ".tem", "env", f"@{shell}")
+        lines += [
+            f"{source} {_quote(shell, path)}"
+            for path in _env_scripts(scripts_dir)
+        ]
+    return "".join(f"{line}\n" for line in lines)
+
+
+def _quote(shell: Shell, value: str) -> str:
+    if shell == Shell.FISH:
+        value = value.replace("\\", "\\\\").replace("'", "\\'")
+        return f"'{value}'"
+    return shlex.quote(value)
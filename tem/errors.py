@@ -126,6 +126,21 @@ class TemLookupError(TemError):
         Exception.__init__(self, *args)
 
 
+class RepoUnreadableError(PathError):
+    """
+    A packed repository or an archive that can't be read. Note: the
+    arguments are the path to the repository and the reason.
+    """
+
+    def __init__(self, path: "tem.fs.AnyPath", reason):
+        super().__init__(path)
+        self.reason = str(reason)
+
+    def cli(self):
+        # The reason names the repository already
+        return f"can't use repository: {self.reason}"
+
+
 class RepoNotFoundError(TemLookupError):
     def __init__(self, repo_name):
         super().__init__(self)
@@ -147,6 +162,10 @@ class TemplateNotFoundError(TemError):
         )
 
 
+class GitError(TemError):
+    pass
+
+
 class NotARunnable(TemError):
     # pylint: disable-next=useless-super-delegation
     def __init__(self, path):
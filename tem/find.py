@@ -1,11 +1,14 @@
 """Find various tem-related stuff."""
 import functools
 import os
-from typing import Iterator
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
-from tem import fs
+from tem import fs, ignore
 from tem.errors import NotATemDirError
-from tem.fs import TemDir
+from tem.fs import AnyPath, TemDir
 
 
 def _default_cwd(func):
@@ -61,3 +64,117 @@ def basedir(path: os.PathLike = None):
 def rootdir(path=None):
     """Return the root temdir in the hierarchy that ``path`` belongs to."""
     return next(parent_temdirs(path))
+
+
+def temdirs_under(
+    path: AnyPath = None,
+    max_depth: Optional[int] = None,
+    jobs: Optional[int] = None,
+) -> Iterator[TemDir]:
+    """
+    Find temdirs under the directory at ``path``, including ``path`` itself.
+
+    Directories are scanned in parallel, and temdirs are yielded as soon as
+    they are found, in no particular order. Subdirectories that are ignored
+    by the `.tem/ignore` file of an enclosing temdir are not searched (see
+    :mod:`tem.ignore`), including temdirs above ``path``. Symbolic links to
+    directories are followed, except those that point back into the searched
+    tree or form a loop.
+
+    Parameters
+    ----------
+    path
+        Directory to search. Defaults to the current working directory.
+    max_depth
+        Search at most ``max_depth`` levels of subdirectories below ``path``.
+    jobs
+        Number of directories to scan concurrently.
+    """
+    root = os.path.abspath(path or os.getcwd())
+    real_root = os.path.realpath(root)
+    results: queue.Queue = queue.Queue()
+    lock = threading.Lock()
+    outstanding = 0
+    cancelled = False
+    followed_links = set()
+    done = object()  # Sentinel that marks the end of the search
+
+    def submit(directory, real_directory, depth, ignores):
+        nonlocal outstanding
+        with lock:
+            outstanding += 1
+        executor.submit(scan, directory, real_directory, depth, ignores)
+
+    def scan(directory, real_directory, depth, ignores):
+        nonlocal outstanding
+        try:
+            if not cancelled:
+                _scan(directory, real_directory, depth, ignores)
+        except OSError:
+            pass  # The directory can't be read or has disappeared
+        finally:
+            with lock:
+                outstanding -= 1
+                if outstanding == 0:
+                    results.put(done)
+
+    def _scan(directory, real_directory, depth, ignores):
+        with os.scandir(directory) as entries:
+            subdirs = [entry for entry in entries if _is_dir(entry)]
+        if any(entry.name == ".tem" for entry in subdirs):
+            results.put(directory)
+            if matcher := ignore.load(directory):
+                ignores = ignores + (matcher,)
+        if max_depth is not None and depth >= max_depth:
+            return
+        for entry in subdirs:
+            if entry.name == ".tem" or any(
+                matcher.match(entry.path, is_dir=True) for matcher in ignores
+            ):
+                continue
+            real_subdir = os.path.join(real_directory, entry.name)
+            if entry.is_symlink():
+                real_subdir = os.path.realpath(entry.path)
+                if not _can_follow(real_subdir, real_directory):
+                    continue
+                with lock:
+                    if real_subdir in followed_links:
+                        continue
+                    followed_links.add(real_subdir)
+            submit(entry.path, real_subdir, depth + 1, ignores)
+
+    def _can_follow(target, real_directory):
+        # Don't visit directories that the walk reaches anyway, and don't
+        # follow links back to an ancestor
+        return not _is_subpath(target, real_root) and not _is_subpath(
+            real_directory, target
+        )
+
+    # The results are the same as if the search started from the root temdir
+    parent = os.path.dirname(root)
+    ancestors = parent_temdirs(parent) if parent != root else ()
+    ignores = tuple(m for t in ancestors if (m := ignore.load(t)))
+    if any(matcher.is_ignored(root, is_dir=True) for matcher in ignores):
+        return
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        submit(root, real_root, 0, ignores)
+        while (result := results.get()) is not done:
+            yield TemDir(result)
+    finally:
+        cancelled = True
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _is_subpath(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(
+        directory.rstrip(os.sep) + os.sep
+    )
@@ -135,6 +135,8 @@ class TemDir(SystemPath):
         temdir: TemDir
             The newly initialized temdir at ``path``.
         """
+        from tem import context  # pylint: disable=import-outside-toplevel
+
         path = pathlib.Path(path)
         dot_tem = path / ".tem"
         # If temdir already exists, act according to the value of ``force``
@@ -143,12 +145,14 @@ class TemDir(SystemPath):
             # At this point, we know that .tem/ exists
             if force:
                 os.remove(dot_tem)
+                context.invalidate()
             else:
                 raise TemInitializedError(path)
             return temdir
 
         # Create directories
         os.makedirs(dot_tem, exist_ok=True)
+        context.invalidate()
         os.makedirs(dot_tem / "path", exist_ok=True)
         os.makedirs(dot_tem / "hooks", exist_ok=True)
         os.makedirs(dot_tem / "env", exist_ok=True)
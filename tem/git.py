@@ -0,0 +1,341 @@
+"""
+Fast access to git repositories.
+
+Refs are read directly from the git directory wherever possible, and objects
+are read through a single long-lived `git cat-file --batch` process, so that
+inspecting a repository doesn't cost one process per query.
+
+Examples
+--------
+>>> from tem import git
+>>> with git.Repository() as repo:
+>>>     new_files = repo.diff_trees(repo.tree("tem"), repo.tree("HEAD"))
+>>>     repo.restore("tem", [path for path, _ in new_files])
+"""
+import os
+import subprocess
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tem.errors import GitError
+from tem.util.fs import AnyPath
+
+__all__ = ["Repository", "TreeEntry"]
+
+#: Mode of a tree entry that is itself a tree
+TREE_MODE = b"40000"
+
+#: A tree entry, as a ``(mode, name, oid)`` tuple
+TreeEntry = Tuple[bytes, str, str]
+
+
+class Repository:
+    """A git repository.
+
+    The repository keeps a `git cat-file` child process alive until
+    :meth:`close` is called, so it should preferably be used as a context
+    manager.
+
+    Parameters
+    ----------
+    path
+        Any path inside the working tree of the repository.
+
+    Attributes
+    ----------
+    worktree
+        Top level directory of the working tree.
+    git_dir
+        The git directory of the working tree (usually `.git`).
+    common_dir
+        The git directory that holds the refs and objects. It differs from
+        :attr:`git_dir` only for linked worktrees.
+    """
+
+    def __init__(self, path: AnyPath = "."):
+        self.worktree, self.git_dir = self._find_git_dir(path)
+        commondir_file = os.path.join(self.git_dir, "commondir")
+        if os.path.isfile(commondir_file):
+            with open(commondir_file, encoding="utf-8") as f:
+                self.common_dir = os.path.normpath(
+                    os.path.join(self.git_dir, f.read().strip())
+                )
+        else:
+            self.common_dir = self.git_dir
+        self._cat_file: Optional[subprocess.Popen] = None
+        self._packed_refs: Optional[Dict[str, str]] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _1, _2, _3):
+        self.close()
+
+    def close(self):
+        """Terminate the `git cat-file` child process."""
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file.stdout.close()
+            self._cat_file = None
+
+    # Refs
+    # ━━━━
+
+    def current_branch(self) -> str:
+        """
+        Name of the checked out branch, or an empty string if `HEAD` is
+        detached (same as `git branch --show-current`).
+        """
+        head = self._read_ref_file(os.path.join(self.git_dir, "HEAD"))
+        if head and head.startswith("ref: refs/heads/"):
+            return head[len("ref: refs/heads/") :]
+        return ""
+
+    def branches(self) -> List[str]:
+        """Return the sorted names of all local branches."""
+        if self._uses_reftable():
+            return self._git(
+                "for-each-ref", "--format=%(refname:short)", "refs/heads/"
+            ).splitlines()
+        branches = {
+            ref[len("refs/heads/") :]
+            for ref in self._read_packed_refs()
+            if ref.startswith("refs/heads/")
+        }
+        heads_dir = os.path.join(self.common_dir, "refs", "heads")
+        for dirpath, _, filenames in os.walk(heads_dir):
+            for filename in filenames:
+                branches.add(
+                    os.path.relpath(
+                        os.path.join(dirpath, filename), heads_dir
+                    ).replace(os.sep, "/")
+                )
+        return sorted(branches)
+
+    def resolve(self, rev: str) -> str:
+        """
+        Return the object id that ``rev`` points to. Branch names, full ref
+        names and `HEAD` are resolved without invoking git; other revisions
+        are resolved by `git cat-file`.
+        """
+        oid = None
+        if not self._uses_reftable():
+            if rev == "HEAD" or rev.startswith("refs/"):
+                candidates = [rev]
+            else:
+                candidates = [f"refs/heads/{rev}", f"refs/tags/{rev}"]
+            oid = next(
+                (o for o in map(self._resolve_ref, candidates) if o), None
+            )
+        if oid is None:
+            oid, _, size = self._object_header(rev)
+            self._cat_file.stdout.read(size + 1)  # Discard the contents
+        return oid
+
+    # Objects
+    # ━━━━━━━
+
+    def read_object(self, rev: str) -> Tuple[str, bytes]:
+        """Return the type and raw contents of the object ``rev``."""
+        _, obj_type, size = self._object_header(rev)
+        stdout = self._cat_file.stdout
+        data = stdout.read(size)
+        stdout.read(1)  # Trailing newline
+        return obj_type, data
+
+    def tree(self, rev: str) -> str:
+        """Return the id of the root tree of the commit ``rev``."""
+        oid = self.resolve(rev)
+        while True:
+            obj_type, data = self.read_object(oid)
+            if obj_type == "tree":
+                return oid
+            if obj_type == "commit":
+                # The first line of a commit object is 'tree <oid>'
+                return data[5 : data.index(b"\n")].decode()
+            if obj_type != "tag":
+                raise GitError(f"'{rev}' is not a commit")
+            # Annotated tag, the first line is 'object <oid>'
+            oid = data[7 : data.index(b"\n")].decode()
+
+    def read_tree(self, oid: str) -> List[TreeEntry]:
+        """Return the entries of the tree with id ``oid``."""
+        obj_type, data = self.read_object(oid)
+        if obj_type != "tree":
+            raise GitError(f"'{oid}' is not a tree")
+        oid_len = len(oid) // 2
+        entries = []
+        i = 0
+        while i < len(data):
+            space = data.index(b" ", i)
+            nul = data.index(b"\0", space)
+            entries.append(
+                (
+                    data[i:space],
+                    data[space + 1 : nul].decode("utf-8", "surrogateescape"),
+                    data[nul + 1 : nul + 1 + oid_len].hex(),
+                )
+            )
+            i = nul + 1 + oid_len
+        return entries
+
+    def ls_tree(self, oid: str, prefix: str = "") -> Iterator[Tuple[str, str]]:
+        """
+        Recursively iterate over the files of tree ``oid``, like
+        `git ls-tree -r` does. Yield ``(path, oid)`` pairs.
+        """
+        for mode, name, entry_oid in self.read_tree(oid):
+            if mode == TREE_MODE:
+                yield from self.ls_tree(entry_oid, f"{prefix}{name}/")
+            else:
+                yield f"{prefix}{name}", entry_oid
+
+    def diff_trees(
+        self, new: str, old: str, prefix: str = ""
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Iterate over files of tree ``new`` whose paths do not exist as files
+        in tree ``old``. Yield ``(path, oid)`` pairs.
+
+        Subtrees that are identical in both trees are skipped without being
+        read, so the cost is proportional to the size of the difference, not
+        to the size of the trees.
+        """
+        if new == old:
+            return
+        old_entries = {
+            name: (mode, oid) for mode, name, oid in self.read_tree(old)
+        }
+        for mode, name, oid in self.read_tree(new):
+            path = f"{prefix}{name}"
+            old_mode, old_oid = old_entries.get(name, (None, None))
+            if mode == TREE_MODE:
+                if old_mode == TREE_MODE:
+                    yield from self.diff_trees(oid, old_oid, f"{path}/")
+                else:
+                    yield from self.ls_tree(oid, f"{path}/")
+            elif old_mode is None or old_mode == TREE_MODE:
+                yield path, oid
+
+    # Working tree
+    # ━━━━━━━━━━━━
+
+    def restore(self, source: str, paths: List[str], batch_size=1000):
+        """
+        Restore ``paths`` in the working tree from ``source``. Paths are
+        passed to `git restore` in batches of ``batch_size`` and are treated
+        literally, not as patterns.
+        """
+        env = {**os.environ, "GIT_LITERAL_PATHSPECS": "1"}
+        for i in range(0, len(paths), batch_size):
+            p = subprocess.run(
+                [
+                    "git",
+                    "restore",
+                    "-s",
+                    source,
+                    "--",
+                    *paths[i : i + batch_size],
+                ],
+                cwd=self.worktree,
+                env=env,
+                check=False,
+            )
+            if p.returncode != 0:
+                raise GitError(f"could not restore files from '{source}'")
+
+    # Helpers
+    # ━━━━━━━
+
+    @staticmethod
+    def _find_git_dir(path: AnyPath) -> Tuple[str, str]:
+        """Find the working tree and git directory that ``path`` belongs to."""
+        directory = os.path.abspath(path)
+        while True:
+            dot_git = os.path.join(directory, ".git")
+            if os.path.isdir(dot_git):
+                return directory, dot_git
+            if os.path.isfile(dot_git):
+                # Linked worktree or submodule
+                with open(dot_git, encoding="utf-8") as f:
+                    content = f.read().strip()
+                if content.startswith("gitdir: "):
+                    return directory, os.path.normpath(
+                        os.path.join(directory, content[len("gitdir: ") :])
+                    )
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                raise GitError(
+                    f"'{os.path.abspath(path)}' is not in a git repository"
+                )
+            directory = parent
+
+    def _uses_reftable(self) -> bool:
+        return os.path.isdir(os.path.join(self.common_dir, "reftable"))
+
+    @staticmethod
+    def _read_ref_file(path: str) -> Optional[str]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return f.read().strip()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+
+    def _read_packed_refs(self) -> Dict[str, str]:
+        if self._packed_refs is None:
+            self._packed_refs = {}
+            content = self._read_ref_file(
+                os.path.join(self.common_dir, "packed-refs")
+            )
+            for line in (content or "").splitlines():
+                if line.startswith(("#", "^")):
+                    continue
+                oid, _, ref = line.partition(" ")
+                self._packed_refs[ref] = oid
+        return self._packed_refs
+
+    def _resolve_ref(self, ref: str, depth=0) -> Optional[str]:
+        """Resolve ``ref`` by reading the git directory."""
+        if depth > 5:
+            return None
+        # Per-worktree refs live in git_dir, everything else in common_dir
+        base = self.git_dir if ref == "HEAD" else self.common_dir
+        content = self._read_ref_file(os.path.join(base, ref))
+        if content is None:
+            return self._read_packed_refs().get(ref)
+        if content.startswith("ref: "):
+            return self._resolve_ref(content[len("ref: ") :], depth + 1)
+        return content
+
+    def _object_header(self, rev: str) -> Tuple[str, str, int]:
+        """
+        Request object ``rev`` from `git cat-file` and return its id, type and
+        size. The contents of the object must be consumed afterwards.
+        """
+        if self._cat_file is None:
+            # pylint: disable-next=consider-using-with
+            self._cat_file = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=self.worktree,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        self._cat_file.stdin.write(rev.encode() + b"\n")
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline().decode().split()
+        if len(header) != 3:
+            raise GitError(f"invalid object name '{rev}'")
+        oid, obj_type, size = header
+        return oid, obj_type, int(size)
+
+    def _git(self, *args) -> str:
+        p = subprocess.run(
+            ["git", *args],
+            cwd=self.worktree,
+            stdout=subprocess.PIPE,
+            encoding="utf-8",
+            check=False,
+        )
+        if p.returncode != 0:
+            raise GitError(f"git {args[0]} failed")
+        return p.stdout
@@ -0,0 +1,403 @@
+"""
+Search through the contents of templates.
+
+:func:`grep` searches all templates in a list of repositories for lines
+that match a regular expression. Files are searched by a pool of worker
+threads, which mostly wait for the filesystem, so that the latency of
+network filesystems is overlapped. Matches are yielded in a stable order,
+as soon as each file is done.
+
+Binary files are recognized by a NUL byte near their start, and skipped.
+Large files are memory-mapped instead of being read into memory.
+
+Optionally, each repository can have a content index, kept in tem's cache
+directory. The index maps each trigram (three consecutive bytes, in lower
+case) to the files that contain it. When the pattern contains a literal
+string, only the files that contain all trigrams of that string need to be
+searched. Files are indexed again when their size or modification time
+changes, but the files must still be listed and stat'ed on each search,
+unless a watcher (see :mod:`tem.watch`) watches the repository.
+
+Examples
+--------
+>>> for match in grep.grep(r"TODO\\b", repo.lookup_path):
+...     print(match)
+main:python/setup.py:3:# TODO fill in the metadata
+"""
+import base64
+import mmap
+import os
+import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from tem import cache, ignore, pack, watch
+from tem.util.fs import AnyPath
+
+__all__ = ["ContentIndex", "Match", "grep", "index_path", "search_bytes"]
+
+#: Files larger than this are memory-mapped
+MMAP_THRESHOLD = 1 << 20
+#: Files larger than this are not indexed, so they are always searched
+MAX_INDEXED_SIZE = 8 << 20
+#: A file is binary if this many bytes from its start contain a NUL byte
+_SNIFF_SIZE = 8192
+#: Version of the index format
+_INDEX_VERSION = 1
+#: Names of directories that never contain templates
+_SKIPPED_NAMES = {".tem", ".git"}
+
+
+class Match(NamedTuple):
+    """A line of a template that matches the pattern."""
+
+    #: Name of the repository
+    repo: str
+    #: Path of the template file, relative to the repository
+    path: str
+    #: Number of the line, starting at 1
+    line_number: int
+    #: Contents of the line, without the line ending
+    line: str
+    #: Absolute path of the template file, inside the repository
+    abspath: str
+
+    def __str__(self):
+        return f"{self.repo}:{self.path}:{self.line_number}:{self.line}"
+
+
+def grep(
+    pattern: str,
+    repos: Iterable,
+    ignore_case=False,
+    jobs: Optional[int] = None,
+    use_index=False,
+) -> Iterator[Match]:
+    """
+    Find the lines that match the regular expression ``pattern`` in the
+    templates of ``repos``.
+
+    Parameters
+    ----------
+    ignore_case
+        Match letters regardless of their case.
+    jobs
+        Number of files that are searched at the same time.
+    use_index
+        Use and update the content index of each repository (see
+        :class:`ContentIndex`). Packed repositories are never indexed.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = re.compile(pattern.encode(), flags)
+    # The index holds lowercase trigrams, so it works for both cases
+    literal = _literal(pattern) if use_index else None
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for repo in repos:
+            name = repo.name()
+            if repo.is_packed():
+                tree = pack.load_tree(repo.abspath())
+                files = [e for e in tree.walk() if not e.is_dir()]
+                for entry, f in tree.open_files(files):
+                    abspath = f"{tree.path}/{entry.path}"
+                    for line_number, line in search_bytes(regex, f.read()):
+                        yield Match(
+                            name, entry.path, line_number, line, abspath
+                        )
+                continue
+            repo_path = repo.abspath()
+            if use_index:
+                token = watch.token(repo_path)
+                index = ContentIndex.load(repo_path)
+                if token is not None and token == index.watch_token:
+                    paths = index.paths()
+                else:
+                    paths = list(_files(repo_path))
+                    index.update(paths)
+                    index.set_watch_token(token)
+                if literal:
+                    candidates = set(index.candidates(literal))
+                    paths = [path for path in paths if path in candidates]
+                index.save()
+            else:
+                paths = list(_files(repo_path))
+            for path, matches in zip(
+                paths,
+                executor.map(
+                    lambda path: search_file(regex, path),
+                    paths,
+                ),
+            ):
+                relpath = os.path.relpath(path, repo_path)
+                for line_number, line in matches:
+                    yield Match(name, relpath, line_number, line, path)
+
+
+def search_file(regex: re.Pattern, path: AnyPath) -> List[tuple]:
+    """
+    Return the line numbers and contents of the lines of the file at
+    ``path`` that match ``regex``, a bytes pattern. Binary files and files
+    that can't be read have no matching lines.
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MMAP_THRESHOLD:
+                return search_bytes(regex, f.read())
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return search_bytes(regex, data)
+    except (OSError, ValueError):
+        return []
+
+
+def search_bytes(regex: re.Pattern, data) -> List[tuple]:
+    """
+    Same as :func:`search_file`, but search ``data``, a bytes-like object
+    such as a memory map.
+    """
+    if b"\0" in data[:_SNIFF_SIZE]:
+        return []
+    matches = []
+    line_number, counted = 1, 0
+    end = -1
+    for match in regex.finditer(data):
+        if match.start() <= end:
+            continue  # Each line is reported only once
+        start = data.rfind(b"\n", 0, match.start()) + 1
+        end = data.find(b"\n", match.end())
+        if end == -1:
+            end = len(data)
+        line_number += data[counted:start].count(b"\n")
+        counted = start
+        line = bytes(data[start:end]).rstrip(b"\r")
+        matches.append((line_number, line.decode(errors="replace")))
+    return matches
+
+
+class ContentIndex:
+    """
+    Trigram index of the contents of the files in the repository at
+    ``path``. Use :meth:`load` to get the index that is saved in the cache.
+
+    The index is only ever appended to. When a file changes, it is indexed
+    again under a new number, and the old number is forgotten. The index is
+    rebuilt once most numbers are forgotten.
+    """
+
+    def __init__(self, path: AnyPath):
+        self.path = os.path.abspath(path)
+        #: Path, size and modification time of each indexed file, by number
+        self._files: List[list] = []
+        #: Current number of each file, by path
+        self._numbers: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._encoded: Dict[str, str] = {}
+        #: Token from :func:`tem.watch.token` when the index was updated
+        self.watch_token: Optional[str] = None
+        self._changed = False
+
+    @classmethod
+    def load(cls, path: AnyPath) -> "ContentIndex":
+        """Return the index of ``path`` from the cache, or an empty one."""
+        index = cls(path)
+        data = cache.default().get("grep", index.path, {})
+        try:
+            if data["version"] != _INDEX_VERSION:
+                raise ValueError
+            index._files = data["files"]
+            index._encoded = data["trigrams"]
+            index.watch_token = data.get("watch")
+        except (ValueError, KeyError, TypeError):
+            return index
+        index._numbers = {
+            file[0]: i for i, file in enumerate(index._files) if file
+        }
+        return index
+
+    def update(self, paths: Iterable[str]):
+        """
+        Index the files from ``paths`` that have changed, and forget the
+        files that are not in ``paths``.
+        """
+        paths = list(paths)
+        for path in set(self._numbers) - set(paths):
+            self._files[self._numbers.pop(path)] = None
+            self._changed = True
+        if len(self._numbers) < len(self._files) // 2:
+            self._rebuild()
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = [path, st.st_size, st.st_mtime_ns]
+            number = self._numbers.get(path)
+            if number is not None and self._files[number] == key:
+                continue
+            if number is not None:
+                self._files[number] = None
+            self._numbers[path] = len(self._files)
+            self._files.append(key)
+            self._changed = True
+            if st.st_size > MAX_INDEXED_SIZE:
+                # An empty set of trigrams would exclude the file from every
+                # search, so large files get a trigram that is always looked
+                # up instead
+                self._add(b"", len(self._files) - 1)
+                continue
+            with open(path, "rb") as f:
+                self._add(f.read().lower(), len(self._files) - 1)
+
+    def paths(self) -> List[str]:
+        """Return the paths of the indexed files, in the search order."""
+        return sorted(self._numbers, key=_walk_order)
+
+    def set_watch_token(self, token: Optional[str]):
+        """
+        Record the token of the repository, which must be taken before
+        :meth:`update`.
+        """
+        if token != self.watch_token:
+            self.watch_token = token
+            self._changed = True
+
+    def candidates(self, literal: str) -> List[str]:
+        """
+        Return the paths of the files that might contain ``literal``, a
+        string that is matched regardless of case.
+        """
+        numbers = None
+        for trigram in _trigrams(literal.encode().lower()):
+            postings = set(self._get(trigram))
+            numbers = postings if numbers is None else numbers & postings
+        if numbers is None:  # The literal is shorter than a trigram
+            return sorted(self._numbers)
+        numbers |= set(self._get(b""))
+        # Forgotten numbers are still in the postings
+        return sorted(self._files[i][0] for i in numbers if self._files[i])
+
+    def save(self):
+        """Save the index to the cache, if it has changed."""
+        if not self._changed:
+            return
+        trigrams = dict(self._encoded)
+        for key, postings in self._postings.items():
+            trigrams[key] = base64.b64encode(postings).decode()
+        data = {
+            "version": _INDEX_VERSION,
+            "watch": self.watch_token,
+            "files": self._files,
+            "trigrams": trigrams,
+        }
+        cache.default().set("grep", self.path, data)
+        self._changed = False
+
+    def _add(self, data: bytes, number: int):
+        trigrams = _trigrams(data) if data else [b""]
+        for trigram in trigrams:
+            self._get(trigram).append(number)
+
+    def _get(self, trigram: bytes) -> array:
+        key = trigram.hex()
+        postings = self._postings.get(key)
+        if postings is None:
+            postings = self._postings[key] = array("I")
+            encoded = self._encoded.pop(key, None)
+            if encoded is not None:
+                postings.frombytes(base64.b64decode(encoded))
+        return postings
+
+    def _rebuild(self):
+        self._files, self._numbers = [], {}
+        self._postings, self._encoded = {}, {}
+        self._changed = True
+
+
+def index_path(path: AnyPath) -> str:
+    """Return the path of the content index of the repository at ``path``."""
+    return cache.default().path("grep", os.path.abspath(path))
+
+
+def _files(repo_path: str) -> Iterator[str]:
+    """Yield the paths of all template files in the repository."""
+    matcher = ignore.load(repo_path)
+    for directory, dirnames, filenames in os.walk(repo_path):
+        dirnames[:] = sorted(
+            d
+            for d in dirnames
+            if d not in _SKIPPED_NAMES
+            and not matcher.match(os.path.join(directory, d), is_dir=True)
+        )
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            if not matcher.match(path, is_dir=False):
+                yield path
+
+
+def _walk_order(path: str) -> list:
+    """Sort key that orders paths like :func:`_files` yields them."""
+    directories, name = os.path.split(path)
+    # Files come before the subdirectories of their directory
+    return [(1, d) for d in directories.split(os.sep)] + [(0, name)]
+
+
+def _trigrams(data: bytes) -> List[bytes]:
+    return list({data[i : i + 3] for i in range(len(data) - 2)})
+
+
+#: Escapes of classes, anchors and special characters, which have no arguments
+_ATOM_ESCAPES = set("AbBdDsSwWZafnrtv")
+
+
+def _literal(pattern: str) -> Optional[str]:
+    """
+    Return the longest string that every match of ``pattern`` must contain,
+    as far as a simple scan of the pattern can tell, or ``None``.
+    """
+    if "|" in pattern or "(" in pattern:
+        # Alternatives and optional groups would need a real parser
+        return None
+    literals, current = [], ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if escaped in _ATOM_ESCAPES:  # A class like \\w, or \\b
+                literals.append(current)
+                current = ""
+            elif escaped.isalnum():
+                # Escapes like \\x41 and \\1 are followed by arguments
+                return None
+            else:
+                current += escaped
+            i += 2
+            continue
+        if c in "*?{":
+            # The previous character is optional or repeated
+            current = current[:-1]
+            literals.append(current)
+            current = ""
+            if c == "{":
+                i = pattern.find("}", i)
+                if i == -1:
+                    return None
+        elif c in ".^$+[]":
+            literals.append(current)
+            current = ""
+            if c == "[":
+                # Skip the character set
+                end = pattern.find("]", i + 1)
+                if end == -1:
+                    return None
+                contents = pattern[i + 1 : end]
+                if contents in ("", "^") or "\\" in contents:
+                    # The set contains a `]` or an escape, so it may end later
+                    return None
+                i = end
+        else:
+            current += c
+        i += 1
+    literals.append(current)
+    longest = max(literals, key=len)
+    return longest or None
@@ -0,0 +1,316 @@
+"""
+Matching of paths against ignore patterns.
+
+Ignore patterns come from the `.tem/ignore` file of a temdir, and from the
+``exclude`` options in the configuration. They have the same syntax and
+semantics as `.gitignore` patterns:
+
+- blank lines and lines starting with ``#`` are skipped
+- a pattern starting with ``!`` re-includes paths excluded by earlier patterns
+- a pattern ending with ``/`` only matches directories
+- a pattern that contains a ``/`` anywhere except at the end is anchored to
+  the base directory, otherwise it matches a name at any level
+- ``*``, ``?`` and ``[...]`` never match a ``/``, while ``**`` matches any
+  number of directories
+
+Patterns are not tried one by one. Consecutive patterns of the same polarity
+are compiled into a single regular expression, and plain names are looked up
+in a set, so the cost of matching barely depends on the number of patterns.
+
+Examples
+--------
+>>> matcher = Matcher(["*.log", "!keep.log", "build/"], base="/project")
+>>> matcher.match("debug.log")
+True
+>>> matcher.match("keep.log")
+False
+>>> matcher.is_ignored("/project/build/output.txt")
+True
+"""
+import os
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Pattern, Tuple
+
+from tem import pack
+from tem.config import cfg
+from tem.fs import AnyPath
+
+__all__ = ["Matcher", "load", "config_patterns"]
+
+
+class _Run:
+    """Consecutive patterns with the same polarity."""
+
+    __slots__ = ("negated", "names", "dir_names", "regex")
+
+    def __init__(self, negated: bool):
+        self.negated = negated
+        #: Unanchored patterns without wildcards that match any path
+        self.names: FrozenSet[str] = frozenset()
+        #: Same as :attr:`names`, but only for directories
+        self.dir_names: FrozenSet[str] = frozenset()
+        self.regex: Optional[Pattern] = None
+
+    def match(self, path: str, name: str, is_dir: bool) -> bool:
+        if name in self.names or (is_dir and name in self.dir_names):
+            return True
+        if self.regex is None:
+            return False
+        return self.regex.match(path + "/" if is_dir else path) is not None
+
+
+class Matcher:
+    """
+    Compiled list of ignore ``patterns``. Paths are matched relative to the
+    directory ``base``, which defaults to the current working directory.
+    """
+
+    def __init__(self, patterns: Iterable[str] = (), base: AnyPath = None):
+        self.patterns: List[str] = list(patterns)
+        self.base = os.path.abspath(base or os.getcwd())
+        self._runs: List[_Run] = _compile(self.patterns)
+
+    def __bool__(self):
+        return bool(self._runs)
+
+    def __repr__(self):
+        return f"Matcher({self.patterns!r}, base={self.base!r})"
+
+    def match(self, path: AnyPath, is_dir: Optional[bool] = None) -> bool:
+        """
+        Test if ``path`` itself is matched by the patterns. Unlike
+        :meth:`is_ignored`, the parent directories of ``path`` are not taken
+        into account. If ``is_dir`` is ``None``, the filesystem is checked to
+        see if ``path`` is a directory. Paths inside packed repositories are
+        looked up in the pack.
+        """
+        relpath = self._relpath(path)
+        if relpath is None:
+            return False
+        if is_dir is None:
+            is_dir = _is_dir(os.path.join(self.base, relpath))
+        return self._match(relpath, is_dir)
+
+    def is_ignored(self, path: AnyPath, is_dir: Optional[bool] = None) -> bool:
+        """
+        Test if ``path`` is ignored. A path is ignored if it is matched by the
+        patterns, or if any of its parent directories under :attr:`base` is.
+        """
+        relpath = self._relpath(path)
+        if relpath is None:
+            return False
+        if is_dir is None:
+            is_dir = _is_dir(os.path.join(self.base, relpath))
+        parts = relpath.split("/")
+        for i in range(1, len(parts)):
+            if self._match("/".join(parts[:i]), True):
+                return True
+        return self._match(relpath, is_dir)
+
+    def filter(self, directory: AnyPath, names: Iterable[str]) -> List[str]:
+        """
+        Return the ignored ``names`` from ``directory``. The signature matches
+        the ``ignore`` argument of :func:`shutil.copytree`.
+        """
+        return [
+            name
+            for name in names
+            if self.match(os.path.join(directory, name))
+        ]
+
+    def _relpath(self, path: AnyPath) -> Optional[str]:
+        relpath = os.path.relpath(os.path.join(self.base, path), self.base)
+        if relpath in (os.curdir, os.pardir) or relpath.startswith(
+            os.pardir + os.sep
+        ):
+            return None
+        return relpath.replace(os.sep, "/")
+
+    def _match(self, relpath: str, is_dir: bool) -> bool:
+        name = relpath.rsplit("/", 1)[-1]
+        # The last pattern that matches decides
+        for run in reversed(self._runs):
+            if run.match(relpath, name, is_dir):
+                return not run.negated
+        return False
+
+
+#: Compiled `ignore` files, with the mtime and size they were compiled for
+_cache: Dict[str, Tuple[Tuple[int, int], Matcher]] = {}
+
+
+def _is_dir(path: str) -> bool:
+    located = pack.locate(path)
+    if located is not None:
+        return located[0].isdir(located[1])
+    return os.path.isdir(path)
+
+
+def load(temdir: AnyPath, exclude: Iterable[str] = ()) -> Matcher:
+    """
+    Return a matcher for the `.tem/ignore` file of ``temdir``, extended with
+    the ``exclude`` patterns. A file is compiled again only after it has
+    been modified.
+    """
+    path = os.path.join(os.path.abspath(temdir), ".tem", "ignore")
+    try:
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        key = None
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        matcher = cached[1]
+    else:
+        patterns = []
+        if key is not None:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    patterns = f.read().splitlines()
+            except OSError:
+                pass
+        matcher = Matcher(patterns, base=os.path.abspath(temdir))
+        _cache[path] = (key, matcher)
+    exclude = [pattern for pattern in exclude if pattern]
+    if exclude:
+        return Matcher(matcher.patterns + exclude, base=matcher.base)
+    return matcher
+
+
+def config_patterns(option: str) -> List[str]:
+    """Return the patterns from the configuration ``option``, one per line."""
+    return [line for line in cfg[option].split("\n") if line.strip()]
+
+
+def _compile(patterns: Iterable[str]) -> List[_Run]:
+    runs: List[_Run] = []
+    names: List[str] = []
+    dir_names: List[str] = []
+    regexes: List[str] = []
+
+    def finish_run():
+        if runs and (names or dir_names or regexes):
+            run = runs[-1]
+            run.names = frozenset(names)
+            run.dir_names = frozenset(dir_names)
+            if regexes:
+                run.regex = re.compile("|".join(regexes))
+        names.clear()
+        dir_names.clear()
+        regexes.clear()
+
+    for pattern in patterns:
+        parsed = _parse(pattern)
+        if parsed is None:
+            continue
+        negated, dir_only, anchored, body = parsed
+        if not runs or runs[-1].negated != negated:
+            finish_run()
+            runs.append(_Run(negated))
+        if not anchored and not _has_wildcards(body):
+            (dir_names if dir_only else names).append(_unescape(body))
+        else:
+            regexes.append(_translate(body, dir_only, anchored))
+    finish_run()
+    return runs
+
+
+def _parse(pattern: str) -> Optional[Tuple[bool, bool, bool, str]]:
+    """
+    Split ``pattern`` into its flags: whether it is negated, if it matches
+    only directories, and if it is anchored to the base directory. Return
+    ``None`` if the pattern matches nothing.
+    """
+    if not pattern or pattern.startswith("#"):
+        return None
+    # Trailing spaces are ignored, unless escaped
+    pattern = re.sub(r"(?<!\\) +$", "", pattern)
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+    anchored = "/" in pattern
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+    elif pattern.startswith("**/"):
+        anchored = False
+    return negated, dir_only, anchored, pattern
+
+
+def _has_wildcards(pattern: str) -> bool:
+    return re.search(r"(?<!\\)[*?[]", pattern) is not None
+
+
+def _unescape(pattern: str) -> str:
+    return re.sub(r"\\(.)", r"\1", pattern)
+
+
+def _translate(pattern: str, dir_only: bool, anchored: bool) -> str:
+    """Translate a single pattern into a regular expression."""
+    segments = pattern.split("/")
+    regex = ""
+    for i, segment in enumerate(segments):
+        first, last = i == 0, i == len(segments) - 1
+        if segment == "**":
+            if first and last:
+                regex += ".*"
+            elif first:
+                regex += "(?:.*/)?"
+            elif last:
+                regex += "/.+"
+            else:
+                regex += "/(?:.*/)?"
+            continue
+        if not first and segments[i - 1] != "**":
+            regex += "/"
+        regex += _translate_segment(segment)
+    prefix = "" if anchored else "(?:.*/)?"
+    # Paths of directories are matched with a trailing slash
+    suffix = "/" if dir_only else "/?"
+    return f"(?:{prefix}{regex}{suffix})$"
+
+
+def _translate_segment(segment: str) -> str:
+    regex = ""
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        i += 1
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "\\" and i < len(segment):
+            regex += re.escape(segment[i])
+            i += 1
+        elif char == "[":
+            start = i
+            if segment[start : start + 1] in ("!", "^"):
+                start += 1
+            # Like in fnmatch, a `]` that comes first is part of the set
+            if segment[start : start + 1] == "]":
+                start += 1
+            end = segment.find("]", start)
+            content = re.sub(r"([\\[\]])", r"\\\1", segment[i:end])
+            if content[:1] in ("!", "^"):
+                content = "^/" + content[1:]
+            if end == -1 or not _is_valid(f"[{content}]"):
+                # Not a set, such as `[` alone or `[z-a]`
+                regex += re.escape(char)
+                continue
+            i = end + 1
+            regex += f"[{content}]"
+        else:
+            regex += re.escape(char)
+    return regex
+
+
+def _is_valid(regex: str) -> bool:
+    try:
+        re.compile(regex)
+    except re.error:
+        return False
+    return True
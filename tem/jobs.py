@@ -0,0 +1,352 @@
+"""
+Durable on-disk job queue, used to run commands (e.g. hooks) in the
+background.
+
+A queue is a directory with the following structure::
+
+    pending/<id>.json    jobs waiting to be run
+    running/<id>.json    jobs that a worker has claimed
+    done/<id>.json       finished jobs, along with their exit codes
+    logs/<id>.log        combined stdout and stderr of each job
+    lock                 held by the worker that is draining the queue
+
+Each state transition is a single ``os.rename``, so the queue survives crashes
+of both the submitting process and the worker. Jobs found under `running/`
+when a new worker starts are assumed to belong to a dead worker and are
+rescheduled. Jobs can carry environment variables and logs can carry secrets,
+so only the owner of the queue can read its files.
+
+The worker is normally started in the background by
+:meth:`JobQueue.spawn_worker`, which runs this module as a script::
+
+    python -m tem.jobs QUEUE_DIR [--jobs N]
+"""
+import argparse
+import contextlib
+import fcntl
+import itertools
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from tem.util.fs import AnyPath
+
+__all__ = ["Job", "JobQueue", "PENDING", "RUNNING", "DONE"]
+
+PENDING = "pending"  #: State of a job that is waiting to be run
+RUNNING = "running"  #: State of a job that is being run by a worker
+DONE = "done"  #: State of a job that has finished
+
+_counter = itertools.count()
+#: Variable through which :meth:`JobQueue.spawn_worker` passes the original
+#: `PYTHONPATH` to the worker
+_PYTHONPATH_VAR = "TEM_JOBS_PYTHONPATH"
+
+
+class Job:
+    """A command submitted to a :class:`JobQueue`.
+
+    Attributes
+    ----------
+    id
+        Unique identifier of the job. Identifiers sort chronologically.
+    args
+        Command line of the job.
+    cwd
+        Directory from which the command is run.
+    env
+        Variables that are added to the environment of the worker when the
+        command is run. Only the variables that the command needs should be
+        given, as they are stored on disk until the job is done. If ``None``,
+        the environment of the worker is used as it is.
+    state
+        One of :data:`PENDING`, :data:`RUNNING` or :data:`DONE`.
+    returncode
+        Exit code of the command, once the job is :data:`DONE`.
+    """
+
+    def __init__(
+        self,
+        args: List[str],
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        id_: Optional[str] = None,
+        state: str = PENDING,
+        returncode: Optional[int] = None,
+    ):
+        self.id = (
+            id_ or f"{time.time_ns():020d}-{os.getpid()}-{next(_counter)}"
+        )
+        self.args = [str(arg) for arg in args]
+        self.cwd = str(cwd) if cwd is not None else None
+        self.env = env
+        self.state = state
+        self.returncode = returncode
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable representation of this job."""
+        return {
+            "id": self.id,
+            "args": self.args,
+            "cwd": self.cwd,
+            "env": self.env,
+            "returncode": self.returncode,
+        }
+
+    @classmethod
+    def from_file(cls, path: AnyPath, state: str) -> "Job":
+        """Load a job that was stored at ``path``."""
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        return cls(
+            data["args"],
+            cwd=data.get("cwd"),
+            env=data.get("env"),
+            id_=data["id"],
+            state=state,
+            returncode=data.get("returncode"),
+        )
+
+    def __repr__(self):
+        return f"Job({self.id!r}, {self.args!r}, state={self.state!r})"
+
+
+class JobQueue:
+    """
+    A job queue stored in the directory at ``path``.
+
+    Parameters
+    ----------
+    path
+        Directory that holds the queue. It is created on demand.
+    max_done
+        Number of finished jobs (and their logs) to keep around for
+        inspection.
+    """
+
+    def __init__(self, path: AnyPath, max_done: int = 100):
+        self.path = pathlib.Path(path)
+        self.max_done = max_done
+
+    def submit(
+        self,
+        args: List[str],
+        cwd: Optional[AnyPath] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> Job:
+        """Add a new job to the queue and return it."""
+        job = Job(args, cwd=cwd, env=env)
+        self._write(self._dir(PENDING) / f"{job.id}.json", job)
+        return job
+
+    def jobs(self, state: Optional[str] = None) -> List[Job]:
+        """
+        Return the jobs in the given ``state``, or all jobs if ``state`` is
+        unspecified. Jobs are sorted by submission time.
+        """
+        result = []
+        for _state in (state,) if state else (DONE, RUNNING, PENDING):
+            directory = self.path / _state
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                # The job may have changed state since we listed the directory
+                with contextlib.suppress(FileNotFoundError, ValueError):
+                    result.append(Job.from_file(entry.path, _state))
+        return sorted(result, key=lambda job: job.id)
+
+    def log(self, job: Job) -> pathlib.Path:
+        """Path to the file that holds the output of ``job``."""
+        return self.path / "logs" / f"{job.id}.log"
+
+    def is_idle(self) -> bool:
+        """Test if there are no pending or running jobs."""
+        return not any(
+            (self.path / state).is_dir() and any(os.scandir(self.path / state))
+            for state in (PENDING, RUNNING)
+        )
+
+    def spawn_worker(self, max_jobs: Optional[int] = None):
+        """
+        Start a detached worker process that drains the queue. If another
+        worker is already draining the queue, the new one exits immediately.
+        """
+        package_root = os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))
+        )
+        env = os.environ.copy()
+        # Jobs are run with the environment of the worker, which must not
+        # include the path to tem that is needed to start the worker
+        env[_PYTHONPATH_VAR] = env.get("PYTHONPATH", "")
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in (package_root, env.get("PYTHONPATH")) if p
+        )
+        args = [sys.executable, "-m", "tem.jobs", str(self.path)]
+        if max_jobs:
+            args += ["--jobs", str(max_jobs)]
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        # pylint: disable-next=consider-using-with
+        subprocess.Popen(
+            args,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def wait(self, timeout: Optional[float] = None, interval=0.1) -> bool:
+        """
+        Wait until the queue is idle. If no worker is alive, the queue is
+        drained by the calling process instead.
+
+        Returns
+        -------
+        idle
+            ``False`` if ``timeout`` seconds have passed before the queue
+            became idle, ``True`` otherwise.
+        """
+        self.drain()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.is_idle():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+            # The worker might have died in the meantime
+            self.drain()
+        return True
+
+    def drain(self, max_jobs: Optional[int] = None):
+        """
+        Run queued jobs, at most ``max_jobs`` at a time, until the queue is
+        empty. Return immediately if another worker is draining the queue.
+        """
+        while True:
+            with self._lock() as acquired:
+                if not acquired:
+                    return
+                self._reschedule_orphans()
+                with ThreadPoolExecutor(max_workers=max_jobs) as pool:
+                    futures = set()
+                    while True:
+                        for job in self._claim_pending():
+                            futures.add(pool.submit(self._run, job))
+                        if not futures:
+                            break
+                        _, futures = wait(futures, return_when=FIRST_COMPLETED)
+                self._prune()
+            # A job may have been submitted after we last looked, but before
+            # the lock was released. Its submitter saw the lock as taken and
+            # relied on us to run the job.
+            if self.is_idle():
+                return
+
+    def _claim_pending(self) -> List[Job]:
+        claimed = []
+        for job in self.jobs(PENDING):
+            with contextlib.suppress(FileNotFoundError):
+                os.rename(
+                    self.path / PENDING / f"{job.id}.json",
+                    self._dir(RUNNING) / f"{job.id}.json",
+                )
+                job.state = RUNNING
+                claimed.append(job)
+        return claimed
+
+    def _run(self, job: Job):
+        os.makedirs(self.path / "logs", mode=0o700, exist_ok=True)
+        env = None if job.env is None else {**os.environ, **job.env}
+        with _open_private(self.log(job), "wb") as log:
+            try:
+                job.returncode = subprocess.run(
+                    job.args,
+                    cwd=job.cwd,
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    check=False,
+                ).returncode
+            except OSError as e:
+                log.write(f"{e}\n".encode())
+                job.returncode = 127
+        job.state = DONE
+        # The environment is no longer needed once the job is done
+        job.env = None
+        self._write(self._dir(DONE) / f"{job.id}.json", job)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path / RUNNING / f"{job.id}.json")
+
+    def _reschedule_orphans(self):
+        for job in self.jobs(RUNNING):
+            os.rename(
+                self.path / RUNNING / f"{job.id}.json",
+                self._dir(PENDING) / f"{job.id}.json",
+            )
+
+    def _prune(self):
+        done = self.jobs(DONE)
+        for job in done[: max(len(done) - self.max_done, 0)]:
+            for path in (self.path / DONE / f"{job.id}.json", self.log(job)):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        with open(self.path / "lock", "w", encoding="utf-8") as file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _dir(self, state: str) -> pathlib.Path:
+        directory = self.path / state
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        return directory
+
+    @staticmethod
+    def _write(path: pathlib.Path, job: Job):
+        """Write ``job`` to ``path`` atomically."""
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with _open_private(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(job.to_dict(), file)
+        os.replace(tmp_path, path)
+
+
+def _open_private(path: AnyPath, mode: str, **kwargs):
+    """Open ``path`` for writing, creating it readable only by its owner."""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    return open(os.open(path, flags, 0o600), mode, **kwargs)
+
+
+def main():
+    """Entry point of the background worker."""
+    parser = argparse.ArgumentParser(prog="python -m tem.jobs")
+    parser.add_argument("queue", help="directory of the job queue")
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="maximum number of concurrent jobs"
+    )
+    args = parser.parse_args()
+    pythonpath = os.environ.pop(_PYTHONPATH_VAR, None)
+    if pythonpath:
+        os.environ["PYTHONPATH"] = pythonpath
+    elif pythonpath is not None:
+        del os.environ["PYTHONPATH"]
+    JobQueue(args.queue).drain(max_jobs=args.jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+"""
+Packed repositories.
+
+A packed repository is a single file that holds all the files of a directory
+repository. It can be used in place of the directory, for example in
+`REPO_PATH`. Looking up a template in a packed repository doesn't touch the
+filesystem: the pack is memory-mapped once, and its index is searched in
+memory. This makes a big difference for repositories on network filesystems,
+where each ``stat`` is a round trip to the server.
+
+A pack file has the following layout::
+
+    header      magic, format version, number of entries, size of names
+    records     one fixed-size record per entry, sorted by path
+    names       paths of all entries, encoded in UTF-8
+    data        contents of all files
+
+Each record holds the location of the entry's path in the names section, its
+mode, size and modification time, the location of its contents in the data
+section, and the SHA-256 digest of its contents. Records are sorted by path,
+so an entry is found by binary search, and all entries under a directory are
+next to each other.
+
+A template inside a packed repository is referred to by joining the path of
+the pack and the path of the template, as if the pack was a directory. Such
+paths are resolved by :func:`locate`.
+
+Examples
+--------
+>>> pack.build("/nfs/repo")
+('/nfs/repo.tempack', True)
+>>> p = pack.load("/nfs/repo.tempack")
+>>> p.listdir("")
+['dir1', 'file1.txt']
+>>> pack.locate("/nfs/repo.tempack/dir1")
+(<tem.pack.Pack object at ...>, 'dir1')
+"""
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import stat
+import struct
+import tarfile
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from tem.util.fs import AnyPath
+
+__all__ = [
+    "Entry",
+    "Pack",
+    "SUFFIX",
+    "Tree",
+    "build",
+    "is_packed",
+    "load",
+    "load_tree",
+    "locate",
+]
+
+#: File name suffix of packed repositories
+SUFFIX = ".tempack"
+
+_MAGIC = b"TEMPACK\0"
+_VERSION = 1
+#: magic, version, number of entries, size of the names section
+_HEADER = struct.Struct("<8sIQQ")
+#: name offset, name length, mode, data offset, size, mtime, digest
+_RECORD = struct.Struct("<QIIQQq32s")
+_CHUNK_SIZE = 1 << 20
+
+
+class Entry:
+    """A file or directory inside a :class:`Pack`."""
+
+    __slots__ = ("path", "mode", "offset", "size", "mtime_ns", "digest")
+
+    def __init__(self, path, mode, offset, size, mtime_ns, digest):
+        #: Path relative to the root of the pack, separated by '/'
+        self.path: str = path
+        self.mode: int = mode
+        #: Location of the contents inside the pack file
+        self.offset: int = offset
+        self.size: int = size
+        self.mtime_ns: int = mtime_ns
+        #: SHA-256 digest of the contents, if known
+        self.digest: Optional[bytes] = digest
+
+    def is_dir(self) -> bool:
+        """Test if the entry is a directory."""
+        return stat.S_ISDIR(self.mode)
+
+    def __repr__(self):
+        return f"<Entry {self.path!r}>"
+
+
+class Tree(ABC):
+    """
+    Read-only tree of entries, sorted by path. This is the interface shared
+    by :class:`Pack` and :class:`tem.archive.Archive`. Subclasses provide
+    :attr:`path` and the methods that access entries by their index.
+    """
+
+    #: Path of the file that holds the tree
+    path: str
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Return the number of entries."""
+
+    def entry(self, path: str) -> Optional[Entry]:
+        """Return the entry at ``path``, or ``None`` if there is none."""
+        key = _key(path)
+        i = self._bisect(key)
+        if i < len(self) and self._name(i) == key:
+            return self._entry(i)
+        return None
+
+    def exists(self, path: str) -> bool:
+        """Test if there is a file or directory at ``path``."""
+        return not _key(path) or self.entry(path) is not None
+
+    def isdir(self, path: str) -> bool:
+        """Test if there is a directory at ``path``."""
+        if not _key(path):
+            return True
+        entry = self.entry(path)
+        return entry is not None and entry.is_dir()
+
+    def listdir(self, path: str = "") -> List[str]:
+        """Return the names of the entries in the directory at ``path``."""
+        prefix = _key(path) + b"/" if _key(path) else b""
+        names = []
+        count = len(self)
+        i = self._bisect(prefix)
+        while i < count:
+            name = self._name(i)
+            if not name.startswith(prefix):
+                break
+            child, slash, _ = name[len(prefix) :].partition(b"/")
+            if slash:
+                # Skip the rest of the subdirectory at once
+                i = self._bisect(prefix + child + b"0")  # '0' follows '/'
+                continue
+            names.append(child.decode())
+            i += 1
+        return names
+
+    def walk(self, path: str = "") -> Iterator[Entry]:
+        """
+        Iterate over the entry at ``path`` and all entries under it, sorted
+        by path.
+        """
+        key = _key(path)
+        if key and (entry := self.entry(path)) is not None:
+            yield entry
+        prefix = key + b"/" if key else b""
+        count = len(self)
+        i = self._bisect(prefix)
+        while i < count and self._name(i).startswith(prefix):
+            yield self._entry(i)
+            i += 1
+
+    def digest(self, entry: Entry) -> str:
+        """Return the SHA-256 digest of the file ``entry``, as hex."""
+        if entry.digest is None:
+            digest = hashlib.sha256()
+            for _, f in self.open_files([entry]):
+                while chunk := f.read(_CHUNK_SIZE):
+                    digest.update(chunk)
+            entry.digest = digest.digest()
+        return entry.digest.hex()
+
+    def extract(
+        self,
+        path: str,
+        dest: AnyPath,
+        ignore: Optional[Callable] = None,
+    ) -> str:
+        """
+        Extract the file or directory at ``path`` to ``dest``, like
+        :func:`tem.util.copy` does. Files get the modification times they
+        had when they were packed. ``ignore`` is the same as the ``ignore``
+        argument of :func:`shutil.copytree`, with directories given as if the
+        tree was a directory. Return the path of the extracted file or
+        directory.
+        """
+        entry = self.entry(path)
+        if entry is None:
+            raise FileNotFoundError(f"{self.path}/{path}")
+        dest = os.fspath(dest)
+        if not entry.is_dir():
+            if os.path.isdir(dest):
+                dest = os.path.join(dest, os.path.basename(entry.path))
+            self.extract_files([(entry, dest)])
+            return dest
+        files = []
+        for member, target in self.members(entry, dest, ignore):
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+            else:
+                files.append((member, target))
+        self.extract_files(files)
+        return dest
+
+    def extract_files(self, files: Iterable[Tuple[Entry, AnyPath]]):
+        """
+        Write the contents of each file entry from ``files`` to the path
+        paired with it. All files are read in a single pass.
+        """
+        files = list(files)
+        targets = {entry.path: dest for entry, dest in files}
+        entries = [entry for entry, _ in files]
+        for entry, f in self.open_files(entries):
+            dest = targets[entry.path]
+            os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+            with open(dest, "wb") as out:
+                shutil.copyfileobj(f, out, _CHUNK_SIZE)
+            # Like tem.util.copy_file, copies are writable by their owner
+            os.chmod(dest, stat.S_IMODE(entry.mode) | stat.S_IWUSR)
+            os.utime(dest, ns=(entry.mtime_ns, entry.mtime_ns))
+
+    def stream(
+        self, path: str, out: IO, ignore: Optional[Callable] = None
+    ) -> None:
+        """
+        Write the file at ``path`` to the file object ``out``. A directory is
+        written as a tar archive, like :func:`tem.put.stream` does.
+        """
+        entry = self.entry(path)
+        if entry is None:
+            raise FileNotFoundError(f"{self.path}/{path}")
+        out.flush()
+        binary_out = getattr(out, "buffer", out)
+        if not entry.is_dir():
+            for _, f in self.open_files([entry]):
+                shutil.copyfileobj(f, binary_out, _CHUNK_SIZE)
+            binary_out.flush()
+            return
+        members = list(
+            self.members(entry, os.path.basename(entry.path), ignore)
+        )
+        arcnames = {member.path: arcname for member, arcname in members}
+
+        def info(member: Entry) -> tarfile.TarInfo:
+            info = tarfile.TarInfo(arcnames[member.path])
+            info.mode = stat.S_IMODE(member.mode)
+            info.mtime = member.mtime_ns // 1_000_000_000
+            info.size = 0 if member.is_dir() else member.size
+            info.type = tarfile.DIRTYPE if member.is_dir() else tarfile.REGTYPE
+            return info
+
+        with tarfile.open(fileobj=binary_out, mode="w|") as tar:
+            # Files may be read in a different order than they are sorted, but
+            # their directories always come first
+            for member, _ in members:
+                if member.is_dir():
+                    tar.addfile(info(member))
+            files = [member for member, _ in members if not member.is_dir()]
+            for member, f in self.open_files(files):
+                tar.addfile(info(member), f)
+        binary_out.flush()
+
+    def members(
+        self, entry: Entry, dest: str, ignore: Optional[Callable]
+    ) -> Iterator[Tuple[Entry, str]]:
+        """
+        Yield the directory ``entry`` and the entries under it that aren't
+        ignored, along with their destination paths under ``dest``.
+        """
+        ignored_dirs = []
+        for member in self.walk(entry.path):
+            if member is not entry and ignore is not None:
+                if any(member.path.startswith(d) for d in ignored_dirs):
+                    continue
+                directory, name = os.path.split(member.path)
+                if ignore(os.path.join(self.path, directory), [name]):
+                    if member.is_dir():
+                        ignored_dirs.append(member.path + "/")
+                    continue
+            relpath = os.path.relpath(member.path, entry.path)
+            yield member, os.path.normpath(os.path.join(dest, relpath))
+
+    def _bisect(self, key: bytes) -> int:
+        """Return the index of the first entry whose path is >= ``key``."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @abstractmethod
+    def _name(self, i: int) -> bytes:
+        """Return the path of the ``i``-th entry."""
+
+    @abstractmethod
+    def _entry(self, i: int) -> Entry:
+        """Return the ``i``-th entry."""
+
+    @abstractmethod
+    def open_files(
+        self, entries: List[Entry]
+    ) -> Iterator[Tuple[Entry, IO]]:
+        """
+        Yield each of the file ``entries`` along with a binary file object
+        that holds its contents, in any order. A file object must be read
+        before the next one is yielded.
+        """
+
+
+class Pack(Tree):
+    """Read-only view of the pack file at ``path``."""
+
+    def __init__(self, path: AnyPath):
+        self.path = os.path.abspath(path)
+        invalid = ValueError(f"'{self.path}' is not a valid pack file")
+        with open(self.path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError:  # The file is empty
+                raise invalid from None
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise invalid
+        magic, version, self._count, names_size = _HEADER.unpack_from(
+            self._mmap
+        )
+        self._names_start = _HEADER.size + self._count * _RECORD.size
+        if (
+            magic != _MAGIC
+            or version != _VERSION
+            # The records and the names must fit in the file
+            or self._names_start + names_size > len(self._mmap)
+        ):
+            self.close()
+            raise invalid
+
+    def close(self):
+        """Unmap the pack file."""
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def read(self, entry: Entry) -> memoryview:
+        """Return the contents of the file ``entry``, without copying them."""
+        return memoryview(self._mmap)[entry.offset : entry.offset + entry.size]
+
+    def open_files(
+        self, entries: List[Entry]
+    ) -> Iterator[Tuple[Entry, IO]]:
+        for entry in entries:
+            yield entry, io.BytesIO(self.read(entry))
+
+    def _record(self, i: int) -> tuple:
+        return _RECORD.unpack_from(self._mmap, _HEADER.size + i * _RECORD.size)
+
+    def _name(self, i: int) -> bytes:
+        name_offset, name_length, *_ = self._record(i)
+        start = self._names_start + name_offset
+        return self._mmap[start : start + name_length]
+
+    def _entry(self, i: int) -> Entry:
+        _, _, mode, offset, size, mtime_ns, digest = self._record(i)
+        path = self._name(i).decode()
+        return Entry(path, mode, offset, size, mtime_ns, digest)
+
+
+#: Packs that have been loaded, with the stat of the file they were loaded from
+_cache: Dict[str, Tuple[Tuple[int, int, int], Pack]] = {}
+
+
+def load(path: AnyPath) -> Pack:
+    """
+    Return the :class:`Pack` at ``path``. The pack is mapped only once per
+    process, unless the file is replaced in the meantime.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = _cache.get(path)
+    if cached is not None:
+        if cached[0] == key:
+            return cached[1]
+        # The file was replaced, so the old mapping is stale
+        with suppress(BufferError):
+            cached[1].close()
+    pack = Pack(path)
+    _cache[path] = (key, pack)
+    return pack
+
+
+def load_tree(path: AnyPath) -> Tree:
+    """
+    Return the :class:`Pack` at ``path``, or the
+    :class:`~tem.archive.Archive` if ``path`` is an archive.
+    """
+    if os.fspath(path).endswith(SUFFIX):
+        return load(path)
+    # pylint: disable-next=import-outside-toplevel,cyclic-import
+    from tem import archive
+
+    return archive.load(path)
+
+
+def is_packed(path: AnyPath) -> bool:
+    """
+    Test if ``path`` names a packed repository: a pack or an archive
+    (see :mod:`tem.archive`).
+    """
+    return os.fspath(path).endswith(_suffixes())
+
+
+def locate(path: AnyPath) -> Optional[Tuple[Tree, str]]:
+    """
+    If ``path`` refers to something inside a packed repository, return the
+    pack and the path inside it. Otherwise, return ``None``. Archives are
+    treated like packs.
+    """
+    path = os.fspath(path)
+    if not any(suffix in path for suffix in _suffixes()):
+        return None
+    pack_path, inner = path, ""
+    while pack_path and pack_path != os.path.dirname(pack_path):
+        if is_packed(pack_path) and os.path.isfile(pack_path):
+            return load_tree(pack_path), inner
+        pack_path, name = os.path.split(pack_path)
+        inner = f"{name}/{inner}" if inner else name
+    return None
+
+
+def build(
+    directory: AnyPath,
+    path: AnyPath = None,
+    ignore: Optional[Callable] = None,
+) -> Tuple[str, bool]:
+    """
+    Pack the contents of ``directory`` into the file at ``path``, which
+    defaults to the path of the directory with :data:`SUFFIX` appended.
+    ``ignore`` is the same as the ``ignore`` argument of
+    :func:`shutil.copytree`.
+
+    If the pack already exists, it is rewritten only if some file in
+    ``directory`` has changed since it was built. Return the path of the pack
+    and whether it was rewritten.
+    """
+    directory = os.path.abspath(directory)
+    path = os.path.abspath(path or directory.rstrip(os.sep) + SUFFIX)
+    files = sorted(_scan(directory, ignore), key=lambda item: item[0])
+    if _is_up_to_date(path, files):
+        return path, False
+
+    names = b""
+    records = []
+    for key, _, st in files:
+        records.append([len(names), len(key), st.st_mode, 0, 0, 0, b""])
+        names += key
+    data_start = _HEADER.size + len(records) * _RECORD.size + len(names)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.seek(data_start)
+        for record, (_, file, st) in zip(records, files):
+            record[3] = f.tell()
+            record[5] = st.st_mtime_ns
+            digest = hashlib.sha256()
+            if stat.S_ISREG(st.st_mode):
+                with open(file, "rb") as src:
+                    while chunk := src.read(_CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+            record[4] = f.tell() - record[3]
+            record[6] = digest.digest()
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(records), len(names)))
+        for record in records:
+            f.write(_RECORD.pack(*record))
+        f.write(names)
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def _suffixes() -> Tuple[str, ...]:
+    # pylint: disable-next=import-outside-toplevel,cyclic-import
+    from tem import archive
+
+    # Unsupported archives are recognized so that they can't be mistaken
+    # for directories
+    return (SUFFIX, *archive.SUFFIXES, *archive.UNSUPPORTED_SUFFIXES)
+
+
+def _key(path: str) -> bytes:
+    return path.strip("/").encode()
+
+
+def _scan(
+    directory: str, ignore: Optional[Callable]
+) -> Iterator[Tuple[bytes, str, os.stat_result]]:
+    """Yield the path key, path and stat of everything under ``directory``."""
+    for root, dirnames, filenames in os.walk(directory):
+        if ignore is not None:
+            ignored = set(ignore(root, dirnames + filenames))
+            dirnames[:] = [d for d in dirnames if d not in ignored]
+            filenames = [f for f in filenames if f not in ignored]
+        for name in dirnames + filenames:
+            file = os.path.join(root, name)
+            relpath = os.path.relpath(file, directory).replace(os.sep, "/")
+            yield relpath.encode(), file, os.stat(file)
+
+
+def _is_up_to_date(path: str, files) -> bool:
+    """Test if the pack at ``path`` was built from the same ``files``."""
+    try:
+        pack = load(path)
+    except (OSError, ValueError):
+        return False
+    if len(pack) != len(files):
+        return False
+    for entry, (key, _, st) in zip(pack.walk(), files):
+        if (
+            entry.path.encode() != key
+            or entry.mode != st.st_mode
+            or not entry.is_dir()
+            and (entry.size, entry.mtime_ns) != (st.st_size, st.st_mtime_ns)
+        ):
+            return False
+    return True
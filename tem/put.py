@@ -0,0 +1,340 @@
+"""
+Copying of templates to their destinations.
+
+:func:`stream` writes a template to stdout, so that it can be piped into
+other programs. Files are written as they are, while directories are written
+as a tar archive. The data is streamed, so memory usage doesn't depend on
+the size of the template.
+
+:func:`update` copies a template like :func:`tem.util.copy` does, but skips
+the files that are already up to date at the destination. By default, a
+file is up to date if its size and modification time are the same as those
+of the template file. Since files are copied along with their modification
+times, this is the case for all files that haven't been touched since the
+last update. Optionally, the contents of files can be compared instead.
+
+Templates can also be copied from packed repositories and archives (see
+:mod:`tem.pack` and :mod:`tem.archive`). The files of such a template are
+extracted together, so that a compressed archive is read only once.
+
+The content hashes of files are recorded in a manifest, along with the
+sizes and modification times of the files. A file is not hashed again unless
+these have changed. If the destination directory is a temdir, the manifest
+is kept in its `.tem/.internal` directory. Otherwise it is kept in the cache
+(see :mod:`tem.cache`), so that the destination doesn't become a temdir.
+"""
+import functools
+import hashlib
+import json
+import os
+import sys
+import tarfile
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from tem import cache, pack, util
+from tem.util.fs import AnyPath
+
+__all__ = ["UpdateReport", "stream", "update"]
+
+#: Name of the manifest file under `.tem/.internal`
+MANIFEST = "put_manifest.json"
+#: Cache namespace of manifests of destinations that aren't temdirs
+_CACHE_NAMESPACE = "put"
+
+_CHUNK_SIZE = 1 << 20
+
+
+class UpdateReport:
+    """Outcome of :func:`update`, as lists of destination paths."""
+
+    def __init__(self):
+        #: Files that didn't exist at the destination
+        self.added: List[str] = []
+        #: Files that differed from the template and were overwritten
+        self.changed: List[str] = []
+        #: Files that were already up to date
+        self.unchanged: List[str] = []
+
+    def __str__(self):
+        return (
+            f"{len(self.added)} added, {len(self.changed)} changed, "
+            f"{len(self.unchanged)} unchanged"
+        )
+
+
+def update(
+    src: AnyPath,
+    dest: AnyPath,
+    checksum=False,
+    ignore: Optional[Callable] = None,
+) -> UpdateReport:
+    """
+    Copy the file or directory ``src`` to ``dest``, only where the files at
+    ``dest`` differ. If ``dest`` is an existing directory and ``src`` is a
+    file, the file is placed under ``dest``.
+
+    Parameters
+    ----------
+    checksum
+        Compare the contents of files, instead of their sizes and modification
+        times.
+    ignore
+        Same as the ``ignore`` argument of :func:`shutil.copytree`.
+    """
+    dest = os.path.abspath(dest)
+    located = pack.locate(src)
+    if located is None:
+        src = os.path.abspath(src)
+    if located is not None and located[0].isdir(located[1]):
+        root = dest
+        files = _pack_files(*located, ignore)
+    elif located is None and os.path.isdir(src):
+        root = dest
+        files = _files(src, ignore)
+    else:
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(src))
+        root = os.path.dirname(dest)
+        files = (
+            _pack_files(*located, ignore)
+            if located is not None
+            else _files(src, ignore)
+        )
+
+    manifest = _load_manifest(root)
+    new_manifest = {}
+    copies = []
+    report = UpdateReport()
+    for file in files:
+        relpath = file.relpath or os.path.basename(dest)
+        dest_file = os.path.join(root, relpath)
+        entry = manifest.get(relpath, {})
+        src_digest = _cached_digest(entry.get("src"), file.path, file.key)
+        try:
+            dest_stat = os.stat(dest_file)
+        except FileNotFoundError:
+            dest_stat = None
+        if dest_stat is None:
+            outcome = report.added
+        elif file.key[0] != dest_stat.st_size or (
+            not checksum and file.key[1] != dest_stat.st_mtime_ns
+        ):
+            outcome = report.changed
+        elif not checksum:
+            outcome = report.unchanged
+        else:
+            src_digest = src_digest or file.digest()
+            dest_digest = _cached_digest(
+                entry.get("dest"), dest_file, _stat_key(dest_stat)
+            ) or _digest(dest_file)
+            if src_digest == dest_digest:
+                outcome = report.unchanged
+            else:
+                outcome = report.changed
+        outcome.append(dest_file)
+
+        if outcome is report.unchanged:
+            if not checksum:
+                dest_digest = _cached_digest(
+                    entry.get("dest"), dest_file, _stat_key(dest_stat)
+                )
+            new_manifest[relpath] = {
+                "src": [file.path, *file.key, src_digest],
+                "dest": [dest_file, *_stat_key(dest_stat), dest_digest],
+            }
+        else:
+            copies.append((file, dest_file, src_digest))
+
+    # Files are copied all at once, so that an archive is read only once
+    if located is None:
+        for file, dest_file, _ in copies:
+            os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+            util.copy_file(file.path, dest_file, metadata=True)
+    else:
+        located[0].extract_files(
+            (file.entry, dest_file) for file, dest_file, _ in copies
+        )
+    for file, dest_file, src_digest in copies:
+        new_manifest[file.relpath or os.path.basename(dest)] = {
+            "src": [file.path, *file.key, src_digest],
+            "dest": [dest_file, *_stat_key(os.stat(dest_file)), src_digest],
+        }
+
+    new_manifest = {**manifest, **new_manifest}
+    if new_manifest != manifest:
+        _save_manifest(root, new_manifest)
+    return report
+
+
+def stream(
+    src: AnyPath, out: IO = None, ignore: Optional[Callable] = None
+) -> None:
+    """
+    Write the template ``src`` to the file object ``out``, which defaults to
+    stdout. A directory is written as an uncompressed tar archive that
+    contains the directory. ``ignore`` is the same as for :func:`update`.
+    """
+    out = out or sys.stdout
+    located = pack.locate(src)
+    if located is not None:
+        packed, path = located
+        packed.stream(path, out, ignore=ignore)
+        return
+    if not os.path.isdir(src):
+        util.cat(src, out)
+        return
+
+    src = os.path.abspath(src)
+    parent = os.path.dirname(src)
+
+    def tar_filter(info: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+        if ignore is None or info.name == os.path.basename(src):
+            return info
+        path = os.path.join(parent, info.name)
+        if ignore(os.path.dirname(path), [os.path.basename(path)]):
+            return None
+        return info
+
+    out.flush()
+    binary_out = getattr(out, "buffer", out)
+    # The "w|" mode writes the archive as a stream, without seeking
+    with tarfile.open(fileobj=binary_out, mode="w|") as tar:
+        tar.add(src, arcname=os.path.basename(src), filter=tar_filter)
+    binary_out.flush()
+
+
+class _SourceFile:
+    """A file of a template, as seen by :func:`update`."""
+
+    __slots__ = ("path", "relpath", "key", "digest", "entry")
+
+    def __init__(self, path, relpath, key, digest, entry=None):
+        #: Path that identifies the file in the manifest
+        self.path: str = path
+        #: Path relative to the template, empty if the template is a file
+        self.relpath: str = relpath
+        #: Size, modification time and change time of the file
+        self.key: Tuple[int, int, int] = key
+        #: Function that returns the digest of the file
+        self.digest: Callable[[], str] = digest
+        #: Entry of the file, if it is inside a pack or an archive
+        self.entry: Optional[pack.Entry] = entry
+
+
+def _files(src: str, ignore: Optional[Callable]) -> Iterator[_SourceFile]:
+    """Yield the files of the template at ``src`` on the filesystem."""
+    paths = _walk(src, ignore) if os.path.isdir(src) else [(src, "")]
+    for path, relpath in paths:
+        yield _SourceFile(
+            path,
+            relpath,
+            _stat_key(os.stat(path)),
+            functools.partial(_digest, path),
+        )
+
+
+def _pack_files(
+    packed: pack.Tree, path: str, ignore: Optional[Callable]
+) -> Iterator[_SourceFile]:
+    """
+    Yield the files of the template at ``path`` inside ``packed``, which is
+    a pack or an archive.
+    """
+    entry = packed.entry(path)
+    if entry is None:
+        raise FileNotFoundError(f"{packed.path}/{path}")
+    members = (
+        packed.members(entry, "", ignore)
+        if entry.is_dir()
+        else [(entry, "")]
+    )
+    for member, relpath in members:
+        if member.is_dir():
+            continue
+        yield _SourceFile(
+            f"{packed.path}/{member.path}",
+            relpath,
+            # Packed files never change, only the whole pack does
+            (member.size, member.mtime_ns, 0),
+            functools.partial(packed.digest, member),
+            member,
+        )
+
+
+def _walk(src: str, ignore: Optional[Callable]) -> Iterator[Tuple[str, str]]:
+    """Yield the files under ``src`` along with their relative paths."""
+    internal = os.path.join(src, ".tem")
+    for directory, dirnames, filenames in os.walk(src):
+        if directory == internal and ".internal" in dirnames:
+            # Internal files of the template would clash with those of the
+            # destination
+            dirnames.remove(".internal")
+        if ignore is not None:
+            ignored = set(ignore(directory, dirnames + filenames))
+            dirnames[:] = [d for d in dirnames if d not in ignored]
+            filenames = [f for f in filenames if f not in ignored]
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            yield path, os.path.relpath(path, src)
+
+
+def _stat_key(stat: os.stat_result) -> Tuple[int, int, int]:
+    # The modification time can be set to an earlier value, but the change
+    # time can't
+    return stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns
+
+
+def _cached_digest(
+    entry: Optional[list], path: str, key: Tuple[int, int, int]
+) -> Optional[str]:
+    """
+    Return the digest recorded in the manifest ``entry``, if it was recorded
+    for the same file with the same stat ``key``.
+    """
+    if entry and entry[:4] == [path, *key]:
+        return entry[4]
+    return None
+
+
+def _digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_path(root: str) -> Optional[str]:
+    """
+    Return the path of the manifest of the destination directory ``root``,
+    or ``None`` if it is kept in the cache.
+    """
+    if not os.path.isdir(os.path.join(root, ".tem")):
+        return None
+    return os.path.join(root, ".tem", ".internal", MANIFEST)
+
+
+def _load_manifest(root: str) -> Dict[str, dict]:
+    path = _manifest_path(root)
+    if path is None:
+        manifest = cache.default().get(_CACHE_NAMESPACE, root)
+    else:
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _save_manifest(root: str, manifest: Dict[str, dict]):
+    path = _manifest_path(root)
+    if path is None:
+        # Entries are validated against the files, so nothing to depend on
+        cache.default().set(_CACHE_NAMESPACE, root, manifest)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
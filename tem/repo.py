@@ -1,7 +1,7 @@
 """Repository operations"""
 import os
 
-from tem import config, util
+from tem import config, errors, pack, util
 
 
 class Repo:
@@ -38,8 +38,22 @@ class Repo:
             return name
         return util.basename(self.path)
 
+    def is_packed(self):
+        """
+        Test if the repo is a packed repository or an archive (see
+        :mod:`tem.pack` and :mod:`tem.archive`).
+        """
+        return pack.is_packed(self.path)
+
     def has_template(self, template):
         """Test if the repo contains `template`."""
+        if self.is_packed():
+            try:
+                return pack.load_tree(self.abspath()).exists(template)
+            except OSError:
+                return False
+            except ValueError as e:
+                raise errors.RepoUnreadableError(self.abspath(), e) from e
         return os.path.exists(util.abspath(self.path + "/" + template))
 
     @staticmethod
@@ -304,12 +318,40 @@ def find_template(template: str, repos=None, at_most=-1):
         if i >= at_most and at_most != -1:
             break
         template_abspath = repo.abspath() + "/" + template
-        if os.path.exists(template_abspath):
+        if repo.has_template(template):
             result_paths.append(template_abspath)
 
     return result_paths
 
 
+def search_templates(query: str, repos=None, limit=None):
+    """
+    Find templates whose paths match ``query`` approximately, using the
+    index from :mod:`tem.search`.
+
+    Parameters
+    ----------
+    query
+        Part of a template path. Characters may be left out, and small typos
+        are tolerated.
+    repos
+        Repositories to search. Defaults to :data:`lookup_path`.
+    limit
+        Maximum number of results.
+
+    Returns
+    -------
+    template_paths : List[str]
+        Absolute paths to the matching templates, best matches first.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from tem import search
+
+    if repos is None:
+        repos = lookup_path
+    return search.search(query, repos, limit)
+
+
 def remove_from_path(remove_repos):
     """Remove matching repos from REPO_PATH environment variable."""
     remove_repo_paths = [r.realpath() for r in remove_repos]
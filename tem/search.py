@@ -0,0 +1,342 @@
+"""
+Fuzzy search for templates by path.
+
+Each repository gets an index of the paths of all its templates, kept in
+tem's cache directory. The index maps each trigram (a sequence of three
+characters) to the list of paths that contain it, so that a query is
+matched against only the paths that share trigrams with it, without
+touching the repository.
+
+The index is kept up to date incrementally. It records the modification
+time of each directory in the repository, and only the directories whose
+modification time has changed are listed again. Checking them takes one
+``stat`` per directory. The index of a packed repository or an archive is
+built again only when the file changes. While a watcher (see
+:mod:`tem.watch`) watches the repository, the index is not checked at all
+until the watcher reports a change.
+
+Paths are ranked as follows, best first:
+
+#. The query is a substring of the file name
+#. The query is a substring of the path
+#. The characters of the query appear in the path in the same order, for
+   example `rdme` in `README.md`
+#. Most of the trigrams of the query appear in the path, which catches
+   typos
+
+Matching ignores case. Within each rank, shorter paths come first.
+
+Examples
+--------
+>>> index = search.load(repo.Repo("~/.local/share/tem/repo"))
+>>> index.search("mkfl")
+['Makefile', 'c/Makefile']
+"""
+import base64
+import bisect
+import collections
+import functools
+import itertools
+import os
+import re
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tem import cache, ignore, pack, watch
+from tem.util.fs import AnyPath
+
+__all__ = ["PathIndex", "index_path", "load", "search"]
+
+#: Version of the index format
+_INDEX_VERSION = 1
+#: Fraction of the trigrams of a query that a path must have to match it
+_MIN_SIMILARITY = 0.5
+#: Names of directories that never contain templates
+_SKIPPED_NAMES = {".tem", ".git"}
+
+
+class PathIndex:
+    """
+    Index of the template paths in the repository at ``path``. Call
+    :meth:`refresh` to bring it up to date with the repository.
+    """
+
+    def __init__(self, path: AnyPath):
+        self.path = os.path.abspath(path)
+        #: Paths of all templates, relative to the repository
+        self.paths: List[str] = []
+        #: Pack key, or modification time and names of each directory
+        self._state: dict = {}
+        #: Token from :func:`tem.watch.token` when the index was refreshed
+        self.watch_token: Optional[str] = None
+        self._trigrams: Dict[str, str] = {}
+        self._decoded: Dict[str, array] = {}
+        #: Lowercase paths separated by newlines, and where each one starts
+        self._text: Optional[str] = None
+        self._starts = array("I")
+
+    def refresh(self) -> bool:
+        """
+        Update the index to match the repository. Return ``True`` if the
+        index has changed.
+        """
+        if pack.is_packed(self.path):
+            return self._refresh_packed()
+        matcher = ignore.load(self.path)
+        if self._state.get("ignore") != matcher.patterns:
+            # Everything must be scanned again with the new patterns
+            self._state = {"ignore": matcher.patterns, "dirs": {}}
+        dirs = self._state["dirs"]
+        changed = False
+        for directory in sorted(dirs):
+            if directory not in dirs:
+                continue  # Removed along with its parent
+            path = os.path.join(self.path, directory)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != dirs[directory][0]:
+                self._scan(directory, matcher)
+                changed = True
+        if "" not in dirs:
+            self._scan("", matcher)
+            changed = True
+        if changed:
+            self._set_paths(
+                os.path.join(directory, name).rstrip("/")
+                for directory, (_, names) in dirs.items()
+                for name in names
+            )
+        return changed
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Return the paths that match ``query``, best matches first. Return at
+        most ``limit`` paths, if it's given.
+        """
+        return [path for _, path in self.ranked(query, limit)]
+
+    def ranked(
+        self, query: str, limit: Optional[int] = None
+    ) -> List[Tuple[tuple, str]]:
+        """
+        Same as :meth:`search`, but return pairs of a sort key and a path, so
+        that results from many indexes can be merged.
+        """
+        query = query.lower()
+        query_trigrams = _trigrams(query)
+        # How many trigrams of the query each path has
+        counts = collections.Counter(
+            itertools.chain.from_iterable(
+                self._postings(trigram) for trigram in query_trigrams
+            )
+        )
+
+        ranked: Dict[int, tuple] = {}
+        for i, count in counts.items():
+            similarity = count / len(query_trigrams)
+            if similarity >= _MIN_SIMILARITY:
+                ranked[i] = _rank(query, self.paths[i], similarity)
+        # Paths that match the query as a subsequence may share no trigrams
+        # with it, so they are looked for only if there aren't enough
+        # results already
+        if limit is None or len(ranked) < limit:
+            for i in self._subsequence_matches(query):
+                if i not in ranked:
+                    ranked[i] = _rank(query, self.paths[i], 0)
+
+        best = sorted(ranked, key=lambda i: (ranked[i], self.paths[i]))
+        return [(ranked[i], self.paths[i]) for i in best[:limit]]
+
+    def _subsequence_matches(self, query: str) -> Iterator[int]:
+        """
+        Yield the indexes of the paths that contain the characters of
+        ``query`` in order. All paths are matched in a single regex search.
+        """
+        if self._text is None:
+            self._text = "\n".join(self.paths).lower()
+            self._starts = array("I", [0])
+            for path in self.paths:
+                self._starts.append(self._starts[-1] + len(path) + 1)
+        last = -1
+        for match in _subsequence_regex(query).finditer(self._text):
+            i = bisect.bisect_right(self._starts, match.start()) - 1
+            if i != last:
+                yield i
+                last = i
+
+    def _refresh_packed(self) -> bool:
+        st = os.stat(self.path)
+        key = [st.st_ino, st.st_size, st.st_mtime_ns]
+        if self._state.get("key") == key:
+            return False
+        self._state = {"key": key}
+        self._set_paths(
+            entry.path
+            for entry in pack.load_tree(self.path).walk()
+            if not _SKIPPED_NAMES.intersection(entry.path.split("/"))
+        )
+        return True
+
+    def _scan(self, directory: str, matcher: ignore.Matcher):
+        """
+        List ``directory`` again, scanning new subdirectories and forgetting
+        the removed ones.
+        """
+        dirs = self._state["dirs"]
+        old_names = dirs.pop(directory, (None, []))[1]
+        path = os.path.join(self.path, directory)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = list(os.scandir(path))
+        except OSError:
+            mtime, entries = None, []
+        names = []
+        for entry in entries:
+            if entry.name in _SKIPPED_NAMES:
+                continue
+            is_dir = entry.is_dir()
+            if matcher.match(entry.path, is_dir=is_dir):
+                continue
+            names.append(entry.name + "/" if is_dir else entry.name)
+        if mtime is not None:
+            dirs[directory] = [mtime, sorted(names)]
+        for name in set(old_names) - set(names):
+            if name.endswith("/"):
+                self._forget(os.path.join(directory, name.rstrip("/")))
+        for name in names:
+            subdirectory = os.path.join(directory, name.rstrip("/"))
+            if name.endswith("/") and subdirectory not in dirs:
+                self._scan(subdirectory, matcher)
+
+    def _forget(self, directory: str):
+        dirs = self._state["dirs"]
+        for name in dirs.pop(directory, (None, []))[1]:
+            if name.endswith("/"):
+                self._forget(os.path.join(directory, name.rstrip("/")))
+
+    def _set_paths(self, paths: Iterable[str]):
+        self.paths = sorted(paths)
+        postings: Dict[str, array] = {}
+        for i, path in enumerate(self.paths):
+            for trigram in _trigrams(path.lower()):
+                postings.setdefault(trigram, array("I")).append(i)
+        self._decoded = postings
+        self._trigrams = {}
+        self._text = None
+
+    def _postings(self, trigram: str) -> array:
+        """Return the indexes of the paths that contain ``trigram``."""
+        postings = self._decoded.get(trigram)
+        if postings is None:
+            postings = array("I")
+            encoded = self._trigrams.get(trigram)
+            if encoded is not None:
+                postings.frombytes(base64.b64decode(encoded))
+            self._decoded[trigram] = postings
+        return postings
+
+    def to_dict(self) -> dict:
+        """Return the index as a dictionary that can be stored as JSON."""
+        trigrams = dict(self._trigrams)
+        for trigram, postings in self._decoded.items():
+            if postings:
+                trigrams[trigram] = base64.b64encode(postings).decode()
+        return {
+            "version": _INDEX_VERSION,
+            "state": self._state,
+            "watch": self.watch_token,
+            "paths": self.paths,
+            "trigrams": trigrams,
+        }
+
+    @classmethod
+    def from_dict(cls, path: AnyPath, data: dict) -> "PathIndex":
+        """Inverse of :meth:`to_dict`."""
+        if data.get("version") != _INDEX_VERSION:
+            raise ValueError("unsupported index version")
+        index = cls(path)
+        index._state = data["state"]
+        index.watch_token = data.get("watch")
+        index.paths = data["paths"]
+        # Postings are decoded only when a query needs them
+        index._trigrams = data["trigrams"]
+        return index
+
+
+def index_path(path: AnyPath) -> str:
+    """Return the path of the index of the repository at ``path``."""
+    return cache.default().path("search", os.path.abspath(path))
+
+
+def load(repo) -> PathIndex:
+    """
+    Return the up to date index of ``repo``. The index is saved to the cache
+    if it has changed.
+    """
+    path = repo.abspath()
+    data = cache.default().get("search", path, {})
+    try:
+        index = PathIndex.from_dict(path, data)
+    except (ValueError, KeyError, TypeError):
+        index = PathIndex(path)
+    # The token must be taken before the repository is scanned, so that
+    # changes made during the scan invalidate the index
+    token = watch.token(path)
+    if token is not None and token == index.watch_token:
+        return index
+    if index.refresh() or token != index.watch_token:
+        index.watch_token = token
+        cache.default().set("search", path, index.to_dict())
+    return index
+
+
+def search(query: str, repos, limit: Optional[int] = None) -> List[str]:
+    """
+    Find the templates in ``repos`` that match ``query``. Return their
+    absolute paths, best matches first.
+    """
+    ranked = []
+    for repo in repos:
+        index = load(repo)
+        for rank, path in index.ranked(query, limit):
+            ranked.append((rank, index.path, path))
+    ranked.sort()
+    return [f"{repo_path}/{path}" for _, repo_path, path in ranked[:limit]]
+
+
+def _trigrams(text: str) -> List[str]:
+    return list({text[i : i + 3] for i in range(len(text) - 2)})
+
+
+@functools.lru_cache(maxsize=16)
+def _subsequence_regex(query: str) -> re.Pattern:
+    # Each gap excludes the character that follows it, so that there is only
+    # one way to match and no backtracking
+    gaps = [f"[^{re.escape(c)}\n]*" for c in query[1:]]
+    return re.compile(
+        re.escape(query[:1])
+        + "".join(gap + re.escape(c) for gap, c in zip(gaps, query[1:]))
+    )
+
+
+def _rank(query: str, path: str, similarity: float) -> Optional[tuple]:
+    """
+    Return a sort key for how well ``path`` matches ``query``, or ``None``
+    if it doesn't match. ``similarity`` is the fraction of the trigrams of
+    the query that the path contains.
+    """
+    lowered = path.lower()
+    name = lowered.rsplit("/", 1)[-1]
+    if query in name:
+        rank = 0 if name.startswith(query) else 1
+    elif query in lowered:
+        rank = 2
+    elif _subsequence_regex(query).search(lowered):
+        rank = 3
+    elif similarity >= _MIN_SIMILARITY:
+        rank = 4
+    else:
+        return None
+    return rank, -similarity, len(path)
@@ -1,7 +1,34 @@
-"""Python bindings for shell commands."""
+"""
+Python bindings for shell commands.
 
+Commands are not written to the shell source file (see
+:data:`~tem.env.vars.shell_source`) as soon as they are issued. Instead, they
+are collected for the whole tem invocation and written at once when the
+process exits, or when :func:`flush` is called. The file is replaced
+atomically, so the parent shell never sources a partially written file.
+Exporting the same variable multiple times results in a single export of
+the last value.
+
+Examples
+--------
+>>> from tem.shell import commands
+>>> with commands.transaction():
+>>>     commands.export("VAR", "1")
+>>>     commands.export("VAR", "2")
+>>>     commands.command("echo", "$VAR")
+# The source file now contains:
+# export VAR=2
+# echo '$VAR'
+"""
+
+import atexit
 import os
 import shlex
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Hashable, List, Optional
+
+from . import Shell, shell
 
 
 class _Util:
@@ -11,17 +38,87 @@ class _Util:
     properties.
     """
 
+    #: Commands that haven't been written yet. Commands with the same key
+    #: replace each other.
+    pending: Dict[Hashable, str] = {}
+    #: Number of nested transactions
+    transactions = 0
+    #: Whether :func:`flush` is registered to run at exit
+    flush_at_exit = False
+
     @classmethod
-    def eval(cls, text: str):
-        """Instruct the shell that it should evaluate ``text``."""
+    def eval(cls, text: str, key: Optional[Hashable] = None):
+        """
+        Instruct the shell that it should evaluate ``text``. If a command
+        with the same ``key`` is pending, it is replaced by ``text``.
+        """
+        cls.source_path()  # Fail early if there is no source file
+        # A replacing command must run after all commands issued before it
+        cls.pending.pop(key, None)
+        cls.pending[key if key is not None else object()] = text
+        if not cls.flush_at_exit:
+            atexit.register(flush)
+            cls.flush_at_exit = True
+
+    @staticmethod
+    def source_path() -> str:
+        """Path to the file that the shell will source."""
         path = os.environ.get("__TEM_SHELL_SOURCE")
         if not path:
             raise EnvironmentError(
                 "No '__TEM_SHELL_SOURCE' environment variable"
             )
+        return path
 
-        with open(path, "a", encoding="utf-8") as file:
-            print(text, file=file)
+    @staticmethod
+    def write(path: str, text: str):
+        """Append ``text`` to the file at ``path`` atomically."""
+        try:
+            with open(path, encoding="utf-8") as file:
+                text = file.read() + text
+        except FileNotFoundError:
+            pass
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=".tem-"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def flush():
+    """
+    Write all pending commands to the shell source file. This happens
+    automatically when the process exits.
+    """
+    if not _Util.pending or _Util.transactions:
+        return
+    text = "".join(f"{command}\n" for command in _Util.pending.values())
+    _Util.pending.clear()
+    _Util.write(_Util.source_path(), text)
+
+
+@contextmanager
+def transaction():
+    """
+    Context manager that groups commands together. The commands are flushed
+    when the outermost transaction ends. If the transaction is interrupted by
+    an exception, the commands issued inside it are discarded.
+    """
+    pending = dict(_Util.pending)
+    _Util.transactions += 1
+    try:
+        yield
+    except BaseException:
+        _Util.pending = pending
+        raise
+    finally:
+        _Util.transactions -= 1
+    flush()
 
 
 def set(variable_name: str, value: str):
@@ -30,7 +127,38 @@ def set(variable_name: str, value: str):
 
 def export(variable, value):
     """Export a variable named ``variable`` with value ``value``."""
-    _Util.eval(f"export {variable}={shlex.quote(value)}")
+    _Util.eval(
+        f"export {variable}={shlex.quote(value)}", key=("export", variable)
+    )
+
+
+def update_path(remove: List[str], prepend: List[str]):
+    """
+    Update the `PATH` variable by removing the leading entries ``remove``
+    and prepending ``prepend``. The rest of `PATH` is not part of the
+    command, so it stays short even when `PATH` is long.
+    """
+    if shell() == Shell.FISH:
+        commands = []
+        if remove:
+            commands.append(f"set -e PATH[1..{len(remove)}]")
+        if prepend:
+            paths = " ".join(_fish_quote(path) for path in prepend)
+            commands.append(f"set -gx PATH {paths} $PATH")
+    else:
+        rest = (
+            f"${{PATH#{shlex.quote(os.pathsep.join(remove) + os.pathsep)}}}"
+            if remove
+            else "$PATH"
+        )
+        prefix = (
+            shlex.quote(os.pathsep.join(prepend) + os.pathsep)
+            if prepend
+            else ""
+        )
+        commands = [f"PATH={prefix}{rest}", "export PATH"]
+    for cmd in commands:
+        _Util.eval(cmd)
 
 
 def command(cmd, *args):
@@ -42,3 +170,8 @@ def function(
     name,
 ):
     pass
+
+
+def _fish_quote(value: str) -> str:
+    value = value.replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{value}'"
@@ -0,0 +1,296 @@
+"""
+Content-addressed object store, shared by repositories.
+
+When the same file is added to many repositories, each repository normally
+gets its own copy. With a store, the contents of the file are written once,
+as an object named after their SHA-256 digest, and the file in each
+repository is a link to the object. The store must be on the same
+filesystem as the repositories, so that the links are possible.
+
+Files are linked in one of two ways:
+
+reflink
+    The file shares its data blocks with the object, but is otherwise
+    independent of it. Changes to the file don't affect the object.
+    Reflinks need a filesystem that supports them, like Btrfs or XFS.
+hardlink
+    The file and the object are the same inode. This works on any
+    filesystem, but a change to the contents of the file in one repository
+    would change it in all of them, so hard linked objects are made
+    read-only. Editors that save files by replacing them are safe to use.
+
+Each method is tried in turn, and the file is copied if none of them work.
+
+An object is referenced as long as it has hard links besides its own entry
+in the store. :meth:`Store.gc` removes the objects that aren't referenced.
+Reflinked objects are never referenced: once all files are linked, the
+object is only needed to avoid writing the same contents again.
+
+The store is configured with the `store.path` and `store.link` options.
+
+Examples
+--------
+>>> s = store.Store("/shared/tem-store")
+>>> s.add("asset.bin", "/shared/repo1/asset.bin")
+'/shared/repo1/asset.bin'
+>>> s.add("asset.bin", "/shared/repo2/asset.bin")  # Nothing is written
+'/shared/repo2/asset.bin'
+>>> s.gc()
+(0, 0)
+"""
+import contextlib
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from tem import errors
+from tem.config import cfg
+from tem.util.fs import AnyPath
+
+__all__ = ["LINK_METHODS", "Store", "from_config"]
+
+#: Ways of linking a file to an object, in the order they are tried
+LINK_METHODS = ("reflink", "hardlink")
+
+#: ``ioctl`` request that clones a file on Linux
+_FICLONE = 0x40049409
+_CHUNK_SIZE = 1 << 20
+#: Errors that mean that a link is not possible, rather than a failure
+_LINK_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EMLINK,
+    errno.EPERM,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+}
+
+#: Digests of files that have been read, by device, inode, size and mtime
+_digests: Dict[Tuple[int, int, int, int], str] = {}
+
+
+class Store:
+    """
+    Object store in the directory ``path``. Files are linked to objects
+    using ``link_methods``, a subset of :data:`LINK_METHODS`.
+    """
+
+    def __init__(
+        self, path: AnyPath, link_methods: Iterable[str] = LINK_METHODS
+    ):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.link_methods = list(link_methods)
+        for method in self.link_methods:
+            if method not in LINK_METHODS:
+                raise ValueError(f"invalid link method '{method}'")
+
+    def object_path(self, digest: str, mode: int) -> str:
+        """
+        Return the path of the object with the contents ``digest``. Files with
+        the same contents but different permissions are different objects,
+        since hard links share their permissions.
+        """
+        return os.path.join(
+            self.path,
+            "objects",
+            digest[:2],
+            f"{digest[2:]}.{stat.S_IMODE(mode):o}",
+        )
+
+    def put(self, file: AnyPath) -> str:
+        """
+        Store the contents of ``file``, if they are not stored already.
+        Return the path of the object.
+        """
+        st = os.stat(file)
+        digest = _digest(file, st)
+        obj = self.object_path(digest, st.st_mode)
+        with contextlib.suppress(FileNotFoundError):
+            # A hard link may have been modified in place despite being
+            # read-only, in which case the object no longer has the contents
+            # it's named after, and it's replaced
+            if _digest(obj, os.stat(obj)) == digest:
+                return obj
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        tmp_dir = os.path.join(self.path, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        os.close(fd)
+        try:
+            _clone_or_copy(file, tmp_path)
+            os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+            # Another process may have stored the same contents meanwhile,
+            # which is fine, since they are the same
+            os.replace(tmp_path, obj)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        # The object doesn't have to be read again to be verified
+        _digests[_digest_key(os.stat(obj))] = digest
+        return obj
+
+    def link(self, obj: AnyPath, dest: AnyPath) -> str:
+        """
+        Make ``dest`` a link to the object ``obj``, replacing ``dest`` if it
+        exists. Return the method that was used: one of
+        :attr:`link_methods`, or ``"copy"``.
+        """
+        dest = os.fspath(dest)
+        # The link is made next to dest first, so that dest is replaced at once
+        tmp_path = f"{dest}.tem-{os.getpid()}.tmp"
+        mode = _object_mode(obj)
+        for method in self.link_methods:
+            try:
+                if method == "hardlink":
+                    # Keeps the object from being modified through the link
+                    if os.stat(obj).st_mode & 0o222:
+                        os.chmod(obj, mode & ~0o222)
+                    os.link(obj, tmp_path)
+                else:
+                    _reflink(obj, tmp_path)
+                    os.chmod(tmp_path, mode)
+            except OSError as e:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                if e.errno not in _LINK_UNSUPPORTED:
+                    raise
+                continue
+            os.replace(tmp_path, dest)
+            return method
+        shutil.copy2(obj, tmp_path)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, dest)
+        return "copy"
+
+    def add(
+        self, src: AnyPath, dest: AnyPath, ignore: Optional[Callable] = None
+    ) -> str:
+        """
+        Same as :func:`tem.util.copy`, but each regular file is stored and
+        linked to ``dest`` instead of being copied.
+        """
+        with self._lock(exclusive=False):
+            return self._add(os.fspath(src), os.fspath(dest), ignore)
+
+    def _add(self, src: str, dest: str, ignore: Optional[Callable]) -> str:
+        if os.path.isdir(dest) and not os.path.isdir(src):
+            dest = os.path.join(dest, os.path.basename(src))
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        if not os.path.isdir(src):
+            self.link(self.put(src), dest)
+            return dest
+        for directory, dirnames, filenames in os.walk(src):
+            if ignore is not None:
+                ignored = set(ignore(directory, dirnames + filenames))
+                dirnames[:] = [d for d in dirnames if d not in ignored]
+                filenames = [f for f in filenames if f not in ignored]
+            target_dir = os.path.join(dest, os.path.relpath(directory, src))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in filenames:
+                file = os.path.join(directory, name)
+                target = os.path.join(target_dir, name)
+                if os.path.isfile(file) and not os.path.islink(file):
+                    self.link(self.put(file), target)
+                else:
+                    shutil.copy2(file, target, follow_symlinks=False)
+        return os.path.normpath(dest)
+
+    def objects(self) -> Iterator[os.DirEntry]:
+        """Iterate over all objects in the store."""
+        objects_dir = os.path.join(self.path, "objects")
+        with contextlib.suppress(FileNotFoundError):
+            for prefix in os.scandir(objects_dir):
+                if prefix.is_dir(follow_symlinks=False):
+                    yield from os.scandir(prefix.path)
+
+    def gc(self) -> Tuple[int, int]:
+        """
+        Remove the objects that no file links to. Return the number of
+        removed objects and the number of bytes they took up.
+        """
+        removed = freed = 0
+        # Objects that are being added are not linked yet
+        with self._lock(exclusive=True):
+            for obj in self.objects():
+                st = obj.stat(follow_symlinks=False)
+                if st.st_nlink > 1:
+                    continue
+                os.remove(obj.path)
+                removed += 1
+                freed += st.st_size
+            # Leftovers from interrupted calls to put()
+            with contextlib.suppress(FileNotFoundError):
+                for tmp in os.scandir(os.path.join(self.path, "tmp")):
+                    os.remove(tmp.path)
+        return removed, freed
+
+    @contextlib.contextmanager
+    def _lock(self, exclusive: bool):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "w", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def from_config() -> Optional[Store]:
+    """
+    Return the store configured by the `store.path` and `store.link`
+    options, or ``None`` if no store is configured.
+    """
+    path = cfg["store.path"].strip()
+    if not path:
+        return None
+    link_methods = cfg["store.link"].split() or LINK_METHODS
+    try:
+        return Store(path, link_methods)
+    except ValueError as e:
+        raise errors.TemError(f"store.link: {e}") from e
+
+
+def _digest(file: AnyPath, st: os.stat_result) -> str:
+    """Return the SHA-256 digest of ``file``, reading it at most once."""
+    key = _digest_key(st)
+    if key not in _digests:
+        digest = hashlib.sha256()
+        with open(file, "rb") as f:
+            while chunk := f.read(_CHUNK_SIZE):
+                digest.update(chunk)
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+def _digest_key(st: os.stat_result) -> Tuple[int, int, int, int]:
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _object_mode(obj: AnyPath) -> int:
+    """Return the permissions that the object ``obj`` is named after."""
+    return int(os.fspath(obj).rsplit(".", 1)[1], 8)
+
+
+def _reflink(src: AnyPath, dest: AnyPath):
+    """Clone ``src`` to a new file at ``dest``, sharing its data blocks."""
+    with open(src, "rb") as in_file, open(dest, "xb") as out_file:
+        fcntl.ioctl(out_file.fileno(), _FICLONE, in_file.fileno())
+    shutil.copystat(src, dest)
+
+
+def _clone_or_copy(src: AnyPath, dest: AnyPath):
+    """Write the contents of ``src`` to the existing file ``dest``."""
+    with open(src, "rb") as in_file, open(dest, "wb") as out_file:
+        try:
+            fcntl.ioctl(out_file.fileno(), _FICLONE, in_file.fileno())
+        except OSError as e:
+            if e.errno not in _LINK_UNSUPPORTED:
+                raise
+            shutil.copyfileobj(in_file, out_file, _CHUNK_SIZE)
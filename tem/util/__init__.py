@@ -1,11 +1,14 @@
 """Utility functions and classes"""
 import contextlib
 import contextvars
+import errno
 import importlib.util
+import io
 import os
 import re
 import select
 import shutil
+import stat
 import sys
 import types
 from typing import Any, Iterable
@@ -36,6 +39,17 @@ def shortpath(path):
     return re.sub("^" + re.escape(os.path.expanduser("~")), "~", path)
 
 
+def cache_path(*parts):
+    """
+    Get the path of ``parts`` joined under tem's cache directory,
+    `$XDG_CACHE_HOME/tem`.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+        "~/.cache"
+    )
+    return os.path.join(cache_home, "tem", *parts)
+
+
 # TODO try to remember where I wanted to use this?
 def explicit_path(path):
     """
@@ -56,10 +70,11 @@ def explicit_path(path):
     return path
 
 
-def copy(src, dest=".", symlink=False):
+def copy(src, dest=".", symlink=False, ignore=None):
     """
     Copy ``src`` to ``dest``. If ``dest`` is a directory, ``src`` will be
-    placed under it. Create a symlink if ``symlink`` is True.
+    placed under it. Create a symlink if ``symlink`` is True. If ``src`` is a
+    directory, ``ignore`` is passed on to :func:`shutil.copytree`.
     """
     # TODO add `force` argument
 
@@ -78,10 +93,28 @@ def copy(src, dest=".", symlink=False):
             return ""
     elif os.path.isdir(src):
         return shutil.copytree(
-            src, dest, dirs_exist_ok=True, copy_function=shutil.copy
+            src,
+            dest,
+            dirs_exist_ok=True,
+            copy_function=copy_file,
+            ignore=ignore,
         )
 
-    return shutil.copy(src, dest)
+    return copy_file(src, dest)
+
+
+def copy_file(src, dest, metadata=False):
+    """
+    Copy the file ``src`` to ``dest`` like :func:`shutil.copy`, or like
+    :func:`shutil.copy2` if ``metadata`` is true. The copy is writable by its
+    owner, even if ``src`` is a read-only file from a store (see
+    :mod:`tem.store`).
+    """
+    dest = (shutil.copy2 if metadata else shutil.copy)(src, dest)
+    mode = os.stat(dest).st_mode
+    if not mode & stat.S_IWUSR:
+        os.chmod(dest, mode | stat.S_IWUSR)
+    return dest
 
 
 def move(src, dest):
@@ -99,10 +132,48 @@ def remove(path):
         os.remove(path)
 
 
-def cat(file):
-    """Same as coreutils `cat` program."""
-    with open(file, "r", encoding="utf-8") as f:
-        print(f.read(), sep="\n")
+def cat(file, out=None):
+    """
+    Same as coreutils `cat` program. The contents of ``file`` are written
+    unmodified to the file object ``out``, which defaults to stdout. When
+    possible, the data is copied by the kernel, without passing through
+    python.
+    """
+    out = out or sys.stdout
+    out.flush()
+    with open(file, "rb") as f:
+        try:
+            out_fd = out.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            shutil.copyfileobj(f, getattr(out, "buffer", out))
+            return
+        copy_fd(f.fileno(), out_fd)
+
+
+#: Errors from :func:`os.sendfile` meaning that it can't handle the files
+_SENDFILE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSUP}
+
+
+def copy_fd(in_fd: int, out_fd: int, chunk_size=1 << 20):
+    """
+    Copy everything from the current position of ``in_fd`` to ``out_fd``,
+    using :func:`os.sendfile` if the platform supports it for the two files,
+    and a chunked copy otherwise.
+    """
+    offset = os.lseek(in_fd, 0, os.SEEK_CUR)
+    if hasattr(os, "sendfile"):
+        try:
+            while sent := os.sendfile(out_fd, in_fd, offset, chunk_size):
+                offset += sent
+            return
+        except OSError as e:
+            if e.errno not in _SENDFILE_UNSUPPORTED:
+                raise
+    os.lseek(in_fd, offset, os.SEEK_SET)
+    while chunk := os.read(in_fd, chunk_size):
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(out_fd, view) :]
 
 
 def make_file_executable(path):
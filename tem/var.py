@@ -1,14 +1,28 @@
 """Variables defined per directory."""
-import functools
+import ast
+import copy
 import glob
+import json
 import os
+import pathlib
 import shelve
-from contextlib import ExitStack
+from contextlib import ExitStack, suppress
 from textwrap import TextWrapper
-from typing import Any, Dict, Iterable, Union, cast
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
 import tem
-from tem import context, util
+from tem import context, util, watch
 from tem.env import Environment
 from tem.errors import TemVariableNotDefinedError, TemVariableValueError
 from tem.fs import AnyPath, TemDir
@@ -21,6 +35,10 @@ class __NoInit(type):
         return cls.__new__(cls, *args, **kwargs)
 
 
+#: Sentinel for missing values
+_MISSING = object()
+
+
 class FromEnv:
     """
     Special sentinel value indicating that a variable's value should be
@@ -57,7 +75,16 @@ class Variable(metaclass=__NoInit):
           a :class:`Variant` will be created instead.
     """
 
-    # TODO __slots__ = ("var_type", "value", "to_env", "doc")
+    __slots__ = (
+        "var_type",
+        "default",
+        "from_env",
+        "to_env",
+        "_value",
+        "_doc",
+        "_env_cache",
+        "_env_lookup",
+    )
 
     @property
     def value(self, *, ignore_env=False):
@@ -68,16 +95,17 @@ class Variable(metaclass=__NoInit):
             and self.from_env
             and isinstance(self._value, FromEnv)
         ):
-
-            class NonExistent:
-                """Special sentinel value."""
-
-            raw_value = os.environ.get(self.from_env, NonExistent)
-            return (
-                self._convert_to_var_type(raw_value)
-                if raw_value != NonExistent
-                else self._value.fallback
-            )
+            raw_value = os.environ.get(self.from_env, _MISSING)
+            if raw_value is _MISSING:
+                return self._value.fallback
+            # The environment rarely changes between reads, so the result of
+            # the last conversion is remembered
+            cached_raw_value, converted_value = self._env_cache
+            if raw_value != cached_raw_value:
+                converted_value = self._convert_to_var_type(raw_value)
+                if isinstance(converted_value, Hashable):
+                    self._env_cache = (raw_value, converted_value)
+            return converted_value
 
         return (
             self._value
@@ -127,7 +155,9 @@ class Variable(metaclass=__NoInit):
             if default is not None
             else self._default_value_for_type(var_type)
         )
-        super().__setattr__("doc", VariableDoc(self))
+        self._doc = None
+        self._env_cache = (_MISSING, None)
+        self._env_lookup = None
 
     def __new__(
         cls,
@@ -148,12 +178,21 @@ class Variable(metaclass=__NoInit):
         )
         return variable
 
-    def __setattr__(self, key, value):
-        if key == "doc":
-            # pylint: disable-next=no-member
-            self.doc.description = value
-        else:
-            super().__setattr__(key, value)
+    @property
+    def doc(self) -> "VariableDoc":
+        """
+        Documentation of the variable. Assigning a string to this property
+        sets the description of the variable.
+        """
+        # Most variables are never documented, so the object is created
+        # only when it's needed
+        if self._doc is None:
+            self._doc = VariableDoc(self)
+        return self._doc
+
+    @doc.setter
+    def doc(self, description: str):
+        self.doc.description = description
 
     @staticmethod
     def _matches_type(value, var_type: Union[type, Any, list]):
@@ -165,6 +204,9 @@ class Variable(metaclass=__NoInit):
 
     @staticmethod
     def _default_value_for_type(var_type):
+        # `Any` is a class since python 3.11, but it can't be instantiated
+        if var_type == Any:
+            return None
         if isinstance(var_type, type):
             return var_type()
         elif isinstance(var_type, Iterable):
@@ -182,8 +224,28 @@ class Variable(metaclass=__NoInit):
                 return self.var_type(value)
             except Exception:
                 raise TemVariableValueError(value=value) from None
+
+        # Variable type is an array of possible values. The string forms of
+        # the allowed values are looked up in a table, other strings go
+        # through the full conversion.
+        if self._env_lookup is None:
+            self._env_lookup = {}
+            for allowed_value in cast(Iterable, self.var_type):
+                with suppress(TemVariableValueError):
+                    self._env_lookup.setdefault(
+                        str(allowed_value),
+                        self._convert_to_allowed_value(str(allowed_value)),
+                    )
+        if isinstance(value, str) and value in self._env_lookup:
+            return self._env_lookup[value]
+        return self._convert_to_allowed_value(value)
+
+    def _convert_to_allowed_value(self, value):
+        """
+        Convert ``value`` to the first allowed value whose type can represent
+        ``value``.
+        """
         exception = None
-        # Variable type is an array of possible values.
         # Go through all allowed values and see if `value` can be converted to
         # any of those.
         for allowed_value in cast(Iterable, self.var_type):
@@ -203,6 +265,7 @@ class VariableDoc(str):
     def __init__(self, variable: Variable):
         self._value_docs: Dict[Any, str] = {}
         self._variable = variable
+        self._str = None
         self.description = ""
         super().__init__()
 
@@ -211,23 +274,29 @@ class VariableDoc(str):
         if not Variable._matches_type(value, self._variable.var_type):
             raise TemVariableValueError(value=value)
         self._value_docs[value] = doc
+        self._str = None
 
     def __getitem__(self, value):
         return self._value_docs[value]
 
     def __delitem__(self, value):
         del self._value_docs[value]
+        self._str = None
 
     def __iter__(self):
         return iter(self._value_docs)
 
     def __setattr__(self, key, value):
         if key == "description":
-            self.__str__.cache_clear()
+            self._str = None
         super().__setattr__(key, value)
 
-    @functools.lru_cache(maxsize=1)
     def __str__(self):
+        if self._str is None:
+            self._str = self._render()
+        return self._str
+
+    def _render(self):
         doc = self.description
 
         # If variable has a regular type
@@ -296,6 +365,8 @@ class VariableDoc(str):
 class Variant(Variable):
     """A tem variable with a type of ``bool``."""
 
+    __slots__ = ()
+
     def __init__(
         self,
         default=None,
@@ -356,23 +427,28 @@ class VariableContainer:
         __dict__ = _filter_variables(variable_dict)
         object.__setattr__(self, "__dict__", __dict__)
 
-    def __getattribute__(self, attr):
-        __dict__ = object.__getattribute__(self, "__dict__")
-        if not (__dict__ and attr in __dict__):
-            return object.__getattribute__(self, attr)
-
-        attribute = __dict__[attr]
-        if isinstance(attribute, Variable):
-            return __dict__[attr].value
+    # The dictionary contains only variables, so each attribute access costs a
+    # single dictionary lookup. Other attributes are looked up normally.
+    # Names like `__dict__` can't be variables (see `_filter_variables`), so
+    # they never reach the dictionary, which may load variables lazily.
 
-        return attribute
+    def __getattribute__(self, attr):
+        if not _is_private(attr):
+            try:
+                return _get_dict(self)[attr].value
+            except KeyError:
+                pass
+        return object.__getattribute__(self, attr)
 
     def __setattr__(self, attr, value):
-        attribute = object.__getattribute__(self, attr)
-        if isinstance(attribute, Variable):
-            attribute.value = value
-        else:
-            object.__setattr__(self, attr, value)
+        try:
+            if _is_private(attr):
+                raise KeyError(attr)
+            _get_dict(self)[attr].value = value
+        except KeyError:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no variable '{attr}'"
+            ) from None
 
     def __getitem__(self, name: str) -> Variable:
         """Return the variable wrapped by this container named ``name``."""
@@ -392,10 +468,157 @@ class VariableContainer:
         return (variable for variable in self.__dict__)
 
 
+def _get_dict(container: VariableContainer) -> dict:
+    return object.__getattribute__(container, "__dict__")
+
+
+def _is_private(name: str) -> bool:
+    return name.startswith("_") and name.endswith("_")
+
+
+class LazyVariableContainer(VariableContainer):
+    """
+    A :class:`VariableContainer` that loads each variable only when it is
+    accessed.
+
+    An index of variable names is kept for each temdir, so that only the
+    `vars.py` file that defines the accessed variable is executed. Iterating
+    over the container or taking its length loads all variables.
+
+    Parameters
+    ----------
+    temdirs
+        Temdirs to load variables from, sorted from the lowest to the topmost
+        one in the filesystem hierarchy.
+    defaults, override_env
+        See :func:`load`.
+    """
+
+    # pylint: disable-next=super-init-not-called
+    def __init__(
+        self, temdirs: List[TemDir], defaults=False, override_env=True
+    ):
+        object.__setattr__(
+            self,
+            "__dict__",
+            _LazyVariableDict(temdirs, defaults, override_env),
+        )
+
+
+class _LazyVariableDict(dict):
+    """
+    Variable dictionary of a :class:`LazyVariableContainer`. Variables are
+    inserted into the dictionary the first time they are looked up.
+    """
+
+    def __init__(self, temdirs, defaults, override_env):
+        super().__init__()
+        self.temdirs = temdirs
+        self.defaults = defaults
+        self.override_env = override_env
+        #: Maps each loaded variable name to the temdir that defines it
+        self.sources: Dict[str, TemDir] = {}
+        self._definitions: Dict[TemDir, Dict[str, Variable]] = {}
+        self._stored_values: Dict[TemDir, Dict[str, Any]] = {}
+        self._index: Optional[List[Tuple[TemDir, Optional[set]]]] = None
+        self._undefined: Set[str] = set()
+        self._complete = False
+
+    def __contains__(self, name):
+        return super().__contains__(name) or self._resolve(name)
+
+    def __missing__(self, name):
+        if self._resolve(name):
+            return super().__getitem__(name)
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __iter__(self):
+        self._resolve_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self._resolve_all()
+        return super().__len__()
+
+    def keys(self):
+        self._resolve_all()
+        return super().keys()
+
+    def values(self):
+        self._resolve_all()
+        return super().values()
+
+    def items(self):
+        self._resolve_all()
+        return super().items()
+
+    def _resolve(self, name) -> bool:
+        """Load variable ``name`` and return ``True`` if it is defined."""
+        if self._complete or name in self._undefined:
+            return False
+        if self._index is None:
+            self._index = [
+                (temdir, names)
+                for temdir in self.temdirs
+                if (names := _variable_names(temdir)) is None or names
+            ]
+        for temdir, names in self._index:
+            # A `None` means that the names can't be determined statically
+            if names is not None and name not in names:
+                continue
+            definitions = self._load_definitions(temdir)
+            if name not in definitions:
+                continue
+            variable = definitions[name]
+            if not self.defaults:
+                stored_values = self._load_stored_values(temdir)
+                if name in stored_values:
+                    value = stored_values[name]
+                    variable.value = (
+                        value if self.override_env else FromEnv(value)
+                    )
+            super().__setitem__(name, variable)
+            self.sources[name] = temdir
+            return True
+        self._undefined.add(name)
+        return False
+
+    def _resolve_all(self):
+        if self._complete:
+            return
+        for temdir in self.temdirs:
+            for name in self._load_definitions(temdir):
+                if not super().__contains__(name):
+                    self._resolve(name)
+        self._complete = True
+
+    def _load_definitions(self, temdir) -> Dict[str, Variable]:
+        if temdir not in self._definitions:
+            self._definitions[temdir] = _load_variable_definitions(
+                temdir / ".tem/vars.py"
+            )
+        return self._definitions[temdir]
+
+    def _load_stored_values(self, temdir) -> Dict[str, Any]:
+        if temdir not in self._stored_values:
+            # pylint: disable-next=protected-access
+            saved_vars_path = str(temdir._internal / "vars")
+            self._stored_values[temdir] = (
+                _load_from_shelf(saved_vars_path)
+                if glob.glob(f"{saved_vars_path}*")
+                else {}
+            )
+        return self._stored_values[temdir]
+
+
 def load(
     source: Union[TemDir, Environment] = None,
     defaults=False,
     override_env: bool = None,
+    lazy=False,
 ) -> VariableContainer:
     """
     Load variables from the given ``source``.
@@ -413,6 +636,9 @@ def load(
         the values of the loaded tem variables, if the tem variable has
         :data:`~Variable.from_env` set. If unspecified, ``override_env`` will
         be equal to the negation of ``defaults``.
+    lazy
+        Return a :class:`LazyVariableContainer`, which loads a variable only
+        when it is accessed.
     Returns
     -------
     variable_container
@@ -424,6 +650,8 @@ def load(
         override_env = not defaults
 
     if isinstance(source, TemDir):
+        if lazy:
+            return LazyVariableContainer([source], defaults, override_env)
         return VariableContainer(
             _load(source, defaults=defaults, override_env=override_env)
         )
@@ -433,6 +661,9 @@ def load(
             "Argument 'source' must be a 'TemDir' or 'Environment'"
         )
 
+    if lazy:
+        return LazyVariableContainer(source.envdirs, defaults, override_env)
+
     # Dict of variable names and loaded variable definitions
     definitions: Dict[str, Variable] = {}
 
@@ -445,6 +676,65 @@ def load(
     return VariableContainer(definitions)
 
 
+class BatchLoader:
+    """
+    Loader of the variables of many environments, typically those built by
+    an :class:`~tem.env.EnvironmentBatch`.
+
+    The `vars.py` file and the variable store of each temdir are loaded only
+    once, no matter how many of the environments share the temdir, and the
+    variables of each distinct list of envdirs are merged only once.
+
+    Parameters
+    ----------
+    defaults, override_env
+        See :func:`load`.
+    """
+
+    def __init__(self, defaults=False, override_env: bool = None):
+        self.defaults = defaults
+        self.override_env = (
+            not defaults if override_env is None else override_env
+        )
+        #: Variables defined in each temdir
+        self._loaded: Dict[TemDir, Dict[str, Variable]] = {}
+        #: Variables of each list of envdirs, from leaf to root
+        self._merged: Dict[Tuple[TemDir, ...], Dict[str, Variable]] = {}
+
+    def load(self, source: Union[TemDir, Environment]) -> VariableContainer:
+        """
+        Load variables from ``source`` like :func:`load` does. Each
+        container gets its own copies of the variables, so changing the
+        variables of one container doesn't affect the others.
+        """
+        envdirs = (
+            (source,) if isinstance(source, TemDir) else tuple(source.envdirs)
+        )
+        return VariableContainer(
+            {
+                name: copy.copy(variable)
+                for name, variable in self._variables(envdirs).items()
+            }
+        )
+
+    def _variables(self, envdirs: Tuple[TemDir, ...]) -> Dict[str, Variable]:
+        variables = self._merged.get(envdirs)
+        if variables is None:
+            temdir = envdirs[0]
+            if temdir not in self._loaded:
+                self._loaded[temdir] = _load(
+                    temdir,
+                    defaults=self.defaults,
+                    override_env=self.override_env,
+                )
+            parent_variables = (
+                self._variables(envdirs[1:]) if len(envdirs) > 1 else {}
+            )
+            variables = {**parent_variables, **self._loaded[temdir]}
+            self._merged[envdirs] = variables
+        return variables
+
+
 def save(variable_container: VariableContainer, target=None):
     """
     Save the variables from ``variable_container`` to the variable store of
@@ -474,13 +764,19 @@ def save(variable_container: VariableContainer, target=None):
         temdirs = list(reversed(target.envdirs))
 
     # Maps each variable name with the lowest temdir that defines it
-    var_definition_sources = {
-        var_name: None for var_name in variable_container
-    }
-    for temdir in temdirs:
-        definitions = _load_variable_definitions(temdir / ".tem/vars.py")
-        for variable in definitions:
-            var_definition_sources[variable] = temdir
+    if isinstance(variable_container, LazyVariableContainer):
+        # Only the variables that were loaded can have changed. We already
+        # know where they are defined.
+        var_definition_sources = dict(variable_container.__dict__.sources)
+    else:
+        var_definition_sources = {
+            var_name: None for var_name in variable_container
+        }
+        for temdir in temdirs:
+            definitions = _load_variable_definitions(temdir / ".tem/vars.py")
+            for variable in definitions:
+                if variable in var_definition_sources:
+                    var_definition_sources[variable] = temdir
 
     if None in var_definition_sources.values():
         raise TemVariableNotDefinedError()
@@ -496,8 +792,8 @@ def save(variable_container: VariableContainer, target=None):
             # the lowest directory that defines the variable. Otherwise, the
             # directory retains the old value for the variable.
             values = store["values"] if "values" in store else {}
-            for vname in variable_container:
-                if var_definition_sources[vname] == temdir:
+            for vname, source in var_definition_sources.items():
+                if source == temdir:
                     variable = variable_container[vname]
                     # pylint: disable-next=unexpected-keyword-arg
                     values[vname] = variable.__class__.value.fget(
@@ -508,6 +804,29 @@ def save(variable_container: VariableContainer, target=None):
             store["tem_version"] = tem.__version__
 
 
+def static_definitions(path: AnyPath) -> Optional[Dict[str, Variable]]:
+    """
+    Return the variables defined in the `vars.py` file at ``path``, without
+    executing the file.
+
+    Returns
+    -------
+    variables
+        Dictionary that maps each variable name to its definition, or
+        ``None`` if the definitions can't be determined statically. If the
+        file doesn't exist, the dictionary is empty.
+    """
+    index = _vars_index(path)
+    if index is None:
+        return {}
+    if index["definitions"] is None:
+        return None
+    try:
+        return _build_variables(index["definitions"])
+    except (TemVariableValueError, TypeError):
+        return None
+
+
 def _load(
     temdir: TemDir, defaults=False, override_env=True
 ) -> Dict[str, Variable]:
@@ -532,6 +851,10 @@ def _load(
 
 
 def _load_variable_definitions(path) -> Dict[str, Variable]:
+    variables = static_definitions(path)
+    if variables is not None:
+        # The definitions are purely declarative, no need to execute the file
+        return variables
     try:
         definitions = util.import_path("__tem_var_definitions", path)
     except FileNotFoundError:
@@ -539,6 +862,345 @@ def _load_variable_definitions(path) -> Dict[str, Variable]:
     return _filter_variables(definitions.__dict__)
 
 
+def _variable_names(temdir: TemDir) -> Optional[Set[str]]:
+    """
+    Return the names of variables that may be defined in the `vars.py` file
+    of ``temdir``, or ``None`` if they can't be determined without executing
+    the file.
+    """
+    index = _vars_index(temdir / ".tem/vars.py")
+    if index is None:
+        return set()
+    return set(index["names"]) if index["names"] is not None else None
+
+
+def _vars_index(path: AnyPath) -> Optional[dict]:
+    """
+    Statically analyze the `vars.py` file at ``path``. The result is a
+    dictionary with the following items:
+
+    - ``"names"``: list of global names assigned in the file (see
+      :func:`_scan_variable_names`)
+    - ``"definitions"``: variable definitions that were extracted from the
+      file (see :func:`_scan_variable_definitions`)
+
+    The result is cached in the `.internal` directory next to ``path``, keyed
+    on the modification time and size of the file. While a watcher (see
+    :mod:`tem.watch`) watches the file, the cache is used without checking
+    the file. Return ``None`` if the file doesn't exist.
+    """
+    index_path = pathlib.Path(
+        os.path.dirname(path), ".internal", "vars_index.json"
+    )
+    token = watch.token(path)
+    cached = None
+    with suppress(OSError, ValueError):
+        with open(index_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if not isinstance(cached, dict) or "definitions" not in cached:
+            cached = None
+    if token is not None and cached and cached.get("watch") == token:
+        return cached
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = [stat.st_mtime_ns, stat.st_size]
+    if cached and cached.get("key") == key:
+        if token is not None:
+            cached["watch"] = token
+            _save_vars_index(index_path, cached)
+        return cached
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=str(path))
+    except (OSError, SyntaxError, ValueError):
+        tree = None
+    names = _scan_variable_names(tree) if tree else None
+    index = {
+        "key": key,
+        "names": sorted(names) if names is not None else None,
+        "definitions": _scan_variable_definitions(tree) if tree else None,
+        "watch": token,
+    }
+    _save_vars_index(index_path, index)
+    return index
+
+
+def _save_vars_index(index_path: pathlib.Path, index: dict):
+    with suppress(OSError):
+        # Like TemDir._internal, the directory is created when it's needed
+        os.makedirs(index_path.parent, exist_ok=True)
+        with open(index_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+
+#: Built-in names through which a module can define globals dynamically
+_DYNAMIC_NAMES = {"globals", "vars", "locals", "exec", "eval", "__import__"}
+
+
+def _scan_variable_names(tree: ast.Module) -> Optional[Set[str]]:
+    """
+    Statically find the global names that the module ``tree`` assigns to.
+    Return ``None`` if the module defines global names in a way that can't be
+    analyzed without executing it.
+    """
+    names = set()
+    scopes = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+    nodes = list(ast.iter_child_nodes(tree))
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.ImportFrom) and any(
+            alias.name == "*" for alias in node.names
+        ):
+            return None
+        if isinstance(node, ast.Name) and (
+            node.id in _DYNAMIC_NAMES
+            or (node.id == "setattr" and isinstance(node.ctx, ast.Load))
+        ):
+            return None
+        if isinstance(node, ast.Global):
+            return None
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update(
+                (alias.asname or alias.name).split(".")[0]
+                for alias in node.names
+            )
+        if isinstance(node, scopes):
+            # Names assigned inside a function or class are not global, but
+            # the body could still use e.g. `globals()`
+            if not isinstance(node, ast.Lambda):
+                names.add(node.name)
+            nodes.extend(
+                child
+                for child in ast.walk(node)
+                if child is not node
+                and (
+                    isinstance(child, ast.Global)
+                    or (
+                        isinstance(child, ast.Name)
+                        and child.id in _DYNAMIC_NAMES
+                    )
+                )
+            )
+            continue
+        nodes.extend(ast.iter_child_nodes(node))
+    return {
+        name
+        for name in names
+        if not (name.startswith("_") and name.endswith("_"))
+    }
+
+
+#: Built-in types that can be used as ``var_type`` in static definitions
+_STATIC_TYPES = {t.__name__: t for t in (bool, dict, float, int, list, str)}
+
+#: Values of these types survive the trip through the JSON index unchanged
+_STATIC_VALUE_TYPES = (type(None), bool, int, float, str)
+
+#: Parameters of the constructors of :class:`Variable` and :class:`Variant`
+_CONSTRUCTOR_PARAMS = {
+    "tem.var.Variable": ("var_type", "default", "from_env", "to_env"),
+    "tem.var.Variant": ("default", "from_env", "to_env"),
+}
+
+
+class _NotStatic(Exception):
+    """Raised when a definition can't be extracted without executing it."""
+
+
+def _scan_variable_definitions(tree: ast.Module) -> Optional[Dict[str, dict]]:
+    """
+    Extract variable definitions from the module ``tree`` without executing
+    it. Return ``None`` if the module contains anything but imports, literal
+    assignments and the following declarative forms::
+
+        name = Variable(var_type, default=..., from_env=..., to_env=...)
+        name = Variant(default=..., from_env=..., to_env=...)
+        name.doc = "description"
+        name.doc[value] = "documentation of value"
+
+    Returns
+    -------
+    definitions
+        Maps each variable name to a JSON-serializable description of its
+        definition, which can be turned into a :class:`Variable` using
+        :func:`_build_variables`.
+    """
+    imports: Dict[str, str] = {}  # Maps bound names to qualified names
+    definitions: Dict[str, Optional[dict]] = {}
+    try:
+        for node in tree.body:
+            if isinstance(node, ast.Expr) and isinstance(
+                node.value, ast.Constant
+            ):
+                continue  # Docstring
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    name = alias.asname or alias.name.split(".")[0]
+                    imports[name] = alias.name if alias.asname else name
+                    _unbind(name, definitions)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level or any(a.name == "*" for a in node.names):
+                    return None
+                for alias in node.names:
+                    name = alias.asname or alias.name
+                    imports[name] = f"{node.module}.{alias.name}"
+                    _unbind(name, definitions)
+            elif isinstance(node, ast.Assign):
+                _scan_assignment(node, imports, definitions)
+            else:
+                return None
+    except _NotStatic:
+        return None
+    return {
+        name: definition
+        for name, definition in definitions.items()
+        if definition is not None
+        and not (name.startswith("_") and name.endswith("_"))
+    }
+
+
+def _unbind(name: str, definitions: Dict[str, Optional[dict]]):
+    """Mark ``name`` as no longer referring to a variable definition."""
+    if name in definitions:
+        definitions[name] = None
+
+
+def _scan_assignment(node: ast.Assign, imports, definitions):
+    """Helper for :func:`_scan_variable_definitions`."""
+    if len(node.targets) != 1:
+        raise _NotStatic()
+    target = node.targets[0]
+
+    # name.doc = "..." or name.doc[value] = "..."
+    if isinstance(target, (ast.Attribute, ast.Subscript)):
+        subscript = target if isinstance(target, ast.Subscript) else None
+        attribute = subscript.value if subscript else target
+        if not (
+            isinstance(attribute, ast.Attribute)
+            and attribute.attr == "doc"
+            and isinstance(attribute.value, ast.Name)
+            and definitions.get(attribute.value.id)
+        ):
+            raise _NotStatic()
+        doc = _static_value(node.value)
+        if not isinstance(doc, str):
+            raise _NotStatic()
+        definition = definitions[attribute.value.id]
+        if subscript:
+            value = subscript.slice
+            if isinstance(value, getattr(ast, "Index", ())):
+                value = value.value  # Python < 3.9
+            definition["value_docs"].append([_static_value(value), doc])
+        else:
+            definition["doc"] = doc
+        return
+
+    if not isinstance(target, ast.Name):
+        raise _NotStatic()
+    imports.pop(target.id, None)
+    if not isinstance(node.value, ast.Call):
+        # Some other literal value, which is not a variable
+        _static_value(node.value)
+        definitions[target.id] = None
+        return
+
+    constructor = _qualified_name(node.value.func, imports)
+    if constructor not in _CONSTRUCTOR_PARAMS:
+        raise _NotStatic()
+    params = _CONSTRUCTOR_PARAMS[constructor]
+    call = node.value
+    if len(call.args) > len(params) or any(
+        isinstance(arg, ast.Starred) for arg in call.args
+    ):
+        raise _NotStatic()
+    args = {}
+    for param, arg in [
+        *zip(params, call.args),
+        *((kw.arg, kw.value) for kw in call.keywords),
+    ]:
+        if param not in params:
+            raise _NotStatic()
+        if param == "var_type":
+            args[param] = _static_type(arg, imports, definitions)
+        else:
+            args[param] = _static_value(arg)
+    # Re-assigning a name keeps its original position in the module
+    definitions[target.id] = {
+        "class": constructor.rsplit(".", 1)[1],
+        "args": args,
+        "doc": None,
+        "value_docs": [],
+    }
+
+
+def _qualified_name(node: ast.expr, imports: Dict[str, str]) -> Optional[str]:
+    """Resolve a (dotted) name in ``node`` to the object it was imported as."""
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.insert(0, node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name) or node.id not in imports:
+        return None
+    return ".".join([imports[node.id], *attrs])
+
+
+def _static_type(node: ast.expr, imports, definitions):
+    """
+    Return a JSON-serializable representation of the ``var_type`` argument in
+    ``node``: a type name, a list of allowed values or ``None`` for ``Any``.
+    """
+    if isinstance(node, ast.Name) and node.id in _STATIC_TYPES:
+        if node.id in imports or node.id in definitions:
+            raise _NotStatic()  # The built-in type is shadowed
+        return node.id
+    if _qualified_name(node, imports) in ("typing.Any", "tem.var.Any"):
+        return None
+    value = _static_value(node)
+    if value is not None and not isinstance(value, list):
+        raise _NotStatic()
+    return value
+
+
+def _static_value(node: ast.expr):
+    """Evaluate a literal value that can be stored in the JSON index."""
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        raise _NotStatic() from None
+    values = value if isinstance(value, list) else [value]
+    if not all(type(v) in _STATIC_VALUE_TYPES for v in values):
+        raise _NotStatic()
+    return value
+
+
+def _build_variables(definitions: Dict[str, dict]) -> Dict[str, Variable]:
+    """
+    Create variables from definitions obtained by
+    :func:`_scan_variable_definitions`.
+    """
+    variables = {}
+    for name, definition in definitions.items():
+        args = dict(definition["args"])
+        if isinstance(args.get("var_type"), str):
+            args["var_type"] = _STATIC_TYPES[args["var_type"]]
+        if definition["class"] == "Variant":
+            variable = Variant(**args)
+        else:
+            variable = Variable(**args)
+        if definition["doc"] is not None:
+            variable.doc = definition["doc"]
+        for value, doc in definition["value_docs"]:
+            variable.doc[value] = doc
+        variables[name] = variable
+    return variables
+
+
 def _load_from_shelf(file: AnyPath) -> Dict[str, Variable]:
     """Load a variable namespace object from variable store ``file``."""
     shelf = shelve.open(file)
@@ -556,6 +1218,5 @@ def _filter_variables(dictionary: dict) -> Dict[str, Variable]:
     return {
         key: val
         for key, val in dictionary.items()
-        if isinstance(val, Variable)
-        and not (key.startswith("_") and key.endswith("_"))
+        if isinstance(val, Variable) and not _is_private(key)
     }
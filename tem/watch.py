@@ -0,0 +1,351 @@
+"""
+Filesystem watcher that keeps caches valid without checking them.
+
+Caches of repositories and temdirs, like the indexes of :mod:`tem.search`
+and :mod:`tem.grep`, must normally be validated with a ``stat`` of each
+file or directory they depend on, on every run. On Linux, a watcher process
+can use inotify to be told about every change instead. It watches a set of
+roots (repositories and temdirs) and keeps a generation number for each
+root, which it increments whenever anything under the root changes. The
+generation numbers are written to a state file in tem's cache directory.
+
+A cache stores the :func:`token` of the root it depends on along with its
+entries. As long as the watcher is alive and :func:`token` returns the same
+value, nothing under the root has changed and the cache can be trusted as
+it is. When the watcher is not running, or a root could not be watched,
+:func:`token` returns ``None`` and caches fall back to their usual checks.
+
+The watcher holds a lock on the state directory while it is alive, so a
+watcher that was killed is never trusted. It is started in the background
+by :func:`spawn`, which runs this module as a script::
+
+    python -m tem.watch ROOT...
+
+Changes are reported by the kernel asynchronously, so a change made by one
+process becomes visible to caches in other processes a moment later. A
+root whose directory is removed, or that has more directories than the
+inotify watch limit allows, is no longer trusted. If the kernel drops
+events because too many of them are queued, all roots are walked again to
+watch the directories that were created in the meantime.
+"""
+import argparse
+import contextlib
+import ctypes
+import errno
+import fcntl
+import json
+import os
+import signal
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+from tem import util
+from tem.util.fs import AnyPath
+
+__all__ = ["Watcher", "is_alive", "main", "spawn", "state", "stop", "token"]
+
+# Events from <sys/inotify.h>
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_ISDIR = 0x40000000
+_IN_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+)
+#: wd, mask, cookie, length of the name
+_EVENT = struct.Struct("iIII")
+
+#: Version of the state file format
+_STATE_VERSION = 1
+#: Directories whose contents no cache depends on. `.internal` directories
+#: hold caches themselves, so watching them would invalidate caches whenever
+#: they are saved.
+_SKIPPED_NAMES = {".git", ".internal"}
+
+#: State that was last read, and the stat of the file it was read from
+_state_cache: Optional[tuple] = None
+
+
+class Watcher:
+    """
+    Watcher of ``roots``, whose state is kept in ``directory``, which
+    defaults to the `watch` directory in tem's cache. Roots are directories
+    or packed repositories.
+    """
+
+    def __init__(self, roots: Iterable[AnyPath], directory: AnyPath = None):
+        self.directory = os.fspath(directory or state_directory())
+        self.roots: Dict[str, Optional[int]] = {
+            os.path.abspath(root): 0 for root in roots
+        }
+        self.session = f"{os.getpid()}-{time.time_ns()}"
+        #: Directory that each watch descriptor watches
+        self._watches: Dict[int, str] = {}
+        self._fd = -1
+        self._libc = None
+
+    def run(self):
+        """
+        Watch the roots until the process is terminated. Return immediately
+        if another watcher is alive.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock_path = os.path.join(self.directory, "lock")
+        with open(lock_path, "w", encoding="utf-8") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                self._start()
+                self._save()
+                while True:
+                    generations = dict(self.roots)
+                    self._handle(os.read(self._fd, 1 << 16))
+                    if self.roots != generations:
+                        self._save()
+            finally:
+                if self._fd >= 0:
+                    os.close(self._fd)
+
+    def _start(self):
+        """Open the inotify file and watch the roots."""
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise _os_error("inotify_init1")
+        for root in self.roots:
+            self._watch_root(root)
+
+    def _watch_root(self, root: str):
+        if os.path.isdir(root):
+            self._watch_tree(root)
+        elif os.path.exists(root):
+            # Changes to a file are reported by its directory, along with
+            # replacements of the file
+            self._watch(os.path.dirname(root))
+        else:
+            self.roots[root] = None
+
+    def _watch_tree(self, directory: str):
+        """Watch ``directory`` and all directories under it."""
+        for path, dirnames, _ in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if d not in _SKIPPED_NAMES]
+            self._watch(path)
+
+    def _watch(self, directory: str):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), _IN_MASK
+        )
+        if wd < 0:
+            e = _os_error(directory)
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                # Changes under the directory would go unnoticed
+                self._distrust(directory)
+            return
+        self._watches[wd] = directory
+
+    def _handle(self, data: bytes):
+        """Handle the events in ``data``, as read from the inotify file."""
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # Some events were lost, including those of directories that
+                # were created meanwhile and must be watched as well
+                for root in self.roots:
+                    if self.roots[root] is not None:
+                        self._watch_root(root)
+                    if self.roots[root] is not None:
+                        self.roots[root] += 1
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or name in _SKIPPED_NAMES:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & _IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                if path in self.roots:
+                    self.roots[path] = None
+            elif mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                if any(map(os.path.isdir, self._roots_of(path))):
+                    self._watch_tree(path)
+            self._touch(path)
+
+    def _roots_of(self, path: str) -> List[str]:
+        return [
+            root
+            for root in self.roots
+            if path == root or path.startswith(root.rstrip("/") + "/")
+        ]
+
+    def _touch(self, path: str):
+        """Increment the generation of the roots that contain ``path``."""
+        for root in self._roots_of(path):
+            if self.roots[root] is not None:
+                self.roots[root] += 1
+
+    def _distrust(self, path: str):
+        for root in self._roots_of(path):
+            self.roots[root] = None
+
+    def _save(self):
+        """Write the state file, so that other processes can read it."""
+        data = {
+            "version": _STATE_VERSION,
+            "pid": os.getpid(),
+            "session": self.session,
+            "roots": self.roots,
+        }
+        path = os.path.join(self.directory, "state.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+def state_directory() -> str:
+    """Return the directory where the watcher keeps its state."""
+    return util.cache_path("watch")
+
+
+def is_alive(directory: AnyPath = None) -> bool:
+    """Test if a watcher that keeps its state in ``directory`` is running."""
+    lock_path = os.path.join(directory or state_directory(), "lock")
+    try:
+        with open(lock_path, encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def state(directory: AnyPath = None) -> Optional[dict]:
+    """
+    Return the state of the running watcher: its ``pid``, its ``session``,
+    and the generation of each of its ``roots``, which is ``None`` for the
+    roots that are not watched. Return ``None`` if no watcher is running.
+    """
+    global _state_cache
+    directory = directory or state_directory()
+    if not is_alive(directory):
+        return None
+    path = os.path.join(directory, "state.json")
+    try:
+        st = os.stat(path)
+        key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        if _state_cache is not None and _state_cache[0] == key:
+            return _state_cache[1]
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != _STATE_VERSION:
+            return None
+    except (OSError, ValueError):
+        return None
+    _state_cache = (key, data)
+    return data
+
+
+def token(path: AnyPath, directory: AnyPath = None) -> Optional[str]:
+    """
+    Return a string that changes whenever anything under ``path`` changes,
+    or ``None`` if the running watcher doesn't watch ``path``, or if no
+    watcher is running.
+    """
+    data = state(directory)
+    if data is None:
+        return None
+    path = os.path.abspath(path)
+    generations = []
+    for root, generation in data["roots"].items():
+        if path == root or path.startswith(root.rstrip("/") + "/"):
+            if generation is None:
+                return None
+            generations.append(f"{generation}")
+    # The path is watched as part of all these roots
+    if not generations:
+        return None
+    return f"{data['session']}:{'.'.join(generations)}"
+
+
+def spawn(roots: Iterable[AnyPath], directory: AnyPath = None):
+    """Start a detached watcher of ``roots``."""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (package_root, env.get("PYTHONPATH")) if p
+    )
+    args = [sys.executable, "-m", "tem.watch"]
+    if directory:
+        args += ["--state-dir", os.fspath(directory)]
+    args += [os.path.abspath(root) for root in roots]
+    # pylint: disable-next=consider-using-with
+    subprocess.Popen(
+        args,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def stop(directory: AnyPath = None, timeout: float = 5) -> bool:
+    """
+    Stop the running watcher. Return ``False`` if no watcher was running.
+    """
+    data = state(directory)
+    if data is None:
+        return False
+    with contextlib.suppress(ProcessLookupError):
+        os.kill(data["pid"], signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while is_alive(directory) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return True
+
+
+def _os_error(what: str) -> OSError:
+    code = ctypes.get_errno()
+    return OSError(code, os.strerror(code), what)
+
+
+def main():
+    """Entry point of the watcher process."""
+    parser = argparse.ArgumentParser(prog="python -m tem.watch")
+    parser.add_argument("roots", nargs="+", help="directories to watch")
+    parser.add_argument("--state-dir", help="directory of the state file")
+    args = parser.parse_args()
+    Watcher(args.roots, args.state_dir).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark loading of tem variables.
+
+Generates temdirs with many variables (like generated feature flags) and
+reports the load time and the memory used per 10k variables, for both
+declarative and executed `vars.py` files. Memory is reported both as traced
+by Python and as the growth of the resident set size (RSS) of the process.
+
+Usage: python tests/bench/var.py [NUMBER_OF_VARIABLES]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+from tem import var
+from tem.fs import TemDir
+
+
+def generate(directory, count, declarative):
+    """Create a temdir in ``directory`` that defines ``count`` variables."""
+    os.makedirs(os.path.join(directory, ".tem", ".internal"))
+    temdir = TemDir(directory)
+    lines = ["from tem.var import Variable, Variant"]
+    if not declarative:
+        # A function call makes the file impossible to analyze statically
+        lines.append("str(0)")
+    for i in range(count):
+        if i % 2:
+            lines.append(f"flag_{i} = Variant()")
+        else:
+            lines.append(f"var_{i} = Variable(['a', 'b', 'c'], 'a')")
+            lines.append(f"var_{i}.doc = 'Variable number {i}'")
+    with open(temdir / ".tem/vars.py", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return temdir
+
+
+def rss() -> Optional[int]:
+    """Return the resident set size of this process in bytes, if known."""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def measure(temdir, count):
+    """Print statistics of loading and accessing all variables in temdir."""
+    gc.collect()
+    start = time.perf_counter()
+    container = var.load(temdir)
+    load_time = time.perf_counter() - start
+
+    del container
+    gc.collect()
+    rss_before = rss()
+    container = var.load(temdir)
+    rss_after = rss()
+
+    # Tracing slows down allocations, so it is measured separately
+    del container
+    gc.collect()
+    tracemalloc.start()
+    container = var.load(temdir)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for name in container:
+        getattr(container, name)
+    access_time = time.perf_counter() - start
+
+    per_10k = 10_000 / count
+    print(f"  load:   {load_time * per_10k * 1000:8.1f} ms / 10k variables")
+    print(f"  access: {access_time * per_10k * 1000:8.1f} ms / 10k variables")
+    print(f"  memory: {memory * per_10k / 2**20:8.1f} MiB / 10k variables")
+    if rss_before is not None:
+        rss_growth = (rss_after - rss_before) * per_10k / 2**20
+        print(f"  RSS:    {rss_growth:8.1f} MiB / 10k variables")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    with tempfile.TemporaryDirectory() as tmp:
+        for declarative in (True, False):
+            temdir = generate(
+                os.path.join(tmp, str(declarative)), count, declarative
+            )
+            # The first load builds the index of vars.py
+            var.load(temdir)
+            kind = "declarative" if declarative else "executed"
+            print(f"{count} variables, {kind} vars.py:")
+            measure(temdir, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -132,6 +132,18 @@ fi
     compare_output_expected
 }
 
+@test "tem env --batch" {
+    mkdir -p ~/batch/sub
+    cd ~
+
+    run bash -c "printf 'batch/sub\n/\n' | tem env --batch"
+
+    expect echo -e \
+        "{\"directory\": \"batch/sub\", \"envdirs\": [\"$HOME\"], \"variables\": {}}\n{\"directory\": \"/\", \"error\": \"no temdir in filesystem hierarchy of '/'\"}"
+    compare_output_expected
+    [ "$status" -eq 1 ]
+}
+
 export ___WAS_RUN_BEFORE=true
 
 # vim: ft=sh sw=4
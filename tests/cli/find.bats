@@ -48,6 +48,29 @@ fi
     compare_output_expected
 }
 
+@test "tem find --fuzzy" {
+    mkdir -p ~/fuzzy_repo/c
+    touch ~/fuzzy_repo/c/Makefile ~/fuzzy_repo/README.md
+
+    run tem find -R ~/fuzzy_repo --fuzzy rdme
+
+    [ "$status" = 0 ]
+    expected=~/fuzzy_repo/README.md
+    compare_output_expected
+}
+
+@test "tem find --grep" {
+    mkdir -p ~/grep_repo/c
+    printf 'all:\n\t$(CC) main.c\n' > ~/grep_repo/c/Makefile
+    printf '# TODO\n' > ~/grep_repo/README.md
+
+    run tem find -R ~/grep_repo --grep 'CC'
+
+    [ "$status" = 0 ]
+    expected="grep_repo:c/Makefile:2:	\$(CC) main.c"
+    compare_output_expected
+}
+
 export ___WAS_RUN_BEFORE=true
 
 # vim: ft=sh sw=4
@@ -61,6 +61,59 @@ fi
     compare_output_expected
 }
 
+@test "tem put {DIR} | PIPE" {
+    # Directories are printed as a tar archive
+    cd "$DESTDIR"
+    mkdir -p untar
+
+    tem put -R "$REPO" dir1 | tar -x -C untar
+
+    compare_trees "$REPO"/dir1 "$DESTDIR"/untar/dir1/**
+}
+
+@test "tem put {FILE} -d DIR1 -d DIR2" {
+    cd "$DESTDIR"
+
+    tem_put file1.txt dir1 -d multi1 -d multi2
+
+    for dir in multi1 multi2; do
+        [ "$(cat "$DESTDIR/$dir"/file1.txt)" = "$(cat "$REPO"/file1.txt)" ]
+        compare_trees "$REPO"/dir1 "$DESTDIR/$dir"/dir1/**
+    done
+}
+
+@test "tem put --destinations-from -" {
+    cd "$DESTDIR"
+
+    printf 'from1\0from2\0' | tem put -R "$REPO" file1.txt \
+        --destinations-from -
+
+    [ "$(cat "$DESTDIR"/from1/file1.txt)" = "$(cat "$REPO"/file1.txt)" ]
+    [ "$(cat "$DESTDIR"/from2/file1.txt)" = "$(cat "$REPO"/file1.txt)" ]
+}
+
+@test "tem put {DIR} -d DIR1 -d DIR2 [one destination fails]" {
+    cd "$DESTDIR"
+    mkdir -p fail1 && touch fail1/dir1
+
+    run tem_put dir1 -d fail1 -d fail2
+
+    [ "$status" = 1 ]
+    compare_trees "$REPO"/dir1 "$DESTDIR"/fail2/dir1/**
+}
+
+@test "tem put {DIR} [packed repository]" {
+    cd "$DESTDIR"
+
+    run tem repo --pack "$REPO"
+    [ "$status" = 0 ]
+    [ "$output" = "$REPO.tempack" ]
+    tem put -R "$REPO.tempack" file1.txt dir1 -d packed
+
+    [ "$(cat "$DESTDIR"/packed/file1.txt)" = "$(cat "$REPO"/file1.txt)" ]
+    compare_trees "$REPO"/dir1 "$DESTDIR"/packed/dir1/**
+}
+
 # @test "tem put {}
 # TODO both -o and -d error
 
@@ -0,0 +1,98 @@
+import subprocess
+import tarfile
+import zipfile
+
+import pytest
+
+from common import *  # isort: skip
+from tem import archive, pack, put
+
+OUTDIR = OUTDIR / "archive"
+REPO = OUTDIR / "repo"
+DEST = OUTDIR / "dest"
+
+
+def setup_module():
+    recreate_dir(REPO / "dir1" / "sub")
+    (REPO / "file1.txt").write_text("file1\n")
+    (REPO / "dir1" / "a").write_text("a\n")
+    (REPO / "dir1" / "sub" / "b").write_text("b\n")
+    os.environ["XDG_CACHE_HOME"] = str(OUTDIR / "cache")
+    with zipfile.ZipFile(OUTDIR / "repo.zip", "w") as f:
+        # Directories are left out on purpose
+        for name in ("file1.txt", "dir1/a", "dir1/sub/b"):
+            f.write(REPO / name, name)
+    for name, mode in (("repo.tar", "w"), ("repo.tar.gz", "w:gz")):
+        with tarfile.open(OUTDIR / name, mode) as f:
+            f.add(REPO, arcname=".")
+
+
+def teardown_module():
+    del os.environ["XDG_CACHE_HOME"]
+
+
+def test_lookup():
+    for name in ("repo.zip", "repo.tar", "repo.tar.gz"):
+        tree, path = pack.locate(OUTDIR / name / "dir1")
+        assert isinstance(tree, archive.Archive)
+        assert path == "dir1"
+        assert tree.listdir("") == ["dir1", "file1.txt"]
+        assert tree.listdir("dir1") == ["a", "sub"]
+        assert tree.isdir("dir1/sub")
+        assert os.path.isfile(archive.index_path(tree.path))
+
+
+def test_index_is_reused():
+    index = archive.index_path(OUTDIR / "repo.tar.gz")
+    archive.Archive(OUTDIR / "repo.tar.gz").exists("dir1")
+    mtime = os.stat(index).st_mtime_ns
+    assert archive.Archive(OUTDIR / "repo.tar.gz").exists("dir1/a")
+    assert os.stat(index).st_mtime_ns == mtime
+
+
+def test_extract():
+    for name in ("repo.zip", "repo.tar", "repo.tar.gz"):
+        tree = archive.load(OUTDIR / name)
+        tree.extract("dir1", DEST / name)
+        assert (DEST / name / "a").read_text() == "a\n"
+        assert (DEST / name / "sub" / "b").read_text() == "b\n"
+
+
+def test_update_from_archive():
+    template = OUTDIR / "repo.tar.gz" / "dir1"
+    report = put.update(template, DEST / "updated")
+    assert (len(report.added), len(report.unchanged)) == (2, 0)
+    report = put.update(template, DEST / "updated", checksum=True)
+    assert (len(report.added), len(report.unchanged)) == (0, 2)
+
+
+@pytest.mark.skipif(not shutil.which("zstd"), reason="requires zstd")
+def test_zstd():
+    path = OUTDIR / "repo.tar.zst"
+    subprocess.run(
+        ["zstd", "-q", "-o", str(path), str(OUTDIR / "repo.tar")], check=True
+    )
+    tree = archive.load(path)
+    assert tree.listdir("") == ["dir1", "file1.txt"]
+    tree.extract("dir1", DEST / "zstd")
+    assert (DEST / "zstd" / "sub" / "b").read_text() == "b\n"
+
+
+def test_unreadable_archive():
+    from tem import errors
+    from tem.repo import Repo
+
+    (OUTDIR / "invalid.tar.gz").write_text("not an archive")
+    paths = [OUTDIR / "invalid.tar.gz"]
+    if archive.UNSUPPORTED_SUFFIXES:
+        # zstd archives need a decompressor
+        (OUTDIR / "repo.tar.zst").write_bytes(b"")
+        paths.append(OUTDIR / "repo.tar.zst")
+    else:
+        (OUTDIR / "invalid.tzst").write_text("not an archive")
+        paths.append(OUTDIR / "invalid.tzst")
+    for path in paths:
+        # The repository doesn't silently look empty
+        with pytest.raises(errors.RepoUnreadableError) as excinfo:
+            Repo(str(path)).has_template("dir1")
+        assert f"'{path}'" in excinfo.value.cli()
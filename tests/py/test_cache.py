@@ -0,0 +1,78 @@
+import time
+
+from common import *  # isort: skip
+from tem import cache
+
+OUTDIR = OUTDIR / "cache"
+DEP = OUTDIR / "dep.txt"
+
+
+def setup_module():
+    recreate_dir(OUTDIR)
+
+
+def test_get_set():
+    c = cache.Cache(OUTDIR / "get_set")
+    assert c.get("ns", "key") is None
+    assert c.get("ns", "key", {}) == {}
+    c.set("ns", "key", {"a": [1, 2]})
+    assert c.get("ns", "key") == {"a": [1, 2]}
+    assert c.get("other", "key") is None
+    c.delete("ns", "key")
+    assert c.get("ns", "key") is None
+
+
+def test_dependencies():
+    c = cache.Cache(OUTDIR / "deps")
+    DEP.write_text("1")
+    c.set("ns", "key", 1, deps=[DEP, OUTDIR / "missing"])
+    assert c.get("ns", "key") == 1
+    DEP.write_text("22")
+    assert c.get("ns", "key") is None
+    c.set("ns", "key", 2, deps=[DEP, OUTDIR / "missing"])
+    (OUTDIR / "missing").touch()
+    assert c.get("ns", "key") is None
+
+
+def test_stats():
+    c = cache.Cache(OUTDIR / "stats")
+    c.set("ns", "key", "value")
+    c.get("ns", "key")
+    c.get("ns", "other")
+    # Counts are added to the statistics when the process exits
+    stats = cache.Cache(OUTDIR / "stats").stats()
+    assert (stats["ns"]["hits"], stats["ns"]["misses"]) == (0, 0)
+    stats = c.stats()
+    assert stats["ns"]["entries"] == 1
+    assert stats["ns"]["size"] > 0
+    assert (stats["ns"]["hits"], stats["ns"]["misses"]) == (1, 1)
+    assert c.clear("ns")[0] == 1
+    assert c.stats() == {}
+
+
+def test_prune():
+    c = cache.Cache(OUTDIR / "prune")
+    for i in range(4):
+        c.set("ns", f"key{i}", "x" * 100)
+        # Entries are ordered by modification time
+        path = c.path("ns", f"key{i}")
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    size = os.path.getsize(c.path("ns", "key0"))
+    removed, freed = c.prune(max_size=2 * size)
+    assert (removed, freed) == (2, 2 * size)
+    assert c.get("ns", "key0") is None
+    assert c.get("ns", "key3") is not None
+
+
+def test_automatic_prune():
+    c = cache.Cache(OUTDIR / "automatic", max_size=1000)
+    for i in range(20):
+        c.set("ns", f"key{i}", "x" * 100)
+    assert c.stats()["ns"]["size"] <= 1000
+
+
+def test_parse_size():
+    assert cache.parse_size("") == 0
+    assert cache.parse_size("10") == 10
+    assert cache.parse_size("1.5K") == 1536
+    assert cache.parse_size("2 MB") == 2 << 20
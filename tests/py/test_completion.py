@@ -0,0 +1,113 @@
+import re
+
+from common import *  # isort: skip
+from tem import completion
+from tem.repo import Repo
+
+OUTDIR = OUTDIR / "completion"
+REPO = OUTDIR / "repo"
+TEMDIR = OUTDIR / "temdir"
+
+
+def setup_module():
+    recreate_dir(REPO / ".tem")
+    recreate_dir(REPO / "python" / "flask")
+    recreate_dir(TEMDIR / ".tem")
+    (REPO / ".tem" / "repo").write_text("[general]\nname = snippets\n")
+    (REPO / "python" / "flask" / "app.py").touch()
+    (REPO / "python" / "setup.py").touch()
+    (REPO / "README").touch()
+    (TEMDIR / ".tem" / "vars.py").write_text(
+        "from tem.var import Variable, Variant\n"
+        'mode = Variable(["debug", "release"], default="debug")\n'
+        'mode.doc = "build mode"\n'
+        "count = Variable(int)\n"
+        "fast = Variant()\n"
+    )
+    os.environ["XDG_CACHE_HOME"] = str(OUTDIR / "cache")
+
+
+def teardown_module():
+    del os.environ["XDG_CACHE_HOME"]
+
+
+def _candidates(words):
+    return [candidate for candidate, _ in completion.complete(words)]
+
+
+def test_subcommands():
+    assert _candidates(["p"]) == ["put", "path"]
+
+
+def test_subcommands_match_main():
+    source = (PY_TESTDIR.parent.parent / "tem" / "__main__.py").read_text()
+    registered = re.findall(r'parsers, "(\w+)",\s+help=', source)
+    assert list(completion.SUBCOMMANDS) == registered
+
+
+def test_templates():
+    repos = [Repo(str(REPO))]
+    assert completion.templates(repos, "") == [
+        ("README", "snippets"),
+        ("python/", "snippets"),
+    ]
+    assert completion.templates(repos, "python/") == [
+        ("python/flask/", "snippets"),
+        ("python/setup.py", "snippets"),
+    ]
+    assert completion.templates(repos, "x") == []
+    assert _candidates(["-R", str(REPO), "put", "py"]) == ["python/"]
+
+
+def test_repo_names():
+    names = completion.repo_names([Repo(str(REPO))])
+    assert names == {"snippets": str(REPO)}
+    (REPO / ".tem" / "repo").write_text("[general]\nname = renamed\n")
+    try:
+        assert list(completion.repo_names([Repo(str(REPO))])) == ["renamed"]
+    finally:
+        (REPO / ".tem" / "repo").write_text("[general]\nname = snippets\n")
+
+
+def test_variables():
+    variables = completion.variables(TEMDIR)
+    assert variables["mode"] == {
+        "doc": "build mode",
+        "values": ["debug", "release"],
+    }
+    assert variables["count"]["values"] == []
+    assert variables["fast"]["values"] == ["true", "false"]
+
+
+def test_dynamic_variables():
+    temdir = OUTDIR / "dynamic"
+    recreate_dir(temdir / ".tem")
+    marker = OUTDIR / "executed"
+    (temdir / ".tem" / "vars.py").write_text(
+        "import pathlib\n"
+        "from tem.var import Variable\n"
+        f"pathlib.Path({str(marker)!r}).touch()\n"
+        "for name in ['a', 'b']:\n"
+        "    globals()[name] = Variable(str)\n"
+    )
+    # Completion must not execute vars.py
+    assert completion.variables(temdir) == {}
+    assert not marker.exists()
+
+
+def test_no_candidates():
+    assert completion.complete(["init", "x"]) is None
+    assert completion.complete(["put", "-"]) is None
+    assert completion.complete(["-c", ""]) is None
+
+
+def test_requested():
+    assert completion.requested(["__complete", "put"])
+    assert completion.requested(["--config", "file", "__complete"])
+    assert not completion.requested(["put", "__complete"])
+    assert not completion.requested([])
+
+
+def test_scripts():
+    for shell in ("fish", "bash", "zsh"):
+        assert "tem __complete" in completion.script(shell)
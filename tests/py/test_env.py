@@ -1,5 +1,14 @@
+import subprocess
+import time
+
+import pytest
+
+import tem.util
 from common import *
-from tem.env import ExecPath
+from tem import context, errors
+from tem.env import Environment, EnvironmentBatch, ExecPath, activation
+from tem.fs import TemDir
+from tem.shell import Shell
 
 
 class TestExecPath:
@@ -18,6 +27,30 @@ class TestExecPath:
         assert list(self.ep[0:]) == list(map(str, self.paths))
         assert list(self.ep[2:3]) == list(map(str, self.paths[2:3]))
 
+    def test_transaction(self):
+        old_path = os.environ["PATH"]
+        ep = ExecPath(["/a", "/b", "/c"])
+        with ep.transaction():
+            del ep[0]
+            ep[0] = "/d"
+            # Changes are exported only once the transaction ends
+            assert os.environ["PATH"] == old_path
+        assert os.environ["PATH"] == "/d:/c"
+
+        with pytest.raises(RuntimeError):
+            with ep.transaction():
+                del ep[0]
+                raise RuntimeError()
+        assert list(ep) == ["/d", "/c"]
+        assert os.environ["PATH"] == "/d:/c"
+        os.environ["PATH"] = old_path
+
+    def test_without(self):
+        envdir = os.path.realpath(self.TESTDIR)
+        tem_path = os.path.join(envdir, ".tem", "path")
+        ep = ExecPath(["/a", tem_path, f"{envdir}/../execpath/.tem/path"])
+        assert ep.without([tem_path]) == ["/a"]
+
     def test_lookup(self):
         """Test lookup of nth"""
         common_script = self.ep["common_script"]
@@ -55,3 +88,110 @@ class TestExecPath:
 class TestEnv:
     def test_environment(self):
         pass
+
+    def test_default_environment_is_memoized(self):
+        temdir = OUTDIR / "env" / "temdir"
+        recreate_dir(temdir)
+        TemDir.init(temdir)
+        with tem.util.chdir(temdir):
+            assert context.env is context.env
+            assert context.env.basedir == temdir
+            # Creating a temdir must invalidate the memoized environment
+            os.makedirs(temdir / "sub")
+            TemDir.init(temdir / "sub")
+            with tem.util.chdir(temdir / "sub"):
+                assert context.env.basedir == temdir / "sub"
+                default_env = context.env
+                context.invalidate()
+                assert context.env is not default_env
+                # So must removing one
+                shutil.rmtree(temdir / "sub" / ".tem")
+                assert context.env.basedir == temdir
+
+    def test_environment_batch(self):
+        root = OUTDIR / "env" / "batch"
+        recreate_dir(root)
+        TemDir.init(root)
+        os.makedirs(root / "a" / "x")
+        TemDir.init(root / "a")
+        os.makedirs(root / "b")
+        batch = EnvironmentBatch()
+        for directory in (root, root / "b"):
+            assert batch.environment(directory).envdirs == [root]
+        envdirs = batch.environment(root / "a" / "x").envdirs
+        assert envdirs == Environment(root / "a").envdirs
+        # Parent temdirs are shared between the environments
+        assert envdirs[1] is batch.environment(root).basedir
+        assert EnvironmentBatch(recursive=False).environment(
+            root / "a"
+        ).envdirs == [root / "a"]
+        with pytest.raises(errors.NoTemDirInHierarchy):
+            EnvironmentBatch().environment("/")
+
+    @pytest.mark.skipif(not shutil.which("bash"), reason="requires bash")
+    def test_activation_script(self):
+        temdir = OUTDIR / "env" / "activation"
+        recreate_dir(temdir)
+        TemDir.init(temdir)
+        os.makedirs(temdir / ".tem/env/@bash")
+        env_script = temdir / ".tem/env/@bash/script.sh"
+        env_script.write_text("echo sourced")
+
+        script = activation.compile_script(Environment(temdir), Shell.BASH)
+        mtime = os.stat(script).st_mtime_ns
+        # Compiling again from the same inputs doesn't rewrite the script
+        assert activation.compile_script(Environment(temdir), Shell.BASH)
+        assert os.stat(script).st_mtime_ns == mtime
+
+        def source():
+            return subprocess.run(
+                ["bash", "-c", f'. "{script}" && echo "$PATH"'],
+                stdout=subprocess.PIPE,
+                encoding="utf-8",
+                check=False,
+            )
+
+        p = source()
+        assert p.returncode == 0
+        output, path = p.stdout.splitlines()
+        assert output == "sourced"
+        assert path.split(":")[0] == os.path.realpath(temdir / ".tem/path")
+
+        # The script refuses to run once an input has changed
+        future = time.time() + 10
+        os.utime(env_script, (future, future))
+        p = source()
+        assert p.returncode == 1 and p.stdout == ""
+
+    @pytest.mark.skipif(not shutil.which("bash"), reason="requires bash")
+    def test_activation_script_environment(self, monkeypatch):
+        temdir = OUTDIR / "env" / "activation_environment"
+        recreate_dir(temdir)
+        TemDir.init(temdir)
+        (temdir / ".tem/vars.py").write_text(
+            "from tem.var import Variable\n"
+            "v = Variable(str, from_env='TEM_TEST_IN',"
+            " to_env='TEM_TEST_OUT')\n"
+        )
+        monkeypatch.setenv("TEM_TEST_IN", "one")
+        script = activation.compile_script(Environment(temdir), Shell.BASH)
+
+        def source(**environment):
+            return subprocess.run(
+                ["bash", "-c", f'. "{script}" && echo "$TEM_TEST_OUT"'],
+                stdout=subprocess.PIPE,
+                encoding="utf-8",
+                env={"PATH": os.environ["PATH"], **environment},
+                check=False,
+            )
+
+        p = source(TEM_TEST_IN="one")
+        assert p.returncode == 0 and p.stdout == "one\n"
+        # The exported value was taken from the environment when the script
+        # was compiled, so the script refuses to run once it has changed
+        assert source(TEM_TEST_IN="two").returncode == 1
+        assert source().returncode == 1
+        monkeypatch.setenv("TEM_TEST_IN", "two")
+        activation.compile_script(Environment(temdir), Shell.BASH)
+        p = source(TEM_TEST_IN="two")
+        assert p.returncode == 0 and p.stdout == "two\n"
@@ -1,5 +1,6 @@
 from common import *  # isort: skip
 from tem import find
+from tem.fs import TemDir
 
 OUTDIR = OUTDIR / "find"
 
@@ -10,4 +11,66 @@ class TestFind:
     def setup_class(cls):
         os.mkdir(OUTDIR)
 
-    # TODO implement
+    def test_temdirs_under(self):
+        tree = OUTDIR / "under"
+        for directory in ["a", "a/b", "a/b/c", "a/skip/d", "e/f", "e/node"]:
+            os.makedirs(tree / directory)
+            TemDir.init(tree / directory)
+        os.makedirs(tree / "a" / "x" / "node")
+        TemDir.init(tree / "a" / "x" / "node")
+        with open(tree / "a" / ".tem" / "ignore", "w") as f:
+            f.write("# comment\nskip\nx/node/\n")
+        os.symlink(tree / "a", tree / "e" / "f" / "loop")
+        outside = OUTDIR / "outside"
+        os.makedirs(outside / "g")
+        TemDir.init(outside / "g")
+        os.symlink(outside, tree / "link")
+
+        def under(**kwargs):
+            return sorted(
+                os.path.relpath(temdir, tree)
+                for temdir in find.temdirs_under(tree, **kwargs)
+            )
+
+        assert under() == sorted(
+            ["a", "a/b", "a/b/c", "e/f", "e/node", "link/g"]
+        )
+        assert under(max_depth=2) == sorted(
+            ["a", "a/b", "e/f", "e/node", "link/g"]
+        )
+        assert under(max_depth=0) == []
+        # Ignore files above the searched directory apply as well
+        assert list(find.temdirs_under(tree / "a" / "skip")) == []
+        assert list(find.temdirs_under(tree / "a" / "x")) == []
+        assert list(find.temdirs_under(tree / "a" / "b" / "c")) == [
+            TemDir(tree / "a" / "b" / "c")
+        ]
+
+    def test_cli(self, capsys):
+        from argparse import Namespace
+
+        from tem.cli import find as find_cli
+        from tem.repo import Repo
+
+        tree = OUTDIR / "cli"
+        os.makedirs(tree / "a" / "b")
+        TemDir.init(tree / "a")
+        TemDir.init(tree / "a" / "b")
+        args = Namespace(
+            from_dir=str(tree / "a" / "b"), verbose=False, args=[]
+        )
+        find_cli._print_base(args)
+        assert capsys.readouterr().out == f"{tree / 'a' / 'b'}\n"
+
+        (tree / "repo").mkdir()
+        (tree / "repo" / "file").write_text("x\nx\n")
+        args = Namespace(
+            grep="x",
+            repo=[Repo(str(tree / "repo"))],
+            ignore_case=False,
+            jobs=None,
+            index=False,
+            null=True,
+        )
+        find_cli._print_grep(args)
+        assert capsys.readouterr().out == "repo:file:1:x\0repo:file:2:x\0"
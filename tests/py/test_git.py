@@ -0,0 +1,122 @@
+import subprocess
+
+from common import *
+from tem import git
+from tem.cli.git import checkout
+from tem.fs import TemDir
+
+OUTDIR = OUTDIR / "git"
+
+
+def run_git(*args, cwd=OUTDIR):
+    subprocess.run(
+        ["git", "-c", "user.name=tem", "-c", "user.email=tem@tem", *args],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def write(path, content, root=OUTDIR):
+    path = root / path
+    os.makedirs(path.parent, exist_ok=True)
+    path.write_text(content)
+
+
+class TestRepository:
+    @classmethod
+    def setup_class(cls):
+        recreate_dir(OUTDIR)
+        run_git("init", "-b", "master")
+        write("shared/a", "a")
+        write("file", "file")
+        run_git("add", ".")
+        run_git("commit", "-m", "master")
+        run_git("checkout", "-b", "tem")
+        write("shared/b", "b")
+        write("extra/sub/c", "c")
+        run_git("add", ".")
+        run_git("commit", "-m", "tem")
+        run_git("checkout", "master")
+
+    def test_refs(self):
+        with git.Repository(OUTDIR) as repo:
+            assert repo.current_branch() == "master"
+            assert repo.branches() == ["master", "tem"]
+            assert repo.resolve("tem") == repo.resolve("refs/heads/tem")
+            # Packed refs must be found as well
+            run_git("pack-refs", "--all")
+        with git.Repository(OUTDIR / "shared") as repo:
+            assert repo.branches() == ["master", "tem"]
+
+    def test_diff_trees(self):
+        with git.Repository(OUTDIR) as repo:
+            new = repo.tree("tem")
+            old = repo.tree("master")
+            assert sorted(p for p, _ in repo.diff_trees(new, old)) == [
+                "extra/sub/c",
+                "shared/b",
+            ]
+            assert list(repo.diff_trees(old, old)) == []
+            assert sorted(p for p, _ in repo.ls_tree(old)) == [
+                "file",
+                "shared/a",
+            ]
+
+    def test_restore(self):
+        with git.Repository(OUTDIR) as repo:
+            repo.restore("tem", ["shared/b", "extra/sub/c"], batch_size=1)
+        assert (OUTDIR / "extra/sub/c").read_text() == "c"
+        assert (OUTDIR / "shared/b").read_text() == "b"
+
+
+class TestCheckout:
+    ROOT = OUTDIR.parent / "git_checkout"
+
+    @classmethod
+    def setup_class(cls):
+        recreate_dir(cls.ROOT)
+        run_git("init", "-b", "master", cwd=cls.ROOT)
+        write("a", "a", cls.ROOT)
+        run_git("add", ".", cwd=cls.ROOT)
+        run_git("commit", "-m", "master", cwd=cls.ROOT)
+        run_git("checkout", "-b", "tem", cwd=cls.ROOT)
+        write("b", "b", cls.ROOT)
+        write("dir/c", "c", cls.ROOT)
+        run_git("add", ".", cwd=cls.ROOT)
+        run_git("commit", "-m", "tem", cwd=cls.ROOT)
+        run_git("checkout", "-b", "tem2", cwd=cls.ROOT)
+        write("b", "b2", cls.ROOT)
+        write("d", "d", cls.ROOT)
+        run_git("add", ".", cwd=cls.ROOT)
+        run_git("commit", "-m", "tem2", cwd=cls.ROOT)
+        run_git("checkout", "master", cwd=cls.ROOT)
+        # The state of checkouts is recorded only in temdirs
+        TemDir.init(cls.ROOT)
+
+    def checkout(self, branch, force=False):
+        with git.Repository(self.ROOT) as repo:
+            return checkout(repo, branch, force=force)
+
+    def test_checkout(self):
+        # First checkout
+        assert self.checkout("tem") == ["b", "dir/c"]
+        assert (self.ROOT / "dir/c").read_text() == "c"
+        state = next(self.ROOT.glob(".tem/.internal/git.json"))
+        mtime = state.stat().st_mtime_ns
+
+        # Nothing has changed
+        assert self.checkout("tem") == []
+        assert state.stat().st_mtime_ns == mtime
+
+        # A restored file was deleted from the working tree
+        os.remove(self.ROOT / "b")
+        assert self.checkout("tem") == ["b"]
+        assert (self.ROOT / "b").read_text() == "b"
+
+        # Only the files that differ between the branches are restored
+        assert self.checkout("tem2") == ["b", "d"]
+        assert (self.ROOT / "b").read_text() == "b2"
+
+        assert self.checkout("tem2", force=True) == ["b", "d", "dir/c"]
@@ -0,0 +1,105 @@
+import re
+
+from common import *  # isort: skip
+from tem import grep, pack
+from tem.repo import Repo
+
+OUTDIR = OUTDIR / "grep"
+REPO = OUTDIR / "repo"
+
+
+def setup_module():
+    recreate_dir(REPO / "c")
+    recreate_dir(REPO / ".tem")
+    (REPO / "c" / "Makefile").write_text("all:\n\t$(CC) main.c\n")
+    (REPO / "c" / "main.c").write_text("int main() {}\n// TODO\n")
+    (REPO / "README.md").write_text("# TODO\nTODO: more TODO\n")
+    (REPO / "binary").write_bytes(b"TODO\0")
+    (REPO / ".tem" / "notes").write_text("TODO\n")
+    os.environ["XDG_CACHE_HOME"] = str(OUTDIR / "cache")
+
+
+def teardown_module():
+    del os.environ["XDG_CACHE_HOME"]
+
+
+def _grep(pattern, repo=REPO, **kwargs):
+    return [
+        str(match) for match in grep.grep(pattern, [Repo(str(repo))], **kwargs)
+    ]
+
+
+def test_grep():
+    assert _grep("TODO") == [
+        "repo:README.md:1:# TODO",
+        "repo:README.md:2:TODO: more TODO",
+        "repo:c/main.c:2:// TODO",
+    ]
+    assert _grep(r"\$\(CC\)") == ["repo:c/Makefile:2:\t$(CC) main.c"]
+    assert _grep("todo") == []
+    assert len(_grep("todo", ignore_case=True)) == 3
+
+
+def test_search_bytes():
+    regex = re.compile(b"b", re.MULTILINE)
+    assert grep.search_bytes(regex, b"a\r\nb\r\n\nab") == [
+        (2, "b"),
+        (4, "ab"),
+    ]
+    assert grep.search_bytes(regex, b"\0b") == []
+
+
+def test_index():
+    assert _grep("TODO", use_index=True) == _grep("TODO")
+    assert os.path.isfile(grep.index_path(REPO))
+    index = grep.ContentIndex.load(REPO)
+    assert index.candidates("main") == [
+        str(REPO / "c" / "Makefile"),
+        str(REPO / "c" / "main.c"),
+    ]
+    # Changed files are indexed again
+    (REPO / "new.txt").write_text("int main\n")
+    assert _grep("int main", use_index=True) == [
+        "repo:new.txt:1:int main",
+        "repo:c/main.c:1:int main() {}",
+    ]
+    os.remove(REPO / "new.txt")
+    assert _grep("int main", use_index=True) == [
+        "repo:c/main.c:1:int main() {}"
+    ]
+    # Character sets that contain `]`
+    (REPO / "sets.txt").write_text("]ab\nqab\n")
+    try:
+        for pattern in (r"[\]xyzw]ab", r"[^]xyzw]ab"):
+            assert _grep(pattern)
+            assert _grep(pattern, use_index=True) == _grep(pattern)
+    finally:
+        os.remove(REPO / "sets.txt")
+
+
+def test_literal():
+    assert grep._literal(r"foo.*bar\.baz") == "bar.baz"
+    assert grep._literal(r"ab?cde{2}") == "cd"
+    assert grep._literal(r"[a-z]+_test") == "_test"
+    assert grep._literal("foo|bar") is None
+    assert grep._literal(r"[^a-c]xyz") == "xyz"
+    for pattern in (r"[\]xyzw]ab", r"[^]xyzw]ab", r"[]xyzw]ab"):
+        assert grep._literal(pattern) is None
+    assert grep._literal(r"\bword\s+other\n") == "other"
+    # Escapes that take arguments
+    for pattern in (r"\x41BC", r"\u0041BC", r"\101BC", r"\1BC", r"\N{x}"):
+        assert grep._literal(pattern) is None
+    assert _grep(r"int\x20main", use_index=True) == [
+        "repo:c/main.c:1:int main() {}"
+    ]
+
+
+def test_packed():
+    packed = OUTDIR / f"repo{pack.SUFFIX}"
+    pack.build(REPO, packed, ignore=lambda _, names: [".tem"])
+    name = Repo(str(packed)).name()
+    assert _grep("TODO", repo=packed) == [
+        f"{name}:README.md:1:# TODO",
+        f"{name}:README.md:2:TODO: more TODO",
+        f"{name}:c/main.c:2:// TODO",
+    ]
@@ -0,0 +1,91 @@
+import time
+
+from common import *  # isort: skip
+from tem import ignore
+from tem.fs import TemDir
+
+OUTDIR = OUTDIR / "ignore"
+
+
+class TestMatcher:
+    def test_match(self):
+        matcher = ignore.Matcher(
+            [
+                "# comment",
+                "*.log",
+                "!keep.log",
+                "build/",
+                "/top",
+                "doc/*.txt",
+                "a/**/z",
+                "x[0-9]",
+                "\\#hash",
+            ],
+            base="/base",
+        )
+        assert matcher.match("debug.log", is_dir=False)
+        assert matcher.match("sub/debug.log", is_dir=False)
+        assert not matcher.match("keep.log", is_dir=False)
+        assert matcher.match("build", is_dir=True)
+        assert not matcher.match("build", is_dir=False)
+        assert matcher.match("top", is_dir=False)
+        assert not matcher.match("sub/top", is_dir=False)
+        assert matcher.match("doc/a.txt", is_dir=False)
+        assert not matcher.match("doc/sub/a.txt", is_dir=False)
+        assert matcher.match("a/z", is_dir=False)
+        assert matcher.match("a/b/c/z", is_dir=False)
+        assert matcher.match("x1", is_dir=False)
+        assert not matcher.match("xa", is_dir=False)
+        assert matcher.match("#hash", is_dir=False)
+        assert not matcher.match("comment", is_dir=False)
+        # Paths outside the base directory are never matched
+        assert not matcher.match("/elsewhere/debug.log", is_dir=False)
+
+    def test_brackets(self):
+        # A `]` that comes first in a set is part of it, like in fnmatch
+        matcher = ignore.Matcher(["a[]b]", "c[!]]", "d[]"], base="/base")
+        assert matcher.match("a]", is_dir=False)
+        assert matcher.match("ab", is_dir=False)
+        assert not matcher.match("ac", is_dir=False)
+        assert matcher.match("cx", is_dir=False)
+        assert not matcher.match("c]", is_dir=False)
+        assert matcher.match("d[]", is_dir=False)
+        # Brackets that don't form a valid set are matched literally
+        matcher = ignore.Matcher(["[] # TODO", "[z-a]", "x["], base="/base")
+        assert matcher.match("[] # TODO", is_dir=False)
+        assert matcher.match("[z-a]", is_dir=False)
+        assert not matcher.match("z", is_dir=False)
+        assert matcher.match("x[", is_dir=False)
+
+    def test_is_ignored(self):
+        matcher = ignore.Matcher(["build/", "!build/keep"], base="/base")
+        assert not matcher.match("/base/build/file", is_dir=False)
+        assert matcher.is_ignored("/base/build/file", is_dir=False)
+        # A file can't be re-included if its parent directory is ignored
+        assert matcher.is_ignored("build/keep", is_dir=False)
+
+    def test_many_patterns(self):
+        patterns = [f"name{i}" for i in range(5000)]
+        patterns += [f"dir{i}/*.o" for i in range(5000)]
+        matcher = ignore.Matcher(patterns, base="/base")
+        assert matcher.match("sub/name4999", is_dir=False)
+        assert matcher.match("dir4999/file.o", is_dir=False)
+        assert not matcher.match("dir4999/file.c", is_dir=False)
+
+
+def test_load():
+    recreate_dir(OUTDIR)
+    TemDir.init(OUTDIR)
+    with open(OUTDIR / ".tem" / "ignore", "w") as f:
+        f.write("*.bak\n")
+    matcher = ignore.load(OUTDIR)
+    assert matcher.match("file.bak", is_dir=False)
+    # The compiled file is cached until it is modified
+    assert ignore.load(OUTDIR) is matcher
+    time.sleep(0.01)
+    with open(OUTDIR / ".tem" / "ignore", "w") as f:
+        f.write("*.tmp\n")
+    matcher = ignore.load(OUTDIR, exclude=["*.swp"])
+    assert not matcher.match("file.bak", is_dir=False)
+    assert matcher.match("file.tmp", is_dir=False)
+    assert matcher.match("file.swp", is_dir=False)
@@ -0,0 +1,96 @@
+import argparse
+import fcntl
+import json
+import stat
+import sys
+import time
+
+import tem.util
+from common import *
+from tem import config
+from tem.cli import common as cli
+from tem.cli import hook
+from tem.fs import TemDir
+from tem.jobs import DONE, PENDING, JobQueue
+
+OUTDIR = OUTDIR / "jobs"
+
+
+class TestJobQueue:
+    @classmethod
+    def setup_class(cls):
+        recreate_dir(OUTDIR)
+
+    def test_submit_and_drain(self):
+        queue = JobQueue(OUTDIR / "queue1")
+        job1 = queue.submit([sys.executable, "-c", "print('job1')"])
+        job2 = queue.submit([sys.executable, "-c", "exit(3)"])
+        assert [job.id for job in queue.jobs(PENDING)] == [job1.id, job2.id]
+        assert not queue.is_idle()
+
+        queue.drain(max_jobs=2)
+
+        assert queue.is_idle()
+        done = queue.jobs(DONE)
+        assert [job.returncode for job in done] == [0, 3]
+        assert queue.log(done[0]).read_text() == "job1\n"
+
+    def test_orphans_are_rescheduled(self):
+        queue = JobQueue(OUTDIR / "queue2")
+        job = queue.submit(["true"])
+        # Simulate a worker that died after claiming the job
+        queue._claim_pending()
+        assert queue.jobs()[0].state != PENDING
+
+        assert queue.wait(timeout=10)
+        assert queue.jobs(DONE)[0].id == job.id
+
+    def test_background_worker(self):
+        queue = JobQueue(OUTDIR / "queue3")
+        queue.submit(["true"])
+        queue.spawn_worker()
+        # queue.wait() would drain the queue itself, racing with the worker
+        deadline = time.monotonic() + 10
+        while not queue.is_idle() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert len(queue.jobs(DONE)) == 1
+        # Wait for the worker to let go of the queue, so that it doesn't
+        # write into the output directory after other tests recreate it
+        with open(queue.path / "lock", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+    def test_async_hooks(self, monkeypatch, capsys):
+        src = TemDir.init(OUTDIR / "hooks" / "src")
+        dest = TemDir.init(OUTDIR / "hooks" / "dest")
+        script = src / ".tem/hooks/record.put.post"
+        script.write_text(
+            '#!/bin/sh\necho "$TEM_DEST $SECRET" > "$TEM_DEST/out"\n'
+        )
+        script.chmod(0o755)
+        monkeypatch.setitem(os.environ, "SECRET", "hunter2")
+        monkeypatch.setattr(JobQueue, "spawn_worker", lambda *_, **__: None)
+        config.cfg["hooks.async"] = "true"
+        try:
+            cli.run_hooks(
+                "put.post", src, dest, environment={"TEM_DEST": str(dest)}
+            )
+        finally:
+            config.cfg["hooks.async"] = "false"
+
+        queue = cli.hook_queue(dest)
+        [job] = queue.jobs(PENDING)
+        path = queue.path / PENDING / f"{job.id}.json"
+        # Only the variables that tem sets for hooks are stored
+        assert "hunter2" not in path.read_text()
+        assert set(job.env) >= {"TEM_DEST", "PATH"}
+        assert stat.S_IMODE(path.stat().st_mode) == 0o600
+        assert not (dest / "out").exists()
+
+        with tem.util.chdir(dest):
+            hook.background_hooks(argparse.Namespace(status=False, wait=True))
+        assert (dest / "out").read_text() == f"{dest} hunter2\n"
+        status, returncode, name, log = capsys.readouterr().out.split()
+        assert (status, returncode, name) == ("done", "(0)", "record.put.post")
+        [job] = queue.jobs(DONE)
+        assert job.returncode == 0 and job.env is None
+        assert stat.S_IMODE(os.stat(log).st_mode) == 0o600
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from common import *  # isort: skip
+from tem import pack, put
+
+OUTDIR = OUTDIR / "pack"
+REPO = OUTDIR / "repo"
+PACK = OUTDIR / ("repo" + pack.SUFFIX)
+DEST = OUTDIR / "dest"
+
+
+def setup_module():
+    recreate_dir(REPO / "dir1" / "sub")
+    (REPO / "file1.txt").write_text("file1\n")
+    (REPO / "dir1" / "a").write_text("a\n")
+    (REPO / "dir1" / "sub" / "b").write_text("b\n")
+    (REPO / "dir1-x").write_text("x\n")
+    (REPO / "skipped.log").write_text("log\n")
+    pack.build(REPO, ignore=lambda d, names: [n for n in names if ".log" in n])
+
+
+def test_lookup():
+    packed = pack.load(PACK)
+    assert packed is pack.load(PACK)
+    assert packed.listdir("") == ["dir1", "dir1-x", "file1.txt"]
+    assert packed.listdir("dir1") == ["a", "sub"]
+    assert packed.isdir("dir1/sub")
+    assert not packed.isdir("file1.txt")
+    assert not packed.exists("skipped.log")
+    assert bytes(packed.read(packed.entry("dir1/a"))) == b"a\n"
+    assert [e.path for e in packed.walk("dir1")] == [
+        "dir1",
+        "dir1/a",
+        "dir1/sub",
+        "dir1/sub/b",
+    ]
+
+
+def test_locate():
+    packed, path = pack.locate(PACK / "dir1" / "sub")
+    assert packed.path == str(PACK)
+    assert path == "dir1/sub"
+    assert pack.locate(REPO / "dir1") is None
+
+
+def test_extract():
+    packed = pack.load(PACK)
+    packed.extract("dir1", DEST / "extracted")
+    assert (DEST / "extracted" / "sub" / "b").read_text() == "b\n"
+    mtime = os.stat(REPO / "dir1" / "a").st_mtime_ns
+    assert os.stat(DEST / "extracted" / "a").st_mtime_ns == mtime
+
+
+def test_update_from_pack():
+    template = PACK / "dir1"
+    report = put.update(template, DEST / "updated")
+    assert (len(report.added), len(report.unchanged)) == (2, 0)
+    report = put.update(template, DEST / "updated", checksum=True)
+    assert (len(report.added), len(report.unchanged)) == (0, 2)
+
+
+def test_tree_is_abstract():
+    with pytest.raises(TypeError):
+        pack.Tree()
+
+
+def test_rebuild():
+    assert pack.build(REPO, PACK)[1]  # .log files are not ignored this time
+    assert not pack.build(REPO, PACK)[1]
+    old = pack.load(PACK)
+    time.sleep(0.01)
+    (REPO / "file1.txt").write_text("changed\n")
+    assert pack.build(REPO, PACK)[1]
+    assert bytes(pack.load(PACK).read(pack.load(PACK).entry("file1.txt"))) == (
+        b"changed\n"
+    )
+    # The mapping of the replaced pack is released
+    assert old._mmap.closed
+
+
+def test_invalid_pack():
+    from tem import errors
+    from tem.repo import Repo
+
+    data = PACK.read_bytes()
+    for i, contents in enumerate([b"", b"TEMPACK", data[:100]]):
+        path = OUTDIR / f"invalid{i}{pack.SUFFIX}"
+        path.write_bytes(contents)
+        with pytest.raises(ValueError):
+            pack.Pack(path)
+        with pytest.raises(errors.RepoUnreadableError):
+            Repo(str(path)).has_template("file1.txt")
@@ -0,0 +1,88 @@
+import io
+import tarfile
+import time
+
+from common import *  # isort: skip
+from tem import put
+from tem.fs import TemDir
+
+OUTDIR = OUTDIR / "put"
+TEMPLATE = OUTDIR / "template"
+DEST = OUTDIR / "dest"
+
+
+def setup_module():
+    recreate_dir(TEMPLATE / "sub")
+    (TEMPLATE / "a").write_text("a\n")
+    (TEMPLATE / "sub" / "b").write_text("b\n")
+    os.environ["XDG_CACHE_HOME"] = str(OUTDIR / "cache")
+
+
+def teardown_module():
+    del os.environ["XDG_CACHE_HOME"]
+
+
+def counts(report):
+    return len(report.added), len(report.changed), len(report.unchanged)
+
+
+def test_update():
+    assert counts(put.update(TEMPLATE, DEST)) == (2, 0, 0)
+    assert (DEST / "sub" / "b").read_text() == "b\n"
+    assert counts(put.update(TEMPLATE, DEST)) == (0, 0, 2)
+    (DEST / "a").write_text("modified\n")
+    assert counts(put.update(TEMPLATE, DEST)) == (0, 1, 1)
+    assert (DEST / "a").read_text() == "a\n"
+    # The destination isn't a temdir, so it doesn't get a .tem directory
+    assert not os.path.exists(DEST / ".tem")
+
+
+def test_manifest_in_temdir():
+    dest = OUTDIR / "temdir_dest"
+    recreate_dir(dest)
+    TemDir.init(dest)
+    assert counts(put.update(TEMPLATE / "a", dest)) == (1, 0, 0)
+    assert os.path.isfile(dest / ".tem" / ".internal" / put.MANIFEST)
+    assert counts(put.update(TEMPLATE / "a", dest)) == (0, 0, 1)
+
+
+def test_update_checksum():
+    put.update(TEMPLATE, DEST, checksum=True)
+    # Same size and modification time, but different contents
+    stat = os.stat(DEST / "sub" / "b")
+    time.sleep(0.01)
+    (DEST / "sub" / "b").write_text("c\n")
+    os.utime(DEST / "sub" / "b", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert counts(put.update(TEMPLATE, DEST)) == (0, 0, 2)
+    assert counts(put.update(TEMPLATE, DEST, checksum=True)) == (0, 1, 1)
+    assert (DEST / "sub" / "b").read_text() == "b\n"
+    # A touched file with the same contents is not copied again
+    os.utime(DEST / "a")
+    assert counts(put.update(TEMPLATE, DEST, checksum=True)) == (0, 0, 2)
+
+
+def test_stream():
+    data = bytes(range(256)) * 1000
+    (TEMPLATE / "binary").write_bytes(data)
+    with open(OUTDIR / "streamed", "wb") as out:
+        put.stream(TEMPLATE / "binary", out)
+    assert (OUTDIR / "streamed").read_bytes() == data
+    # File objects without a file descriptor
+    out = io.BytesIO()
+    put.stream(TEMPLATE / "binary", out)
+    assert out.getvalue() == data
+
+    out = io.BytesIO()
+    put.stream(
+        TEMPLATE, out, ignore=lambda _, names: set(names) & {"binary"}
+    )
+    out.seek(0)
+    with tarfile.open(fileobj=out) as tar:
+        assert sorted(tar.getnames()) == [
+            "template",
+            "template/a",
+            "template/sub",
+            "template/sub/b",
+        ]
+        assert tar.extractfile("template/sub/b").read() == b"b\n"
+    os.remove(TEMPLATE / "binary")
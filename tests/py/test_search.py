@@ -0,0 +1,50 @@
+import time
+
+from common import *  # isort: skip
+from tem import search
+from tem.repo import Repo
+
+OUTDIR = OUTDIR / "search"
+REPO = OUTDIR / "repo"
+
+
+def setup_module():
+    recreate_dir(REPO / "c")
+    recreate_dir(REPO / "python" / ".tem")
+    for name in ("README.md", "c/Makefile", "python/setup.py", "Makefile"):
+        (REPO / name).touch()
+    os.environ["XDG_CACHE_HOME"] = str(OUTDIR / "cache")
+
+
+def teardown_module():
+    del os.environ["XDG_CACHE_HOME"]
+
+
+def test_ranking():
+    index = search.load(Repo(str(REPO)))
+    # Substring of the name, then of the path, then a subsequence
+    assert index.search("make") == ["Makefile", "c/Makefile"]
+    assert index.search("python/set")[0] == "python/setup.py"
+    assert index.search("rdme") == ["README.md"]
+    # Typos are tolerated
+    assert index.search("setup.yp") == ["python/setup.py"]
+    assert index.search("xyz") == []
+    assert "python/.tem" not in index.paths
+
+
+def test_incremental_refresh():
+    index = search.load(Repo(str(REPO)))
+    assert not index.refresh()
+    time.sleep(0.01)
+    (REPO / "c" / "hello.c").touch()
+    assert index.refresh()
+    assert index.search("hello") == ["c/hello.c"]
+    os.remove(REPO / "c" / "hello.c")
+
+
+def test_index_is_cached():
+    index = search.load(Repo(str(REPO)))
+    assert os.path.isfile(search.index_path(REPO))
+    cached = search.PathIndex.from_dict(REPO, index.to_dict())
+    assert not cached.refresh()
+    assert cached.search("rdme") == ["README.md"]
@@ -1,3 +1,4 @@
+import subprocess
 import tempfile
 
 import pytest
@@ -13,18 +14,52 @@ class TestShell:
     def clear_source_file(self):
         self.write_file = tempfile.NamedTemporaryFile(mode="a", suffix=".sh")
         self.path = self.write_file.name
-        self.read_file = open(self.path)
         os.environ["__TEM_SHELL_SOURCE"] = self.path
         yield
 
     def test_export(self):
         commands.export("TEST", "value")
+        commands.flush()
         assert self.read() == "export TEST=value"
 
     def test_command(self):
         commands.command("spaced command", "--option", "arg$")
+        commands.flush()
         assert self.read() == "'spaced command' --option 'arg$'"
 
+    def test_transaction(self):
+        with commands.transaction():
+            commands.export("TEST", "1")
+            commands.command("cmd")
+            commands.export("TEST", "2")
+            # Nothing is written before the transaction ends
+            commands.flush()
+            assert self.read() == ""
+        assert self.read() == "cmd\nexport TEST=2"
+
+        # Commands of an interrupted transaction are discarded
+        commands.export("TEST", "3")
+        with pytest.raises(RuntimeError):
+            with commands.transaction():
+                commands.command("cmd")
+                raise RuntimeError()
+        commands.flush()
+        assert self.read() == "cmd\nexport TEST=2\nexport TEST=3"
+
     def read(self):
         """Read the source file."""
-        return self.read_file.read().strip()
+        with open(self.path, encoding="utf-8") as file:
+            return file.read().strip()
+
+    @pytest.mark.skipif(not shutil.which("bash"), reason="requires bash")
+    def test_update_path(self):
+        commands.update_path(["/old 1", "/old2"], ["/new"])
+        commands.flush()
+        p = subprocess.run(
+            ["bash", "-c", f'. "{self.path}"; echo "$PATH"'],
+            env={"PATH": "/old 1:/old2:/usr/bin:/bin"},
+            stdout=subprocess.PIPE,
+            encoding="utf-8",
+            check=True,
+        )
+        assert p.stdout == "/new:/usr/bin:/bin\n"
@@ -0,0 +1,71 @@
+from common import *  # isort: skip
+from tem import store
+
+OUTDIR = OUTDIR / "store"
+SRC = OUTDIR / "src"
+REPOS = [OUTDIR / f"repo{i}" for i in range(3)]
+
+
+def setup_module():
+    recreate_dir(SRC / "dir")
+    (SRC / "asset.bin").write_bytes(b"\0" * 4096)
+    (SRC / "dir" / "a").write_text("a\n")
+    (SRC / "dir" / "b").write_text("a\n")  # Same contents as a
+
+
+def test_add_links_each_object_once():
+    s = store.Store(OUTDIR / "store", ["hardlink"])
+    for repo in REPOS:
+        s.add(SRC / "asset.bin", repo / "asset.bin")
+        s.add(SRC / "dir", repo / "dir")
+    objects = list(s.objects())
+    assert len(objects) == 2
+    inodes = {os.stat(repo / "asset.bin").st_ino for repo in REPOS}
+    assert len(inodes) == 1
+    assert (REPOS[0] / "dir" / "b").read_text() == "a\n"
+    # Each object is linked from all files that have its contents
+    assert sorted(o.stat().st_nlink for o in objects) == [4, 7]
+
+
+def test_permissions_are_part_of_the_object():
+    s = store.Store(OUTDIR / "store", ["hardlink"])
+    script = SRC / "script"
+    script.write_text("a\n")
+    os.chmod(script, 0o755)
+    s.add(script, REPOS[0] / "script")
+    assert os.stat(REPOS[0] / "script").st_mode & 0o100
+    assert not os.stat(REPOS[0] / "dir" / "a").st_mode & 0o100
+
+
+def test_gc():
+    s = store.Store(OUTDIR / "store", ["hardlink"])
+    assert s.gc() == (0, 0)
+    for repo in REPOS:
+        os.remove(repo / "asset.bin")
+    assert s.gc() == (1, 4096)
+    assert len(list(s.objects())) == 2
+
+
+def test_modified_object_is_replaced():
+    s = store.Store(OUTDIR / "store", ["hardlink"])
+    hello = SRC / "hello"
+    hello.write_text("hello")
+    s.add(hello, REPOS[0] / "hello")
+    assert not os.stat(REPOS[0] / "hello").st_mode & 0o222
+    # Modify the object in place, through a repository
+    os.chmod(REPOS[0] / "hello", 0o644)
+    with open(REPOS[0] / "hello", "r+", encoding="utf-8") as f:
+        f.write("HACKD")
+    s.add(hello, REPOS[1] / "hello")
+    assert (REPOS[1] / "hello").read_text() == "hello"
+    assert (REPOS[0] / "hello").read_text() == "HACKD"
+
+
+def test_copies_are_writable():
+    from tem import put, util
+
+    put_dir = OUTDIR / "put"
+    util.copy(REPOS[1] / "hello", put_dir / "copied")
+    put.update(REPOS[1] / "hello", put_dir / "updated")
+    for name in ("copied", "updated"):
+        assert os.stat(put_dir / name).st_mode & 0o200
@@ -71,6 +71,24 @@ class TestVar:
         v = var.Variable(["0", 1], default="0", from_env="v")
         assert v.value == 1
 
+    def test_from_env_cache(self):
+        os.environ["v"] = "yes"
+        # The first allowed value that `v` can be converted to wins
+        assert var.Variable([True, "yes"], True, from_env="v").value is True
+        v = var.Variable(["yes", 2], default=2, from_env="v")
+        assert v.value == "yes"
+        os.environ["v"] = "02"
+        assert v.value == 2
+        assert v.value == 2  # Cached
+        # Values that are not allowed are not cached
+        os.environ["v"] = ""
+        with pytest.raises(errors.TemVariableValueError):
+            v.value
+        with pytest.raises(errors.TemVariableValueError):
+            v.value
+        del os.environ["v"]
+        assert v.value == 2
+
     def test_from_env_errors(self):
         os.environ["v"] = "a"
         # Value doesn't match type
@@ -148,5 +166,123 @@ class TestVar:
         with pytest.raises(TypeError):
             var.load(self.temdir.parent / "nonexistent_temdir")
 
+    def test_load_lazy(self):
+        from tem.env import Environment
+
+        subdir = TemDir.init(TEMDIR / "sub")
+        (subdir / ".tem/vars.py").write_text(
+            "from tem.var import Variable\n"
+            "str2 = Variable(str, default='sub')\n"
+            "raise RuntimeError('must not be imported')\n"
+        )
+        assert var._variable_names(subdir) == {
+            "Variable",
+            "str2",
+        }
+        env = Environment(subdir)
+
+        v = var.load(env, lazy=True)
+        # Only the root temdir defines `str1`, so `sub` is never imported
+        assert v.str1 == "val2"
+        with pytest.raises(RuntimeError):
+            v.str2
+        with pytest.raises(KeyError):
+            v["nonexistent"]
+        assert "nonexistent" not in v.__dict__
+
+        # Attributes that aren't variables don't import dynamic vars.py files
+        (subdir / ".tem/vars.py").write_text(
+            "globals()['x'] = 1\n"
+            "raise RuntimeError('must not be imported')\n"
+        )
+        v = var.load(env, lazy=True)
+        assert v.__dict__.sources == {}
+        assert isinstance(v, var.LazyVariableContainer)
+        with pytest.raises(AttributeError):
+            v.__nonexistent__
+        with pytest.raises(AttributeError):
+            v.__nonexistent__ = 1
+        with pytest.raises(RuntimeError):
+            v.str1
+
+        # Dynamically defined variables are found as well
+        (subdir / ".tem/vars.py").write_text(
+            "from tem.var import Variable\n"
+            "globals()['str2'] = Variable(str, default='sub')\n"
+        )
+        assert var._variable_names(subdir) is None
+        v = var.load(env, lazy=True)
+        assert v.str2 == "sub"
+        assert set(v) == {"str1", "str2", "bool1", "bool2"}
+
+        v.str1 = "val1"
+        var.save(v, env)
+        assert var.load(self.temdir).str1 == "val1"
+
+    def test_batch_loader(self):
+        from tem.env import EnvironmentBatch
+
+        root = TemDir.init(OUTDIR / "var" / "batch")
+        (root / ".tem/vars.py").write_text(
+            "from tem.var import Variable\n"
+            "level = Variable(int, default=1)\n"
+            "mode = Variable(['debug', 'release'], default='debug')\n"
+        )
+        sub = TemDir.init(root / "sub")
+        (sub / ".tem/vars.py").write_text(
+            "from tem.var import Variable\n"
+            "level = Variable(int, default=2)\n"
+        )
+        batch = EnvironmentBatch()
+        loader = var.BatchLoader()
+        v_root = loader.load(batch.environment(root))
+        v_sub = loader.load(batch.environment(sub))
+        assert (v_root.level, v_root.mode) == (1, "debug")
+        assert (v_sub.level, v_sub.mode) == (2, "debug")
+        # Containers don't share variables
+        v_sub.mode = "release"
+        assert loader.load(batch.environment(root)).mode == "debug"
+        assert loader.load(sub).level == 2
+
+    def test_index_without_internal_dir(self):
+        dot_tem = TEMDIR / "no_internal" / ".tem"
+        recreate_dir(dot_tem)
+        (dot_tem / "vars.py").write_text("x = 1\n")
+        assert var._vars_index(dot_tem / "vars.py")["names"] == ["x"]
+        assert (dot_tem / ".internal" / "vars_index.json").is_file()
+
+    def test_static_definitions(self):
+        temdir = TemDir.init(TEMDIR / "static")
+        (temdir / ".tem/vars.py").write_text(
+            "import nonexistent_module\n"
+            "from typing import Any\n"
+            "from tem import var\n"
+            "from tem.var import Variable as V\n"
+            "a = V(['x', 'y', 1], 1, from_env='A')\n"
+            "a.doc = 'A variable'\n"
+            "a.doc['x'] = 'The x value'\n"
+            "b = var.Variant(True)\n"
+            "c = V(Any)\n"
+            "d = V(bool)\n"
+            "e = 1\n"
+        )
+        # The file can't be imported, so the definitions must be static
+        v = var.load(temdir)
+        assert list(v) == ["a", "b", "c", "d"]
+        assert v.a == 1 and v["a"].var_type == ["x", "y", 1]
+        assert v["a"].from_env == "A"
+        assert v["a"].doc.description == "A variable"
+        assert v["a"].doc["x"] == "The x value"
+        assert v.b is True
+        assert v["c"].var_type == Any
+        assert isinstance(v["d"], var.Variant)
+
+        # Anything that isn't declarative is executed
+        (temdir / ".tem/vars.py").write_text(
+            "from tem.var import Variable\n"
+            "a = Variable(int, default=len('abc'))\n"
+        )
+        assert var.load(temdir).a == 3
+
     def test_load_from_env(self):
         """TODO"""
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+
+import pytest
+
+from common import *  # isort: skip
+from tem import watch
+
+OUTDIR = OUTDIR / "watch"
+REPO = OUTDIR / "repo"
+STATE_DIR = OUTDIR / "state"
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux-only"
+)
+
+
+def setup_module():
+    recreate_dir(REPO / "c")
+    recreate_dir(STATE_DIR)
+    (REPO / "README.md").touch()
+    watch.spawn([REPO, OUTDIR / "missing"], directory=STATE_DIR)
+    deadline = time.monotonic() + 10
+    while watch.state(STATE_DIR) is None:
+        assert time.monotonic() < deadline, "the watcher didn't start"
+        time.sleep(0.01)
+
+
+def teardown_module():
+    watch.stop(STATE_DIR)
+
+
+def _wait_for_change(path, old_token):
+    deadline = time.monotonic() + 5
+    while watch.token(path, STATE_DIR) == old_token:
+        assert time.monotonic() < deadline, "the change was not noticed"
+        time.sleep(0.01)
+    return watch.token(path, STATE_DIR)
+
+
+def test_token():
+    token = watch.token(REPO / "c", STATE_DIR)
+    assert token is not None
+    assert watch.token(REPO / "c", STATE_DIR) == token
+    assert watch.token(OUTDIR, STATE_DIR) is None
+    # Roots that don't exist are not trusted
+    assert watch.token(OUTDIR / "missing", STATE_DIR) is None
+
+
+def test_changes():
+    token = watch.token(REPO, STATE_DIR)
+    (REPO / "README.md").write_text("changed")
+    token = _wait_for_change(REPO, token)
+    # New directories are watched by the time the change is noticed
+    (REPO / "new").mkdir()
+    token = _wait_for_change(REPO, token)
+    (REPO / "new" / "file").touch()
+    _wait_for_change(REPO, token)
+
+
+def test_overflow():
+    root = OUTDIR / "overflow"
+    recreate_dir(root / "a")
+    watcher = watch.Watcher([root], directory=OUTDIR / "overflow-state")
+    watcher._start()
+    try:
+        # Directories created while events are dropped are watched after
+        # the overflow is reported
+        (root / "a" / "new").mkdir()
+        overflow = watch._EVENT.pack(-1, watch._IN_Q_OVERFLOW, 0, 0)
+        watcher._handle(overflow)
+        assert str(root / "a" / "new") in watcher._watches.values()
+        assert watcher.roots[str(root)] == 1
+    finally:
+        os.close(watcher._fd)
+
+
+def test_stop():
+    assert watch.is_alive(STATE_DIR)
+    assert watch.stop(STATE_DIR)
+    assert not watch.is_alive(STATE_DIR)
+    assert watch.token(REPO, STATE_DIR) is None
+    assert not watch.stop(STATE_DIR)